@@ -1,15 +1,25 @@
 import streamlit as st
 st.set_page_config(layout="wide", page_title="🐝 HiveSight")  # Needs to be called immediately
-import stripe
-from supabase import create_client, Client
+import importlib
+
 from st_paywall import add_auth
 from st_paywall.google_auth import get_logged_in_user_email, show_login_button
 
-from products.survey.survey import render as render_survey
-from products.council.main import render as render_council
 from utils.code_utils import gather_code
 
 
+# Product modules pull in the LLM SDKs, pandas, plotly and the perspectives
+# data, so each one is only imported once it is selected
+PRODUCT_MODULES = {
+    "HiveSight Survey": "products.survey.survey",
+    "HiveSight Council": "products.council.main",
+}
+
+
+def render_product(product):
+    importlib.import_module(PRODUCT_MODULES[product]).render()
+
+
 def init_session_state():
     if "current_product" not in st.session_state:
         st.session_state.current_product = "Home"
@@ -21,9 +31,6 @@ def init_session_state():
 def render_home():
     st.title("🐝 HiveSight")
 
-    supabase: Client = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_SERVICE_ROLE_SECRET"])
-    stripe.api_key = st.secrets["stripe_api_key_test"]
-    
     get_logged_in_user_email()
     
     if "email" not in st.session_state.keys():
@@ -68,22 +75,22 @@ def render_about():
 
 def render_developer_tools():
     st.sidebar.title("Developer Tools")
-    if st.sidebar.button("Gather All Code"):
-        all_code = gather_code()
-        st.sidebar.download_button(
-            label="Download All Code",
-            data=all_code,
-            file_name="hivesight_all_code.py",
-            mime="text/plain",
-        )
+    # The bundle is only gathered when downloaded or shown
+    st.sidebar.download_button(
+        label="Download All Code",
+        data=gather_code,
+        file_name="hivesight_all_code.py",
+        mime="text/plain",
+        on_click="ignore",
+    )
 
-    with st.sidebar.expander("View All Code"):
-        st.code(gather_code(), language="python")
+    if st.sidebar.toggle("View All Code"):
+        st.sidebar.code(gather_code(), language="python")
 
 
 def render_sidebar():
     st.sidebar.title("Navigation")
-    products = ["Home", "HiveSight Survey", "HiveSight Council"]
+    products = ["Home", *PRODUCT_MODULES]
     selected_product = st.sidebar.radio("Choose a product:", products)
     if selected_product != st.session_state.current_product:
         st.session_state.current_product = selected_product
@@ -99,13 +106,8 @@ def main():
     if st.session_state.current_product == "Home":
         render_home()
         render_sidebar()
-    elif st.session_state.current_product == "HiveSight Survey":
-        render_survey()
-        if st.sidebar.button("Back to Home"):
-            st.session_state.current_product = "Home"
-            st.rerun()
-    elif st.session_state.current_product == "HiveSight Council":
-        render_council()
+    elif st.session_state.current_product in PRODUCT_MODULES:
+        render_product(st.session_state.current_product)
         if st.sidebar.button("Back to Home"):
             st.session_state.current_product = "Home"
             st.rerun()
@@ -0,0 +1,226 @@
+"""Times each stage of the survey hot path at increasing numbers of personas
+
+    python -m benchmarks.bench_survey --sizes 10 1000 100000 1000000 \
+        --out bench_results.json --baseline benchmarks/baseline.json
+
+LLM calls go to the in-process mock backend with zero latency, so the
+numbers measure our own code. Results are written as JSON; with --baseline,
+any stage slower than the baseline by more than --threshold is reported as
+a regression and the exit code is 1.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from products.survey.aggregation import LikertAggregates
+from products.survey.analysis import analyze_responses, create_pivot_table
+from products.survey.data_handling import (
+    load_perspectives_data,
+    select_diverse_personas,
+)
+from products.survey.prompts import compile_prompt, create_prompt
+from products.survey.simulation import batch_simulate_responses
+from products.survey.visualization import create_enhanced_visualizations
+from utils.backend_utils import BackendPool
+from utils.mock_llm import MockBackend, MockLLM
+from utils.openai_utils import estimate_input_tokens, get_encoding
+
+
+DEFAULT_SIZES = [10, 1_000, 100_000, 1_000_000]
+STATEMENT = "The government should invest more in public transit."
+MODEL_TYPE = "GPT-4o-mini"
+
+
+def time_stage(func, repeat):
+    """Best of repeat runs, in seconds, and the last return value"""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def make_personas(perspectives, n, seed=0):
+    # Sampled with replacement so that sizes beyond the dataset are possible
+    return perspectives.sample(
+        n=n, weights="weight", replace=True, random_state=seed
+    ).to_dict("records")
+
+
+def load_uncached():
+    load_perspectives_data.cache_clear()
+    return load_perspectives_data()
+
+
+def run_benchmarks(sizes, repeat):
+    results = {}
+
+    def record(stage, size, seconds):
+        results.setdefault(stage, {})[str(size)] = seconds
+        if seconds is not None:
+            print(f"{stage:46s} {size:>10,}  {seconds:10.4f} s", flush=True)
+
+    seconds, perspectives = time_stage(load_uncached, repeat)
+    record("load_perspectives_data", len(perspectives), seconds)
+
+    backend_pool = BackendPool([MockBackend("bench", MockLLM(latency_median=0))])
+
+    for size in sizes:
+        # Large sizes are slow enough that one run is representative
+        n_repeat = repeat if size <= 100_000 else 1
+
+        try:
+            seconds, _ = time_stage(
+                lambda: select_diverse_personas(size, (0, 100), (0, 1e12)),
+                n_repeat,
+            )
+        except ValueError as e:
+            # e.g. pandas refusing weighted sampling without replacement
+            print(f"select_diverse_personas failed at {size:,}: {e}")
+            seconds = None
+        record("select_diverse_personas", size, seconds)
+
+        personas = make_personas(perspectives, size)
+        seconds, prompts = time_stage(
+            lambda: [create_prompt(p, STATEMENT, "likert") for p in personas],
+            n_repeat,
+        )
+        record("create_prompt", size, seconds)
+
+        persona_df = pd.DataFrame(personas)
+        template = compile_prompt("likert", STATEMENT)
+        seconds, _ = time_stage(lambda: template.render_many(persona_df), n_repeat)
+        record("PromptTemplate.render_many", size, seconds)
+
+        seconds, _ = time_stage(
+            lambda: estimate_input_tokens(prompts, MODEL_TYPE), n_repeat
+        )
+        record("estimate_input_tokens", size, seconds)
+
+        seconds, _ = time_stage(
+            lambda: template.count_tokens(persona_df, get_encoding(MODEL_TYPE)),
+            n_repeat,
+        )
+        record("PromptTemplate.count_tokens", size, seconds)
+
+        seconds, responses = time_stage(
+            lambda: batch_simulate_responses(
+                STATEMENT,
+                None,
+                size,
+                MODEL_TYPE,
+                personas,
+                prompts,
+                "likert",
+                backend_pool=backend_pool,
+            ),
+            1,  # the mock answers are deterministic, so repeats would be identical
+        )
+        record("batch_simulate_responses", size, seconds)
+
+        df = pd.DataFrame(responses)
+        seconds, response_counts = time_stage(
+            lambda: analyze_responses(df), n_repeat
+        )
+        record("analyze_responses", size, seconds)
+
+        seconds, aggregates = time_stage(
+            lambda: LikertAggregates.from_responses(df), n_repeat
+        )
+        record("LikertAggregates.from_responses", size, seconds)
+
+        seconds, _ = time_stage(
+            lambda: [aggregates.pivot(d) for d in ["age", "income", "state"]]
+            + [aggregates.pivot("age", "income")],
+            n_repeat,
+        )
+        record("LikertAggregates.pivot[all]", size, seconds)
+
+        for groupby_var in ["age", "income"]:
+            seconds, pivot = time_stage(
+                lambda: create_pivot_table(df, groupby_var), n_repeat
+            )
+            record(f"create_pivot_table[{groupby_var}]", size, seconds)
+
+            seconds, _ = time_stage(
+                lambda: create_enhanced_visualizations(
+                    response_counts, pivot, groupby_var
+                ),
+                n_repeat,
+            )
+            record(f"create_enhanced_visualizations[{groupby_var}]", size, seconds)
+
+    return results
+
+
+def get_metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for stage, timings in results.items():
+        for size, seconds in timings.items():
+            base = baseline.get("results", {}).get(stage, {}).get(size)
+            if base and seconds is not None and seconds > base * threshold:
+                regressions.append((stage, size, base, seconds))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Flag stages slower than threshold x baseline",
+    )
+    args = parser.parse_args()
+
+    output = {
+        "metadata": get_metadata(),
+        "results": run_benchmarks(args.sizes, args.repeat),
+    }
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(output["results"], baseline, args.threshold)
+        for stage, size, base, seconds in regressions:
+            print(
+                f"REGRESSION {stage} at {int(size):,}: "
+                f"{base:.4f} s -> {seconds:.4f} s ({seconds / base:.2f}x)"
+            )
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold}x baseline")
@@ -32,9 +32,63 @@ MODEL_COST_MAP = {
 }
 
 
+# Survey batches send a duplicate of any call slower than this latency
+# percentile of the batch so far, for at most this fraction of the batch
+SURVEY_HEDGE_PERCENTILE = 95
+SURVEY_MAX_HEDGE_FRACTION = 0.05
+
+# Optional weighted backend pools per model option in the survey UI. Each
+# request goes to the backend with the most rate-limit headroom, and the
+# answering backend is recorded with every response. Keys are read from the
+# environment variable named by "api_key_env". Example:
+#     "GPT-4o-mini": [
+#         {"provider": "openai", "name": "openai-main", "model_type": "GPT-4o-mini",
+#          "rpm": 5000, "tpm": 2_000_000},
+#         {"provider": "openai", "name": "openai-second", "model_type": "GPT-4o-mini",
+#          "api_key_env": "OPENAI_API_KEY_2", "rpm": 5000, "tpm": 2_000_000},
+#         {"provider": "anthropic", "name": "anthropic", "weight": 0.5, "rpm": 1000},
+#     ]
+SURVEY_BACKEND_POOLS = {}
+
+# Surveys can be split into shards of SURVEY_SHARD_SIZE personas, run by
+# SURVEY_WORKERS worker processes that each get an equal share of the
+# backends' rate limits. 1 runs every survey in the calling process
+SURVEY_WORKERS = int(os.getenv("SURVEY_WORKERS", "1"))
+SURVEY_SHARD_SIZE = 5000
+# Without a backend pool, the requests a survey keeps in flight, split
+# between its workers when it runs distributed
+SURVEY_MAX_CONCURRENCY = 1000
+
+# Question types offered in the survey UI, and the output token budget of
+# each answer (1 token fits any answer number below 1000)
+SURVEY_QUESTION_TYPES = {
+    "Likert scale": "likert",
+    "Multiple choice": "multiple_choice",
+    "Open-ended": "open_ended",
+}
+SURVEY_MAX_TOKENS = {
+    "likert": 1,
+    "multiple_choice": 1,
+    "open_ended": 80,
+}
+
+# Open-ended answers are grouped into themes by k-means over their embeddings,
+# requested EMBEDDING_BATCH_SIZE answers per call
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_COST_PER_MILLION = 0.02
+EMBEDDING_BATCH_SIZE = 1024
+MAX_THEMES = 8
+
 AGE_BINS = [0, 18, 25, 35, 45, 55, 65, np.inf]
 INCOME_BINS = [0, 30000, 60000, 90000, 120000, np.inf]
 
+STATES = (
+    "AK", "AL", "AR", "AZ", "CA", "CO", "CT", "DC", "DE", "FL", "GA", "HI", "IA",
+    "ID", "IL", "IN", "KS", "KY", "LA", "MA", "MD", "ME", "MI", "MN", "MO", "MS",
+    "MT", "NC", "ND", "NE", "NH", "NJ", "NM", "NV", "NY", "OH", "OK", "OR", "PA",
+    "RI", "SC", "SD", "TN", "TX", "UT", "VA", "VT", "WA", "WI", "WV", "WY",
+)
+
 LIKERT_LABELS = [
     "Strongly Disagree",
     "Disagree",
@@ -51,8 +105,9 @@ LIKERT_COLORS = {
     "Strongly Agree": "#B8860B",  # Dark goldenrod
 }
 
-# Council-specific configurations
-ADVISOR_MODEL_TYPE = "GPT-4o-mini"
+# Council-specific configurations. Advisors and the summarizer both call
+# ANTHROPIC_MODEL, so their tokens are priced at its (Sonnet) rates
+ADVISOR_MODEL_TYPE = "Sonnet"
 SUMMARIZER_MODEL_TYPE = "Sonnet"
 
 DEFAULT_PERSONAS = {
@@ -96,23 +151,45 @@ DEFAULT_PERSONAS = {
 
 ANTHROPIC_MODEL = "claude-3-5-sonnet-20240620"
 SUMMARY_MAX_TOKENS = 1000
+# Rough size of an advisor's digest (summary, takeaways and confidence),
+# which is what the summarizer reads instead of the full advice
+COUNCIL_DIGEST_TOKENS = 150
+COUNCIL_DEBATE_MAX_ROUNDS = 5
+# Custom advisors and past sessions are kept in SQLite locally and in
+# Supabase in production (COUNCIL_STORE_BACKEND=supabase)
+COUNCIL_STORE_BACKEND = os.getenv("COUNCIL_STORE_BACKEND", "sqlite")
+COUNCIL_DB_PATH = os.getenv("COUNCIL_DB_PATH", "council.db")
+COUNCIL_HISTORY_PAGE_SIZE = 10
+# Advice is reused for questions whose embeddings are at least this similar
+COUNCIL_CACHE_SIMILARITY_THRESHOLD = 0.9
+COUNCIL_CACHE_MAX_ENTRIES = 200  # per user and advisor
+COUNCIL_CACHE_MAX_SCOPES = 1000
+# A debate stops once the advisors' consensus changes less than this between rounds
+COUNCIL_CONSENSUS_STABLE_DELTA = 0.02
 
 COUNCIL_ADVISOR_SYSTEM_PROMPT_TEMPLATE = """
 You are the {persona} of an organization. {description}
 Your areas of expertise are: {expertise}.
 Provide your perspective on the given question, considering your role and expertise.
-A the end of your response, include:
-1. A brief 'Summary' section
-2. A 'Key Takeaways' section with 3-5 bullet points
-3. A 'Confidence' rating from 1-10 on how confident you are in your advice, given your expertise
+Record it with the record_advice tool, including a summary of at most two sentences,
+3-5 short key takeaways and a confidence rating from 1-10 on how confident you are in your advice, given your expertise.
 """
 
 COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE = (
     "Please provide your perspective on the following question: {question}"
 )
 
+COUNCIL_DEBATE_USER_PROMPT_TEMPLATE = """
+This is round {round} of a debate among the executives on the following question: {question}
+
+The executives' latest positions:
+{transcript}
+
+Respond to the points you disagree with, and revise your perspective where the others have persuaded you.
+"""
+
 COUNCIL_SUMMARY_USER_PROMPT_TEMPLATE = """
-    Analyze the following responses from different executives to this question:
+    Analyze the following digests of responses from different executives to this question:
     "{question}"
 
     Responses:
@@ -125,15 +202,70 @@ COUNCIL_SUMMARY_USER_PROMPT_TEMPLATE = """
     4. Sentiment analysis for each executive's response (positive, neutral, or negative)
     5. Top 5 key takeaways from all responses combined
 
-    Format your response as follows:
-    SUMMARY: [Your summary here]
-    CONSENSUS_LEVEL: [Number between 1-10]
-    SENTIMENTS:
-    [Executive1]: [Sentiment]
-    [Executive2]: [Sentiment]
-    ...
-    KEY_TAKEAWAYS:
-    - [Takeaway 1]
-    - [Takeaway 2]
-    ...
+    Record your analysis with the record_summary tool.
 """
+
+# Advisors and the summarizer answer through a forced tool call, so their
+# output arrives as JSON matching these schemas instead of formatted prose
+COUNCIL_ADVISOR_TOOL = {
+    "name": "record_advice",
+    "description": "Record your advice on the question.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "advice": {
+                "type": "string",
+                "description": "Your full perspective on the question, in Markdown.",
+            },
+            "summary": {
+                "type": "string",
+                "description": "A summary of your advice in at most two sentences.",
+            },
+            "key_takeaways": {
+                "type": "array",
+                "items": {"type": "string"},
+                "minItems": 1,
+                "maxItems": 5,
+            },
+            "confidence": {
+                "type": "integer",
+                "minimum": 1,
+                "maximum": 10,
+                "description": "How confident you are in your advice, given your expertise.",
+            },
+        },
+        "required": ["advice", "summary", "key_takeaways", "confidence"],
+    },
+}
+
+COUNCIL_SUMMARY_TOOL = {
+    "name": "record_summary",
+    "description": "Record your analysis of the executives' responses.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "summary": {
+                "type": "string",
+                "description": "A concise summary of the key points, common themes and disagreements.",
+            },
+            "consensus_level": {"type": "integer", "minimum": 1, "maximum": 10},
+            "sentiments": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "advisor": {"type": "string"},
+                        "sentiment": {"enum": ["positive", "neutral", "negative"]},
+                    },
+                    "required": ["advisor", "sentiment"],
+                },
+            },
+            "key_takeaways": {
+                "type": "array",
+                "items": {"type": "string"},
+                "maxItems": 5,
+            },
+        },
+        "required": ["summary", "consensus_level", "sentiments", "key_takeaways"],
+    },
+}
@@ -0,0 +1,16 @@
+"""HiveSight without the UI: surveys of simulated personas from Python or
+the command line (python -m hivesight survey --help)
+
+Nothing here imports Streamlit; the app is a client of the same functions.
+"""
+from hivesight.distributed import run_plan_distributed
+from hivesight.survey import SurveyPlan, SurveyResult, plan_survey, run_plan, run_survey
+
+__all__ = [
+    "SurveyPlan",
+    "SurveyResult",
+    "plan_survey",
+    "run_plan",
+    "run_plan_distributed",
+    "run_survey",
+]
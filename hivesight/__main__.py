@@ -0,0 +1,152 @@
+"""Runs a HiveSight survey from the command line
+
+    python -m hivesight survey --statement "Cities should ban cars downtown." \
+        --n 10000 --model GPT-4o-mini --out results.parquet
+
+Prints the cost estimate, with what each of the --attributes adds to it,
+runs the survey and prints the overall shares of the answers (or the themes
+of open-ended answers). With --workers, the personas are split into shards
+run by that many worker processes. With --out, responses are written to
+.parquet or .csv.gz, with the run's settings as metadata.
+"""
+import argparse
+import sys
+
+from config import MODEL_MAP, SURVEY_QUESTION_TYPES, SURVEY_SHARD_SIZE, SURVEY_WORKERS
+from hivesight.distributed import run_plan_distributed
+from hivesight.survey import (
+    DEFAULT_AGE_RANGE,
+    DEFAULT_INCOME_RANGE,
+    answer_column,
+    plan_survey,
+    run_plan,
+)
+from products.survey.aggregation import LikertAggregates
+from products.survey.data_handling import persona_attributes
+from utils.export_utils import write_csv_gz, write_parquet
+
+
+def print_progress(fraction):
+    print(f"\r{fraction:.0%}", end="", file=sys.stderr, flush=True)
+
+
+def print_summary(result):
+    print(f"Responses:   {len(result.responses):,}")
+    columns = answer_column(result.metadata["question_type"], result.metadata["choices"])
+    if columns is None:
+        if result.themes is not None:
+            print(result.themes[["theme", "answers", "share"]].to_string(index=False))
+        return
+    aggregates = result.aggregates or LikertAggregates.from_responses(
+        result.responses, [], *columns
+    )
+    shares = aggregates.response_counts()
+    for label, share in zip(shares["likert_label"], shares["percentage"]):
+        print(f"{share:7.1%}  {label}")
+
+
+def write_results(result, path):
+    if path.endswith(".parquet"):
+        write = write_parquet
+    elif path.endswith(".csv.gz"):
+        write = write_csv_gz
+    else:
+        raise SystemExit("--out must end in .parquet or .csv.gz")
+    with open(path, "wb") as f:
+        write(result.responses, f, result.metadata)
+
+
+def survey(args):
+    if args.type == "multiple_choice" and len(args.choice or []) < 2:
+        raise SystemExit("Multiple choice questions need at least two --choice")
+    unknown = [a for a in args.attributes if a not in persona_attributes()]
+    if unknown:
+        raise SystemExit(
+            f"Unknown --attributes {', '.join(unknown)}; the perspectives table has "
+            f"{', '.join(persona_attributes()) or 'none'}"
+        )
+    plan = plan_survey(
+        args.statement,
+        args.n,
+        args.model,
+        args.type,
+        args.choice if args.type == "multiple_choice" else None,
+        (args.age_min, args.age_max),
+        (args.income_min, args.income_max),
+        args.seed,
+        args.attributes,
+        args.max_prompt_tokens,
+    )
+    print(f"Personas:    {len(plan.prompts):,} (seed {plan.sampling_seed})")
+    for row in plan.attribute_costs.itertuples():
+        print(
+            f"  +{row.attribute:<17} {row.tokens_per_prompt:4.1f} tokens per prompt, "
+            f"${row.cost_in_usd:.4f}"
+        )
+    skipped = [a for a in args.attributes if a not in plan.attributes]
+    if skipped:
+        print(f"Over the prompt token budget: {', '.join(skipped)}")
+    print(f"Tokens:      {plan.input_tokens:,} in, at most {plan.output_tokens:,} out")
+    print(f"Estimate:    ${plan.cost_in_usd:.4f} at most")
+    if args.estimate_only:
+        return
+
+    if args.workers > 1:
+        result = run_plan_distributed(
+            plan, args.workers, args.shard_size, progress_callback=print_progress
+        )
+    else:
+        result = run_plan(plan, progress_callback=print_progress)
+    print(file=sys.stderr)
+    if args.out:
+        write_results(result, args.out)
+    print_summary(result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="hivesight", description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(required=True)
+
+    survey_parser = subparsers.add_parser("survey", help="simulate a survey")
+    survey_parser.set_defaults(command=survey)
+    survey_parser.add_argument("--statement", required=True)
+    survey_parser.add_argument("--n", type=int, default=10, help="number of responses")
+    survey_parser.add_argument("--model", choices=list(MODEL_MAP), default="GPT-4o-mini")
+    survey_parser.add_argument(
+        "--type", choices=list(SURVEY_QUESTION_TYPES.values()), default="likert"
+    )
+    survey_parser.add_argument(
+        "--choice", action="append", help="repeat once per choice of a multiple choice question"
+    )
+    survey_parser.add_argument("--age-min", type=int, default=DEFAULT_AGE_RANGE[0])
+    survey_parser.add_argument("--age-max", type=int, default=DEFAULT_AGE_RANGE[1])
+    survey_parser.add_argument("--income-min", type=float, default=DEFAULT_INCOME_RANGE[0])
+    survey_parser.add_argument("--income-max", type=float, default=DEFAULT_INCOME_RANGE[1])
+    survey_parser.add_argument("--seed", type=int, help="reproduces the personas of a run")
+    survey_parser.add_argument(
+        "--attributes",
+        nargs="*",
+        default=[],
+        help="perspectives columns to add to the personas, e.g. sex household_size",
+    )
+    survey_parser.add_argument(
+        "--max-prompt-tokens",
+        type=int,
+        help="keep attributes, in order, only while every prompt fits in this many tokens",
+    )
+    survey_parser.add_argument("--out", help=".parquet or .csv.gz")
+    survey_parser.add_argument(
+        "--workers",
+        type=int,
+        default=SURVEY_WORKERS,
+        help="worker processes to split the personas between (1 runs in process)",
+    )
+    survey_parser.add_argument(
+        "--shard-size", type=int, default=SURVEY_SHARD_SIZE, help="personas per worker task"
+    )
+    survey_parser.add_argument(
+        "--estimate-only", action="store_true", help="print the cost estimate and stop"
+    )
+
+    args = parser.parse_args()
+    args.command(args)
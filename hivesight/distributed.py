@@ -0,0 +1,194 @@
+"""Runs a survey plan as shards of personas on a pool of worker processes
+
+Each worker runs its shard end to end in its own event loop, with an equal
+share of the backends' rate limits: querying, parsing, counting the answers
+by demographic cell and, for open-ended questions, embedding them. The
+calling process only merges the count arrays and, for open-ended questions,
+groups the embeddings into themes.
+
+Workers are a concurrent.futures executor, a local process pool by default.
+Any other executor that can pickle run_shard and its arguments, e.g. one
+backed by a task queue spanning several machines, can be passed instead.
+"""
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import SURVEY_BACKEND_POOLS, SURVEY_MAX_CONCURRENCY, SURVEY_SHARD_SIZE
+from hivesight.survey import SurveyPlan, SurveyResult, answer_column
+from products.survey.aggregation import LikertAggregates
+from products.survey.simulation import batch_simulate_responses
+from products.survey.themes import extract_themes
+from utils.backend_utils import BackendPool
+from utils.openai_utils import run_embedding_query
+
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEYS = ("rpm", "tpm", "max_concurrency")
+
+
+class Shard(NamedTuple):
+    index: int
+    statement: str
+    choices: Optional[List[str]]
+    model_type: str
+    question_type: str
+    personas: pd.DataFrame
+    prompts: List[str]
+    # Specs of the worker's BackendPool, with its share of the rate limits
+    backend_specs: Optional[List[Dict]]
+    # The worker's share of SURVEY_MAX_CONCURRENCY, used without a pool
+    max_concurrency: int
+
+
+class ShardResult(NamedTuple):
+    index: int
+    responses: pd.DataFrame
+    aggregates: Optional[LikertAggregates]
+    embeddings: Optional[np.ndarray]
+    warnings: List[str]
+
+
+def share_rate_limits(specs: List[Dict], n_workers: int) -> List[Dict]:
+    """Backend specs with rate limits divided between n_workers, so that the
+    workers together stay within the configured limits"""
+    return [
+        {
+            **spec,
+            **{
+                key: max(1, spec[key] // n_workers)
+                for key in RATE_LIMIT_KEYS
+                if spec.get(key)
+            },
+        }
+        for spec in specs
+    ]
+
+
+def split_plan(
+    plan: SurveyPlan,
+    shard_size: int = SURVEY_SHARD_SIZE,
+    backend_specs: Optional[List[Dict]] = None,
+    max_concurrency: int = SURVEY_MAX_CONCURRENCY,
+) -> List[Shard]:
+    n_shards = max(1, math.ceil(len(plan.prompts) / shard_size))
+    bounds = np.linspace(0, len(plan.prompts), n_shards + 1).astype(int)
+    return [
+        Shard(
+            index,
+            plan.statement,
+            plan.choices,
+            plan.model_type,
+            plan.question_type,
+            plan.personas.iloc[start:end],
+            plan.prompts[start:end],
+            backend_specs,
+            max_concurrency,
+        )
+        for index, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
+
+
+def run_shard(shard: Shard) -> ShardResult:
+    """Runs in a worker process"""
+    warnings = []
+    responses = batch_simulate_responses(
+        shard.statement,
+        shard.choices,
+        len(shard.prompts),
+        shard.model_type,
+        shard.personas,
+        shard.prompts,
+        shard.question_type,
+        backend_pool=(
+            BackendPool.from_specs(shard.backend_specs) if shard.backend_specs else None
+        ),
+        warning_callback=warnings.append,
+        max_concurrency=shard.max_concurrency,
+    )
+
+    aggregates, embeddings = None, None
+    columns = answer_column(shard.question_type, shard.choices)
+    if columns is not None:
+        aggregates = LikertAggregates.from_responses(responses, None, *columns)
+    elif not responses.empty:
+        try:
+            embeddings = run_embedding_query(responses["response"].tolist())
+        except Exception as e:
+            warnings.append(f"Could not embed the answers of shard {shard.index}: {e}")
+    return ShardResult(shard.index, responses, aggregates, embeddings, warnings)
+
+
+def run_plan_distributed(
+    plan: SurveyPlan,
+    n_workers: Optional[int] = None,
+    shard_size: int = SURVEY_SHARD_SIZE,
+    executor: Optional[Executor] = None,
+    backend_specs: Optional[List[Dict]] = None,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    warning_callback: Optional[Callable[[str], None]] = None,
+) -> SurveyResult:
+    """Like run_plan, with the personas split into shards of shard_size run
+    by n_workers worker processes (one per core by default)
+
+    With an executor, n_workers only sets each shard's share of the rate
+    limits, and should match the number of shards the executor runs at once.
+    Responses keep the order of the plan's personas.
+    """
+    warn = warning_callback or logger.warning
+    n_workers = n_workers or os.cpu_count() or 1
+    if backend_specs is None:
+        backend_specs = SURVEY_BACKEND_POOLS.get(plan.model_type)
+    if backend_specs:
+        backend_specs = share_rate_limits(backend_specs, n_workers)
+    # Without a pool, nothing else keeps n_workers from each sending requests
+    # at the concurrency of a whole survey
+    max_concurrency = max(1, SURVEY_MAX_CONCURRENCY // n_workers)
+    shards = split_plan(plan, shard_size, backend_specs, max_concurrency)
+
+    own_executor = executor is None
+    if own_executor:
+        # Spawned rather than forked, so that workers don't inherit the
+        # parent's API clients and their connections
+        executor = ProcessPoolExecutor(
+            min(n_workers, len(shards)), mp_context=multiprocessing.get_context("spawn")
+        )
+    results = [None] * len(shards)
+    try:
+        futures = [executor.submit(run_shard, shard) for shard in shards]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results[result.index] = result
+            for warning in result.warnings:
+                warn(warning)
+            if progress_callback:
+                progress_callback(done / len(shards))
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+    responses = pd.concat([result.responses for result in results], ignore_index=True)
+    aggregates, themes = None, None
+    if plan.question_type != "open_ended":
+        aggregates = LikertAggregates.merge([result.aggregates for result in results])
+    elif not responses.empty:
+        if any(
+            result.embeddings is None and not result.responses.empty
+            for result in results
+        ):
+            warn("Could not group the answers into themes, as some weren't embedded.")
+        else:
+            embeddings = np.concatenate(
+                [result.embeddings for result in results if not result.responses.empty]
+            )
+            labels, themes = extract_themes(responses["response"], embeddings)
+            responses["theme"] = themes["theme"].to_numpy()[labels]
+
+    return SurveyResult(responses, themes, plan.metadata(), aggregates)
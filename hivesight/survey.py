@@ -0,0 +1,228 @@
+import logging
+import secrets
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from config import (
+    EMBEDDING_COST_PER_MILLION,
+    LIKERT_LABELS,
+    MODEL_COST_MAP,
+    SURVEY_MAX_HEDGE_FRACTION,
+    SURVEY_MAX_TOKENS,
+)
+from products.survey.aggregation import LikertAggregates
+from products.survey.data_handling import sample_personas
+from products.survey.prompts import attribute_token_counts, compile_prompt
+from products.survey.simulation import batch_simulate_responses
+from products.survey.themes import extract_themes
+from utils.backend_utils import BackendPool, get_backend_pool
+from utils.openai_utils import get_encoding, message_overhead_tokens, run_embedding_query
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AGE_RANGE = (18, 100)
+DEFAULT_INCOME_RANGE = (0, 1_000_000)
+
+
+class SurveyPlan(NamedTuple):
+    """A survey ready to run: the sampled personas, their prompts and an
+    upper bound on the cost"""
+
+    statement: str
+    question_type: str
+    choices: Optional[List[str]]
+    model_type: str
+    age_range: Tuple[int, int]
+    income_range: Tuple[float, float]
+    sampling_seed: int
+    personas: pd.DataFrame
+    prompts: List[str]
+    input_tokens: int
+    output_tokens: int
+    cost_in_usd: float
+    # Persona attributes added to the prompts, and the tokens and cost each
+    # one adds, in that order
+    attributes: Tuple[str, ...] = ()
+    attribute_costs: Optional[pd.DataFrame] = None
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_type,
+            "statement": self.statement,
+            "question_type": self.question_type,
+            "choices": self.choices,
+            "age_range": self.age_range,
+            "income_range": self.income_range,
+            "sampling_seed": self.sampling_seed,
+            "attributes": list(self.attributes),
+            "cost_in_usd": self.cost_in_usd,
+        }
+
+
+class SurveyResult(NamedTuple):
+    responses: pd.DataFrame
+    # One row per theme for open-ended questions whose answers could be grouped
+    themes: Optional[pd.DataFrame]
+    metadata: Dict[str, Any]
+    # Counts by demographic cell, when they were merged from survey shards
+    aggregates: Optional[LikertAggregates] = None
+
+
+def answer_column(
+    question_type: str, choices: Optional[List[str]] = None
+) -> Optional[Tuple[str, List[str]]]:
+    """(column, labels) of closed answers, None for open-ended ones"""
+    if question_type == "likert":
+        return "score", LIKERT_LABELS
+    if question_type == "multiple_choice":
+        return "choice", list(choices)
+    return None
+
+
+def new_sampling_seed() -> int:
+    return secrets.randbelow(2**32)
+
+
+def plan_survey(
+    statement: str,
+    n: int,
+    model_type: str = "GPT-4o-mini",
+    question_type: str = "likert",
+    choices: Optional[List[str]] = None,
+    age_range: Tuple[int, int] = DEFAULT_AGE_RANGE,
+    income_range: Tuple[float, float] = DEFAULT_INCOME_RANGE,
+    seed: Optional[int] = None,
+    attributes: Sequence[str] = (),
+    max_prompt_tokens: Optional[int] = None,
+) -> SurveyPlan:
+    """Samples n personas and prompts them, estimating the cost in USD
+
+    attributes are columns of the perspectives table (see
+    persona_attributes) to describe personas by beyond their age, state and
+    income. With max_prompt_tokens, the attributes are kept in the order
+    given up to the first one that would make any prompt longer than that.
+    The seed is recorded in the plan, so that a run can be reproduced.
+    """
+    if seed is None:
+        seed = new_sampling_seed()
+    personas = sample_personas(n, age_range, income_range, seed=seed)
+    choices_key = tuple(choices) if choices else None
+    encoding = get_encoding(model_type)
+
+    attribute_costs = attribute_token_counts(
+        question_type, statement, choices_key, list(attributes), personas, encoding
+    )
+    if max_prompt_tokens is not None:
+        fits = (attribute_costs["max_prompt_tokens"] <= max_prompt_tokens).cummin()
+        attribute_costs = attribute_costs[fits.to_numpy(dtype=bool)]
+    attribute_costs["cost_in_usd"] = (
+        attribute_costs["total_tokens"] * MODEL_COST_MAP[model_type].Input / 1E6
+    )
+    attributes = tuple(attribute_costs["attribute"])
+
+    template = compile_prompt(question_type, statement, choices_key, attributes)
+    prompts = template.render_many(personas)
+
+    # Counted from the template's pre-tokenized pieces, not the prompts
+    input_tokens = int(
+        template.count_tokens(personas, encoding).sum()
+    ) + message_overhead_tokens(len(prompts))
+    # An upper bound: every answer using its whole token budget
+    output_tokens = SURVEY_MAX_TOKENS[question_type] * len(prompts)
+    input_tokens_cost = input_tokens * MODEL_COST_MAP[model_type].Input / 1E6
+    output_tokens_cost = output_tokens * MODEL_COST_MAP[model_type].Output / 1E6
+    if question_type == "open_ended":
+        # Answers are embedded once each to group them into themes
+        output_tokens_cost += output_tokens * EMBEDDING_COST_PER_MILLION / 1E6
+    # Hedged duplicates can add up to SURVEY_MAX_HEDGE_FRACTION more calls
+    cost_in_usd = round(
+        (input_tokens_cost + output_tokens_cost) * (1 + SURVEY_MAX_HEDGE_FRACTION), 5
+    )
+    return SurveyPlan(
+        statement,
+        question_type,
+        choices,
+        model_type,
+        age_range,
+        income_range,
+        seed,
+        personas,
+        prompts,
+        input_tokens,
+        output_tokens,
+        cost_in_usd,
+        attributes,
+        attribute_costs,
+    )
+
+
+def run_plan(
+    plan: SurveyPlan,
+    backend_pool: Optional[BackendPool] = None,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    warning_callback: Optional[Callable[[str], None]] = None,
+) -> SurveyResult:
+    """Queries the model for every persona in the plan and parses the answers
+
+    Without a backend_pool, the model's pool in SURVEY_BACKEND_POOLS is used
+    if it has one. Open-ended answers are grouped into themes. Warnings, e.g.
+    about skipped answers, go to warning_callback or else to the log.
+    """
+    warn = warning_callback or logger.warning
+    if backend_pool is None:
+        backend_pool = get_backend_pool(plan.model_type)
+
+    responses = batch_simulate_responses(
+        plan.statement,
+        plan.choices,
+        len(plan.prompts),
+        plan.model_type,
+        plan.personas,
+        plan.prompts,
+        plan.question_type,
+        progress_callback=progress_callback,
+        backend_pool=backend_pool,
+        warning_callback=warn,
+    )
+
+    themes = None
+    if plan.question_type == "open_ended" and not responses.empty:
+        try:
+            embeddings = run_embedding_query(responses["response"].tolist())
+        except Exception as e:
+            warn(f"Could not group the answers into themes: {e}")
+        else:
+            labels, themes = extract_themes(responses["response"], embeddings)
+            responses["theme"] = themes["theme"].to_numpy()[labels]
+
+    return SurveyResult(responses, themes, plan.metadata())
+
+
+def run_survey(
+    statement: str,
+    n: int,
+    model_type: str = "GPT-4o-mini",
+    question_type: str = "likert",
+    choices: Optional[List[str]] = None,
+    age_range: Tuple[int, int] = DEFAULT_AGE_RANGE,
+    income_range: Tuple[float, float] = DEFAULT_INCOME_RANGE,
+    seed: Optional[int] = None,
+    backend_pool: Optional[BackendPool] = None,
+    attributes: Sequence[str] = (),
+    max_prompt_tokens: Optional[int] = None,
+) -> SurveyResult:
+    plan = plan_survey(
+        statement,
+        n,
+        model_type,
+        question_type,
+        choices,
+        age_range,
+        income_range,
+        seed,
+        attributes,
+        max_prompt_tokens,
+    )
+    return run_plan(plan, backend_pool)
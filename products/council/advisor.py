@@ -1,19 +1,37 @@
 import logging
 
-import anthropic
-
 from config import (
     ANTHROPIC_MODEL,
     COUNCIL_ADVISOR_SYSTEM_PROMPT_TEMPLATE,
-    COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE
+    COUNCIL_ADVISOR_TOOL,
+    COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE,
+    COUNCIL_DEBATE_USER_PROMPT_TEMPLATE,
 )
+from utils.anthropic_utils import get_anthropic_async_client
+from utils.retry_utils import call_with_retries
+from .utils import add_usage, read_tool_input
 
 
 logger = logging.getLogger(__name__)
-client = anthropic.Anthropic()
 
 
-def get_advisor_response(question, persona, description, expertise, max_tokens):
+async def get_advisor_response(
+    question,
+    persona,
+    description,
+    expertise,
+    max_tokens,
+    transcript=None,
+    debate_round=1,
+    usage=None,
+):
+    """The advisor's advice, summary, key_takeaways and confidence, or None
+
+    The summary, key takeaways and confidence are the advisor's digest of
+    their own advice, which is all the summarizer sees. In later rounds of
+    a debate, transcript holds the digests of the previous round. The
+    call's token usage is added to usage, a Counter, if given.
+    """
 
     description_text = description if description else 'Provide advice based on your role.'
     expertise_text = (
@@ -25,30 +43,31 @@ def get_advisor_response(question, persona, description, expertise, max_tokens):
         description=description_text,
         expertise=expertise_text
     )
+    if transcript is None:
+        user_prompt = COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE.format(question=question)
+    else:
+        user_prompt = COUNCIL_DEBATE_USER_PROMPT_TEMPLATE.format(
+            round=debate_round, question=question, transcript=transcript
+        )
 
+    client = get_anthropic_async_client()
     try:
-        message = client.messages.create(
-            model=ANTHROPIC_MODEL,
-            max_tokens=max_tokens,
-            system=system_prompt,
-            messages=[
-                {
-                    "role": "user",
-                    "content": COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE.format(question=question)
-                }
-            ],
+        message = await call_with_retries(
+            lambda: client.messages.create(
+                model=ANTHROPIC_MODEL,
+                max_tokens=max_tokens,
+                system=system_prompt,
+                messages=[{"role": "user", "content": user_prompt}],
+                tools=[COUNCIL_ADVISOR_TOOL],
+                tool_choice={"type": "tool", "name": COUNCIL_ADVISOR_TOOL["name"]},
+            ),
+            ANTHROPIC_MODEL,
         )
-        return message.content
     except Exception as e:
         logger.error(f"Error in get_advisor_response: {e}")
-        return f"Error: Unable to generate response for {persona}."
-
-
-def extract_confidence(response):
-    import re
-
-    match = re.search(r"Confidence:\s*(\d+)", response, re.IGNORECASE)
-    return int(match.group(1)) if match else None
+        return None
+    add_usage(usage, message)
+    return read_tool_input(message, COUNCIL_ADVISOR_TOOL)
 
 
 def calculate_expertise_relevance(question, expertise):
@@ -0,0 +1,242 @@
+"""Headless council runs over many questions
+
+Every advisor x question call is scheduled at once behind one shared
+RateLimiter, and each question is summarized as soon as its advisors have
+answered. Progress is appended to a JSONL checkpoint as it happens: an
+"advice" record per advisor answer and a "result" record per finished
+question. Rerunning with the same checkpoint skips everything already
+recorded, so an interrupted run resumes where it stopped.
+"""
+import asyncio
+import json
+import os
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from config import (
+    ADVISOR_MODEL_TYPE,
+    COUNCIL_DIGEST_TOKENS,
+    MODEL_COST_MAP,
+    SUMMARIZER_MODEL_TYPE,
+    SUMMARY_MAX_TOKENS,
+)
+from utils.backend_utils import CHARS_PER_TOKEN, RateLimiter
+from utils.export_utils import write_parquet
+from .advisor import get_advisor_response
+from .costs import estimate_advisor_round_cost, estimate_summary_cost
+from .store import request_key
+from .summary import format_digests, get_summary_async
+
+
+BULK_ADVISOR_PROMPT_TOKENS = 200  # system prompt and tool definition, roughly
+
+
+def load_checkpoint(path: str):
+    """(advice by (key, persona), results by key) recorded in a checkpoint"""
+    advice, results = {}, {}
+    if not os.path.exists(path):
+        return advice, results
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interruption
+            if record["type"] == "advice":
+                advice[record["key"], record["persona"]] = record["response"]
+            elif record["type"] == "result":
+                results[record["key"]] = record
+    return advice, results
+
+
+class BulkCouncilRun:
+    def __init__(
+        self,
+        questions: List[str],
+        advisors: Dict[str, Dict],
+        checkpoint_path: str,
+        max_tokens: int = 800,
+        limiter: Optional[RateLimiter] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.advisors = advisors
+        self.checkpoint_path = checkpoint_path
+        self.max_tokens = max_tokens
+        self.limiter = limiter or RateLimiter(max_concurrency=16)
+        self.on_progress = on_progress
+        # Repeated questions are asked once
+        self.questions = {
+            request_key(question, advisors, max_tokens, 1): question
+            for question in questions
+        }
+        self.advice, self.results = load_checkpoint(checkpoint_path)
+        self.advisor_usage = Counter()
+        self.summary_usage = Counter()
+        self.failed = {}
+
+    def record(self, record: Dict):
+        # Single writes of whole lines from one event loop thread, flushed so
+        # that an interruption loses at most the line being written
+        self.checkpoint.write(json.dumps(record) + "\n")
+        self.checkpoint.flush()
+
+    async def limited(self, tokens, make_call):
+        await self.limiter.wait(tokens)
+        try:
+            return await make_call()
+        finally:
+            self.limiter.release()
+
+    async def ask_advisor(self, key, question, persona):
+        if (key, persona) in self.advice:
+            return self.advice[key, persona]
+        info = self.advisors[persona]
+        response = await self.limited(
+            len(question) // CHARS_PER_TOKEN + BULK_ADVISOR_PROMPT_TOKENS + self.max_tokens,
+            lambda: get_advisor_response(
+                question,
+                persona,
+                info.get("description"),
+                info.get("expertise"),
+                self.max_tokens,
+                usage=self.advisor_usage,
+            ),
+        )
+        if response is not None:
+            self.advice[key, persona] = response
+            self.record({"type": "advice", "key": key, "persona": persona, "response": response})
+        return response
+
+    async def run_question(self, key, question):
+        responses = await asyncio.gather(
+            *(self.ask_advisor(key, question, persona) for persona in self.advisors)
+        )
+        missing = [persona for persona, response in zip(self.advisors, responses) if response is None]
+        if missing:
+            self.failed[key] = f"No usable advice from {', '.join(missing)}"
+            return
+        responses = dict(zip(self.advisors, responses))
+
+        summary = await self.limited(
+            len(self.advisors) * COUNCIL_DIGEST_TOKENS + SUMMARY_MAX_TOKENS,
+            lambda: get_summary_async(question, format_digests(responses), self.summary_usage),
+        )
+        if summary is None:
+            self.failed[key] = "No usable summary"
+            return
+        result = {
+            "type": "result",
+            "key": key,
+            "question": question,
+            "responses": responses,
+            "summary": summary,
+        }
+        self.results[key] = result
+        self.record(result)
+
+    async def run(self):
+        pending = [
+            (key, question)
+            for key, question in self.questions.items()
+            if key not in self.results
+        ]
+        total, done = len(self.questions), len(self.questions) - len(pending)
+        with open(self.checkpoint_path, "a") as self.checkpoint:
+            tasks = [self.run_question(key, question) for key, question in pending]
+            for task in asyncio.as_completed(tasks):
+                await task
+                done += 1
+                if self.on_progress:
+                    self.on_progress(done, total)
+
+    def results_table(self) -> pd.DataFrame:
+        """One row per question and advisor, with the council's summary of
+        the question repeated on each of its rows"""
+        rows = []
+        for key, question in self.questions.items():
+            if key not in self.results:
+                continue
+            summary = self.results[key]["summary"]
+            for persona, response in self.results[key]["responses"].items():
+                rows.append(
+                    {
+                        "question": question,
+                        "advisor": persona,
+                        "advice": response["advice"],
+                        "advisor_summary": response["summary"],
+                        "advisor_takeaways": response["key_takeaways"],
+                        "confidence": response["confidence"],
+                        "sentiment": summary["sentiments"].get(persona),
+                        "council_summary": summary["summary"],
+                        "consensus_level": summary["consensus_level"],
+                        "council_takeaways": summary["key_takeaways"],
+                    }
+                )
+        return pd.DataFrame(rows)
+
+    def write_results(self, path: str, metadata: Optional[Dict] = None):
+        """Writes the finished questions as Parquet, or as JSONL (one
+        question per line) when path ends in .jsonl"""
+        if path.endswith(".jsonl"):
+            with open(path, "w") as f:
+                for key, question in self.questions.items():
+                    if key in self.results:
+                        result = self.results[key]
+                        f.write(
+                            json.dumps(
+                                {
+                                    "question": question,
+                                    "responses": result["responses"],
+                                    "summary": result["summary"],
+                                }
+                            )
+                            + "\n"
+                        )
+        else:
+            with open(path, "wb") as f:
+                write_parquet(self.results_table(), f, metadata)
+
+    def cost_report(self) -> Dict:
+        """Tokens used and their cost in USD in this run, next to the upfront
+        estimate for the whole batch"""
+        advisor_rates = MODEL_COST_MAP[ADVISOR_MODEL_TYPE]
+        summary_rates = MODEL_COST_MAP[SUMMARIZER_MODEL_TYPE]
+        advisor_cost = (
+            self.advisor_usage["input_tokens"] * advisor_rates.Input
+            + self.advisor_usage["output_tokens"] * advisor_rates.Output
+        ) / 1E6
+        summary_cost = (
+            self.summary_usage["input_tokens"] * summary_rates.Input
+            + self.summary_usage["output_tokens"] * summary_rates.Output
+        ) / 1E6
+        estimate = sum(
+            estimate_advisor_round_cost(question, len(self.advisors), self.max_tokens)
+            + estimate_summary_cost(question, len(self.advisors))
+            for question in self.questions.values()
+        )
+        return {
+            "questions": len(self.questions),
+            "completed": len(self.results),
+            "failed": dict(self.failed),
+            "advisor_tokens": dict(self.advisor_usage),
+            "summary_tokens": dict(self.summary_usage),
+            "advisor_cost": advisor_cost,
+            "summary_cost": summary_cost,
+            "total_cost": advisor_cost + summary_cost,
+            "estimated_max_cost": estimate,
+        }
+
+
+def run_bulk_council(
+    questions: List[str],
+    advisors: Dict[str, Dict],
+    checkpoint_path: str,
+    max_tokens: int = 800,
+    limiter: Optional[RateLimiter] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> BulkCouncilRun:
+    run = BulkCouncilRun(questions, advisors, checkpoint_path, max_tokens, limiter, on_progress)
+    asyncio.run(run.run())
+    return run
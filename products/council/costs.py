@@ -0,0 +1,90 @@
+import json
+
+from config import (
+    MODEL_COST_MAP,
+    ADVISOR_MODEL_TYPE,
+    SUMMARIZER_MODEL_TYPE,
+    COUNCIL_ADVISOR_SYSTEM_PROMPT_TEMPLATE,
+    COUNCIL_ADVISOR_TOOL,
+    COUNCIL_DEBATE_USER_PROMPT_TEMPLATE,
+    COUNCIL_SUMMARY_TOOL,
+    COUNCIL_SUMMARY_USER_PROMPT_TEMPLATE,
+    COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE,
+    COUNCIL_DIGEST_TOKENS,
+    SUMMARY_MAX_TOKENS,
+)
+from utils.openai_utils import estimate_input_tokens
+
+
+def estimate_advisor_round_cost(question, n_advisors, max_tokens, transcript_tokens=0):
+    """Upper bound in USD on one round of advisor calls
+
+    transcript_tokens is the size of the digests shown to each advisor in a
+    debate round after the first.
+    """
+    # Simplified advisor system token count. Doesn't include expertise or description
+    # The tool definitions are sent with every request as well
+    advisor_system_tokens = n_advisors * estimate_input_tokens(
+        [COUNCIL_ADVISOR_SYSTEM_PROMPT_TEMPLATE, json.dumps(COUNCIL_ADVISOR_TOOL)],
+        ADVISOR_MODEL_TYPE,
+    )
+    if transcript_tokens:
+        user_prompt = COUNCIL_DEBATE_USER_PROMPT_TEMPLATE.format(
+            round=2, question=question, transcript=""
+        )
+    else:
+        user_prompt = COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE.format(question=question)
+    advisor_user_tokens = n_advisors * (
+        estimate_input_tokens([user_prompt], ADVISOR_MODEL_TYPE) + transcript_tokens
+    )
+    # This will be conservative for higher max_token values
+    advisor_output_tokens = n_advisors * max_tokens
+
+    advisor_input_tokens_cost = (
+        (advisor_system_tokens + advisor_user_tokens)
+        * MODEL_COST_MAP[ADVISOR_MODEL_TYPE].Input / 1E6
+    )
+    advisor_output_tokens_cost = (
+        advisor_output_tokens * MODEL_COST_MAP[ADVISOR_MODEL_TYPE].Output / 1E6
+    )
+    return advisor_input_tokens_cost + advisor_output_tokens_cost
+
+
+def estimate_debate_cost(question, n_advisors, max_tokens, rounds):
+    """Upper bound in USD on the advisor calls of a debate of up to rounds rounds
+
+    Every round after the first shows each advisor all the latest digests,
+    so rounds cost the same however long the debate runs.
+    """
+    first_round_cost = estimate_advisor_round_cost(question, n_advisors, max_tokens)
+    later_round_cost = estimate_advisor_round_cost(
+        question, n_advisors, max_tokens, n_advisors * COUNCIL_DIGEST_TOKENS
+    )
+    return first_round_cost + (rounds - 1) * later_round_cost
+
+
+def estimate_summary_cost(question, n_advisors):
+    """Upper bound in USD on the summarizer call"""
+    # The summarizer reads each advisor's digest, not the full advice.
+    # Double counting the bracketed variables, but it's just a few tokens
+    summarizer_input_tokens = n_advisors * COUNCIL_DIGEST_TOKENS + estimate_input_tokens(
+        [
+            question,
+            COUNCIL_SUMMARY_USER_PROMPT_TEMPLATE.format(
+                question=question,
+                responses="",  # covered by COUNCIL_DIGEST_TOKENS
+            ),
+            json.dumps(COUNCIL_SUMMARY_TOOL),
+        ],
+        SUMMARIZER_MODEL_TYPE,
+    )
+    summarizer_output_tokens = SUMMARY_MAX_TOKENS
+
+    summarizer_input_tokens_cost = (
+        summarizer_input_tokens
+        * MODEL_COST_MAP[SUMMARIZER_MODEL_TYPE].Input / 1E6
+    )
+    summarizer_output_tokens_cost = (
+        summarizer_output_tokens * MODEL_COST_MAP[SUMMARIZER_MODEL_TYPE].Output / 1E6
+    )
+    return summarizer_input_tokens_cost + summarizer_output_tokens_cost
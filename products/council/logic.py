@@ -1,18 +1,28 @@
+import asyncio
 import streamlit as st
 import pandas as pd
 import logging
-from config import DEFAULT_PERSONAS
+import numpy as np
+from config import (
+    ADVISOR_MODEL_TYPE,
+    COUNCIL_CONSENSUS_STABLE_DELTA,
+    DEFAULT_PERSONAS,
+)
+from utils.openai_utils import estimate_input_tokens, run_embedding_query
 from .advisor import (
     get_advisor_response,
-    extract_confidence,
     calculate_expertise_relevance,
 )
-from .summary import get_summary, parse_summary
+from .summary import format_digests, get_summary
 from .analysis import analyze_responses
-from .utils import parse_response
-from .state import add_to_history
+from .costs import estimate_advisor_round_cost
+from .semantic_cache import cache_scope, get_semantic_cache
+from .state import add_to_history, current_email
+from .store import request_key
 from .ui import (
     display_advisor_response,
+    display_cached_response,
+    display_consensus,
     display_summary,
     display_confidence_chart,
 )
@@ -20,71 +30,265 @@ from .ui import (
 logger = logging.getLogger(__name__)
 
 
-def process_advice_request(question, selected_personas, max_tokens):
-    all_advisors = {**DEFAULT_PERSONAS, **st.session_state.custom_advisors}
+async def consult_advisors(
+    question,
+    selected_personas,
+    all_advisors,
+    max_tokens,
+    on_response,
+    transcript=None,
+    debate_round=1,
+):
+    """Asks every advisor at once, calling on_response(persona, response)
+    as each answer arrives; response is None when the advisor failed"""
+
+    async def consult(persona):
+        advisor_info = all_advisors[persona]
+        response = await get_advisor_response(
+            question,
+            persona,
+            advisor_info.get("description"),
+            advisor_info.get("expertise"),
+            max_tokens,
+            transcript,
+            debate_round,
+        )
+        return persona, response
+
+    for task in asyncio.as_completed([consult(persona) for persona in selected_personas]):
+        on_response(*await task)
+
+
+def run_advisor_round(question, selected_personas, all_advisors, max_tokens, transcript=None, debate_round=1):
+    """Each advisor's response, displayed as it arrives, leaving out failures"""
     responses = {}
-    confidences = {}
-    expertise_scores = {}
 
-    for persona in selected_personas:
-        with st.spinner(f"Consulting {persona}..."):
-            advisor_info = all_advisors[persona]
-            response = get_advisor_response(
+    def on_response(persona, response):
+        if response is None:
+            st.warning(f"{persona} didn't give usable advice, so they are left out.")
+            return
+        responses[persona] = response
+        display_advisor_response(persona, response)
+
+    with st.spinner(f"Consulting {len(selected_personas)} advisors..."):
+        asyncio.run(
+            consult_advisors(
                 question,
-                persona,
-                advisor_info.get("description"),
-                advisor_info.get("expertise"),
-                max_tokens
+                selected_personas,
+                all_advisors,
+                max_tokens,
+                on_response,
+                transcript,
+                debate_round,
             )
-            parsed_response = parse_response(response)
-            responses[persona] = parsed_response
-            display_advisor_response(persona, parsed_response)
+        )
+    return responses
 
-            confidences[persona] = extract_confidence(parsed_response) or 5
-            expertise_scores[persona] = calculate_expertise_relevance(
-                question, advisor_info.get("expertise", {})
-            )
 
-    if responses:
-        with st.spinner("Analyzing advice..."):
-            formatted_responses = "\n\n".join(
-                f"{persona}: {response}"
-                for persona, response in responses.items()
-            )
-            summary = get_summary(question, formatted_responses)
-            logger.info(f"Raw summary: {summary}")
-            parsed_summary = parse_summary(summary)
-            logger.info(f"Parsed summary: {parsed_summary}")
-
-            if (
-                parsed_summary["summary"] != "Not available"
-                and parsed_summary["summary"]
-                != "Error: Unable to parse summary."
-            ):
-                display_summary(parsed_summary)
-            else:
-                st.error(
-                    "An error occurred while parsing the summary. Please try again."
-                )
-
-            st.subheader("Advisor Confidence and Expertise")
-            analysis = analyze_responses(
-                responses, confidences, expertise_scores
-            )
-            confidence_df = pd.DataFrame(
-                {
-                    "Advisor": list(confidences.keys()),
-                    "Confidence": list(confidences.values()),
-                    "Avg Relevant Expertise": [
-                        sum(scores) / len(scores) if scores else 0
-                        for scores in expertise_scores.values()
-                    ],
-                }
+def consensus_score(responses):
+    """Mean pairwise cosine similarity of the advisors' summaries
+
+    One batched embedding call, far cheaper than another model turn.
+    """
+    if len(responses) < 2:
+        return 1.0
+    embeddings = run_embedding_query(
+        [response["summary"] for response in responses.values()]
+    )
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    n = len(unit)
+    return float(((unit @ unit.T).sum() - n) / (n * (n - 1)))
+
+
+def get_all_advisors():
+    return {**DEFAULT_PERSONAS, **st.session_state.custom_advisors}
+
+
+def council_request_key(question, selected_personas, max_tokens, rounds):
+    all_advisors = get_all_advisors()
+    return request_key(
+        question,
+        {persona: all_advisors[persona] for persona in selected_personas},
+        max_tokens,
+        rounds,
+    )
+
+
+def embed_question(question):
+    """The question's embedding, or None if it couldn't be computed"""
+    try:
+        return run_embedding_query([question])[0]
+    except Exception as e:
+        logger.error(f"Error in embed_question: {e}")
+        return None
+
+
+def find_cached_advice(question_embedding, selected_personas, max_tokens):
+    """CacheHits of the advisors who have answered a similar question"""
+    all_advisors = get_all_advisors()
+    cache = get_semantic_cache()
+    hits = {}
+    for persona in selected_personas:
+        scope = cache_scope(current_email(), persona, all_advisors[persona], max_tokens)
+        hit = cache.lookup(scope, question_embedding)
+        if hit is not None:
+            hits[persona] = hit
+    return hits
+
+
+def process_advice_request(
+    question, selected_personas, max_tokens, key, cached=None, question_embedding=None
+):
+    """Consults the advisors, reusing the advice in cached (CacheHits by
+    persona) and adding new advice to the semantic cache"""
+    all_advisors = get_all_advisors()
+    cached = cached or {}
+    responses = {}
+    for persona, hit in cached.items():
+        display_cached_response(persona, hit)
+        responses[persona] = hit.response
+
+    personas_to_ask = [persona for persona in selected_personas if persona not in cached]
+    if personas_to_ask:
+        new_responses = run_advisor_round(question, personas_to_ask, all_advisors, max_tokens)
+        responses.update(new_responses)
+        if question_embedding is not None:
+            cache = get_semantic_cache()
+            for persona, response in new_responses.items():
+                scope = cache_scope(current_email(), persona, all_advisors[persona], max_tokens)
+                cache.add(scope, question_embedding, question, response)
+
+    summary = summarize_advice(question, all_advisors, responses)
+    save_session(question, selected_personas, key, [responses], [], summary)
+
+
+def process_debate_request(question, selected_personas, max_tokens, max_rounds, budget, key):
+    """Debates the question for up to max_rounds rounds
+
+    Every round after the first shows the advisors only the digests of the
+    previous round, so each round costs about the same. The debate stops
+    once the consensus score changes by less than
+    COUNCIL_CONSENSUS_STABLE_DELTA, or before a round whose estimated cost
+    would take the total over budget (in USD). Returns the estimated cost
+    of the rounds that ran, which is what the debate is charged.
+    """
+    all_advisors = get_all_advisors()
+    responses = {}
+    rounds, scores = [], []
+    transcript = None
+    spent = 0.0
+
+    for debate_round in range(1, max_rounds + 1):
+        transcript_tokens = (
+            estimate_input_tokens([transcript], ADVISOR_MODEL_TYPE) if transcript else 0
+        )
+        round_cost = estimate_advisor_round_cost(
+            question, len(selected_personas), max_tokens, transcript_tokens
+        )
+        if spent + round_cost > budget:
+            st.info("Ending the debate, as another round could exceed the credit budget.")
+            break
+        spent += round_cost
+
+        st.subheader(f"Round {debate_round}")
+        round_responses = run_advisor_round(
+            question, selected_personas, all_advisors, max_tokens, transcript, debate_round
+        )
+        if not round_responses:
+            break
+        rounds.append(round_responses)
+        # Advisors who failed this round keep their previous position
+        responses = {**responses, **round_responses}
+        transcript = format_digests(responses)
+
+        try:
+            score = consensus_score(responses)
+        except Exception as e:
+            logger.error(f"Error in consensus_score: {e}")
+            st.warning("Could not score the consensus, so the debate ends here.")
+            break
+        scores.append(score)
+        display_consensus(debate_round, score)
+        if len(scores) > 1 and abs(scores[-1] - scores[-2]) < COUNCIL_CONSENSUS_STABLE_DELTA:
+            st.info(f"Consensus stabilized after {debate_round} rounds.")
+            break
+
+    summary = summarize_advice(question, all_advisors, responses)
+    save_session(question, selected_personas, key, rounds, scores, summary)
+    return spent
+
+
+def summarize_advice(question, all_advisors, responses):
+    """Summarizes and displays the advice, returning the summary or None"""
+    if not responses:
+        return None
+    with st.spinner("Analyzing advice..."):
+        summary = get_summary(question, format_digests(responses))
+
+        if summary is not None:
+            display_summary(summary)
+        else:
+            st.error(
+                "An error occurred while summarizing the advice. Please try again."
             )
-            display_confidence_chart(confidence_df)
+        display_advice_analysis(question, all_advisors, responses)
+    return summary
 
-        add_to_history(
-            question,
-            selected_personas,
-            parsed_summary.get("summary", "Summary not available"),
+
+def display_advice_analysis(question, all_advisors, responses):
+    confidences = {
+        persona: response["confidence"] for persona, response in responses.items()
+    }
+    expertise_scores = {
+        persona: calculate_expertise_relevance(
+            question, all_advisors[persona].get("expertise", {})
         )
+        for persona in responses
+    }
+
+    st.subheader("Advisor Confidence and Expertise")
+    analysis = analyze_responses(
+        responses, confidences, expertise_scores
+    )
+    confidence_df = pd.DataFrame(
+        {
+            "Advisor": list(confidences.keys()),
+            "Confidence": list(confidences.values()),
+            "Avg Relevant Expertise": [
+                sum(scores) / len(scores) if scores else 0
+                for scores in expertise_scores.values()
+            ],
+        }
+    )
+    display_confidence_chart(confidence_df)
+
+
+def save_session(question, selected_personas, key, rounds, scores, summary):
+    # Only complete sessions are stored, so a failed one is retried next time
+    if summary is None:
+        return
+    add_to_history(
+        question,
+        selected_personas,
+        key,
+        summary["summary"],
+        {"rounds": rounds, "consensus": scores, "summary": summary},
+    )
+
+
+def display_stored_session(question, result):
+    """Shows a stored session as it was first shown, without any API calls"""
+    all_advisors = get_all_advisors()
+    responses = {}
+    is_debate = len(result["rounds"]) > 1 or bool(result["consensus"])
+    for debate_round, round_responses in enumerate(result["rounds"], 1):
+        if is_debate:
+            st.subheader(f"Round {debate_round}")
+        for persona, response in round_responses.items():
+            display_advisor_response(persona, response)
+        if debate_round <= len(result["consensus"]):
+            display_consensus(debate_round, result["consensus"][debate_round - 1])
+        responses.update(round_responses)
+
+    display_summary(result["summary"])
+    display_advice_analysis(question, all_advisors, responses)
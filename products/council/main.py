@@ -2,9 +2,9 @@ import logging
 
 import streamlit as st
 
-from utils.openai_utils import estimate_input_tokens
 from utils.credit_utils import (
     get_or_create_stripe_customer,
+    get_cost_in_credits,
     get_credits_available,
     get_number_of_credits_with_purchase,
     get_stripe_checkout_url,
@@ -13,18 +13,17 @@ from utils.credit_utils import (
     create_credit_purchase_sidebar,
     create_free_credits_sidebar
 )
-from config import (
-    MODEL_COST_MAP,
-    ADVISOR_MODEL_TYPE,
-    SUMMARIZER_MODEL_TYPE,
-    COUNCIL_ADVISOR_SYSTEM_PROMPT_TEMPLATE,
-    COUNCIL_SUMMARY_USER_PROMPT_TEMPLATE,
-    COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE,
-    SUMMARY_MAX_TOKENS,
-)
-from .state import init_session_state
+from .state import find_stored_session, init_session_state
 from .ui import render_ui
-from .logic import process_advice_request
+from .costs import estimate_debate_cost, estimate_summary_cost
+from .logic import (
+    council_request_key,
+    display_stored_session,
+    embed_question,
+    find_cached_advice,
+    process_advice_request,
+    process_debate_request,
+)
 
 
 logging.basicConfig(level=logging.INFO)
@@ -37,7 +36,7 @@ def render():
     st.subheader("AI-Powered Advisory Council")
 
     create_credit_purchase_sidebar()
-    question, personas, max_tokens = render_ui()
+    question, personas, max_tokens, rounds = render_ui()
 
 
     # Multi-step proceedure for cost estimation ----------
@@ -50,68 +49,30 @@ def render():
             "Proceed to Cost Estimation",
             help="Get cost estimate and run simulation",
         ):
+            key = council_request_key(question, personas, max_tokens, rounds)
             if not question.strip():
                 st.error(
                     "Please enter a statement before running the simulation."
                 )
+            elif find_stored_session(key) is not None:
+                # Asked before: the stored advice is shown for free
+                st.session_state.cost_estimation = {"request_key": key, "stored": True}
+                st.session_state.step = 2
+                st.rerun()
             else:
-
-                # Simplified advisor system token count. Doesn't include expertise or description
-                advisor_system_tokens = len(personas) * estimate_input_tokens(
-                    [COUNCIL_ADVISOR_SYSTEM_PROMPT_TEMPLATE], ADVISOR_MODEL_TYPE 
-                )
-                advisor_user_tokens = len(personas) * estimate_input_tokens(
-                    [
-                        COUNCIL_ADVISOR_USER_PROMPT_TEMPLATE.format(
-                            question=question
-                        )
-                    ],
-                    ADVISOR_MODEL_TYPE,
-                )
-                # This will be conservative for higher max_token values
-                advisor_output_tokens = len(personas) * max_tokens
-
-                # Double counting the bracketed variables, but it's just a few tokens
-                summarizer_input_tokens = advisor_output_tokens + estimate_input_tokens(
-                    [
-                        question,
-                        COUNCIL_SUMMARY_USER_PROMPT_TEMPLATE.format(
-                            question=question,
-                            responses="",  # covered in advisor_output_tokens
-                        ),
-                    ],
-                    SUMMARIZER_MODEL_TYPE,
-                )
-                summarizer_output_tokens = SUMMARY_MAX_TOKENS
-
-                advisor_input_tokens_cost = (
-                    (advisor_system_tokens + advisor_user_tokens)
-                    * MODEL_COST_MAP[ADVISOR_MODEL_TYPE].Input / 1E6
+                # Advice for similar questions can be reused; debates always
+                # run afresh, as every round depends on the others
+                question_embedding = embed_question(question) if rounds == 1 else None
+                cached = (
+                    find_cached_advice(question_embedding, personas, max_tokens)
+                    if question_embedding is not None
+                    else {}
                 )
-                advisor_output_tokens_cost = (
-                    advisor_output_tokens * MODEL_COST_MAP[ADVISOR_MODEL_TYPE].Output / 1E6
-                )
-                summarizer_input_tokens_cost = (
-                    summarizer_input_tokens
-                    * MODEL_COST_MAP[SUMMARIZER_MODEL_TYPE].Input / 1E6
-                )
-                summarizer_output_tokens_cost = (
-                    summarizer_output_tokens * MODEL_COST_MAP[SUMMARIZER_MODEL_TYPE].Output / 1E6
-                )
-
-                total_cost = round(
-                    advisor_input_tokens_cost
-                    + advisor_output_tokens_cost
-                    + summarizer_input_tokens_cost
-                    + summarizer_output_tokens_cost,
-                    4  # rounds costs to the 100th of a cent
-                )
-                total_cost_in_credits = round(total_cost * CREDITS_TO_USD_MULTIPLIER)
-
                 st.session_state.cost_estimation = {
-                    "total_cost": total_cost,
-                    "total_cost_in_credits": total_cost_in_credits,
-                    "personas": personas,
+                    "request_key": key,
+                    "stored": False,
+                    "cached": cached,
+                    "question_embedding": question_embedding,
                 }
                 st.session_state.step = 2
                 st.rerun()
@@ -120,20 +81,80 @@ def render():
     elif st.session_state.step == 2:
 
         cost_data = st.session_state.cost_estimation
+        if cost_data["stored"]:
+            st.write(
+                "These advisors have answered this question before, "
+                "so their advice is shown again at no cost."
+            )
+            if st.button("Show Advice"):
+                display_stored_session(
+                    question, find_stored_session(cost_data["request_key"])
+                )
+            return
+
+        reused = {}
+        if cost_data["cached"]:
+            st.write("#### Advice from similar questions")
+        for persona, hit in cost_data["cached"].items():
+            if not st.checkbox(
+                f"Regenerate {persona}'s advice",
+                help=f'{persona} has answered "{hit.question}" '
+                f"({hit.similarity:.0%} similar). Unless regenerated, "
+                "that advice is shown again at no cost.",
+            ):
+                reused[persona] = hit
+
+        # A debate stops before a round that could go over advisor_cost
+        advisor_cost = estimate_debate_cost(
+            question, len(personas) - len(reused), max_tokens, rounds
+        )
+        summary_cost = estimate_summary_cost(question, len(personas))
+        total_cost = round(
+            advisor_cost + summary_cost,
+            4  # rounds costs to the 100th of a cent
+        )
+        total_cost_in_credits = get_cost_in_credits(total_cost)
+
         st.write("#### Cost estimation")
-        st.write(f"**Total Cost (to developers) in USD for Simulation:** ${cost_data['total_cost']}")
-        st.write(f"**Credits Required (for user):** {cost_data['total_cost_in_credits']}")
+        st.write(f"**Total Cost (to developers) in USD for Simulation:** ${total_cost}")
+        st.write(f"**Credits Required (for user):** {total_cost_in_credits}")
+        if rounds > 1:
+            st.caption(
+                "That is for all the rounds; a debate that reaches consensus "
+                "sooner is only charged for the rounds it ran."
+            )
 
         credits_available = get_credits_available(st.session_state["email"])
         st.write(f"**User Credits** (at time of cost estimation): {credits_available:,}")
 
         create_free_credits_sidebar()
 
-        enough_credits = credits_available >= cost_data['total_cost_in_credits']
+        enough_credits = credits_available >= total_cost_in_credits
         if enough_credits:
             if st.button("Get Advice", help="Click to start the simulation with the current settings."):
-                update_credit_usage_history(st.session_state['email'], cost_data['total_cost_in_credits'])
-                process_advice_request(question, personas, max_tokens)
+                if rounds > 1:
+                    debate_cost = process_debate_request(
+                        question,
+                        personas,
+                        max_tokens,
+                        rounds,
+                        advisor_cost,
+                        cost_data["request_key"],
+                    )
+                    update_credit_usage_history(
+                        st.session_state['email'],
+                        get_cost_in_credits(round(debate_cost + summary_cost, 4)),
+                    )
+                else:
+                    update_credit_usage_history(st.session_state['email'], total_cost_in_credits)
+                    process_advice_request(
+                        question,
+                        personas,
+                        max_tokens,
+                        cost_data["request_key"],
+                        reused,
+                        cost_data["question_embedding"],
+                    )
         else:
             st.write("Not enough credits! See the sidebar to buy more.")
 
@@ -0,0 +1,111 @@
+"""In-process cache of advice for similar questions
+
+Each (user, advisor, advisor definition, max_tokens) scope has its own
+index of question embeddings, searched by brute force. Scopes and the
+entries within them are evicted least recently used first.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+import streamlit as st
+
+from config import (
+    COUNCIL_CACHE_MAX_ENTRIES,
+    COUNCIL_CACHE_MAX_SCOPES,
+    COUNCIL_CACHE_SIMILARITY_THRESHOLD,
+)
+
+
+class CacheHit(NamedTuple):
+    question: str
+    response: Dict
+    similarity: float
+
+
+def unit_vector(embedding: np.ndarray) -> np.ndarray:
+    embedding = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm else embedding
+
+
+def cache_scope(email, persona, advisor_info, max_tokens):
+    return (email, persona, json.dumps(advisor_info, sort_keys=True), max_tokens)
+
+
+class VectorIndex:
+    """Unit-normalized embeddings in a fixed-size array; once it is full,
+    the least recently used entry is replaced"""
+
+    def __init__(self, max_entries: int, dimensions: int):
+        self.embeddings = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self.entries = [None] * max_entries
+        self.last_used = np.full(max_entries, -1, dtype=np.int64)  # -1 marks a free slot
+        self.clock = 0
+
+    def touch(self, slot: int):
+        self.clock += 1
+        self.last_used[slot] = self.clock
+
+    def search(self, embedding: np.ndarray):
+        """(slot, similarity) of the most similar entry, or (None, -inf) if empty"""
+        similarities = np.where(
+            self.last_used >= 0, self.embeddings @ embedding, -np.inf
+        )
+        slot = int(np.argmax(similarities))
+        if similarities[slot] == -np.inf:
+            return None, -np.inf
+        return slot, float(similarities[slot])
+
+    def add(self, embedding: np.ndarray, entry):
+        slot = int(np.argmin(self.last_used))
+        self.embeddings[slot] = embedding
+        self.entries[slot] = entry
+        self.touch(slot)
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = COUNCIL_CACHE_SIMILARITY_THRESHOLD,
+        max_entries: int = COUNCIL_CACHE_MAX_ENTRIES,
+        max_scopes: int = COUNCIL_CACHE_MAX_SCOPES,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self.scopes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, scope, embedding) -> Optional[CacheHit]:
+        """The cached advice for the most similar question in scope, if it is
+        at least threshold similar"""
+        with self.lock:
+            index = self.scopes.get(scope)
+            if index is None:
+                return None
+            self.scopes.move_to_end(scope)
+            slot, similarity = index.search(unit_vector(embedding))
+            if similarity < self.threshold:
+                return None
+            index.touch(slot)
+            question, response = index.entries[slot]
+            return CacheHit(question, response, similarity)
+
+    def add(self, scope, embedding, question: str, response: Dict):
+        embedding = unit_vector(embedding)
+        with self.lock:
+            index = self.scopes.get(scope)
+            if index is None:
+                index = self.scopes[scope] = VectorIndex(self.max_entries, len(embedding))
+                if len(self.scopes) > self.max_scopes:
+                    self.scopes.popitem(last=False)
+            self.scopes.move_to_end(scope)
+            index.add(embedding, (question, response))
+
+
+@st.cache_resource
+def get_semantic_cache():
+    return SemanticCache()
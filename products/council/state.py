@@ -1,11 +1,17 @@
 import streamlit as st
 
+from .store import get_council_store
+
+
+def current_email():
+    return st.session_state.get("email", "")
+
 
 def init_session_state():
     if "custom_advisors" not in st.session_state:
-        st.session_state.custom_advisors = {}
-    if "council_history" not in st.session_state:
-        st.session_state.council_history = []
+        st.session_state.custom_advisors = get_council_store().list_advisors(
+            current_email()
+        )
 
 
 def add_custom_advisor(role, description, expertise):
@@ -18,17 +24,23 @@ def add_custom_advisor(role, description, expertise):
         "description": description,
         "expertise": expertise_dict,
     }
+    get_council_store().save_advisor(current_email(), role, description, expertise_dict)
 
 
 def remove_custom_advisor(role):
     del st.session_state.custom_advisors[role]
+    get_council_store().delete_advisor(current_email(), role)
+
 
+def find_stored_session(key):
+    return get_council_store().find_session(current_email(), key)
 
-def add_to_history(question, advisors, summary):
-    st.session_state.council_history.append(
-        {
-            "question": question,
-            "advisors": advisors,
-            "summary": summary,
-        }
+
+def add_to_history(question, advisors, key, summary, result):
+    get_council_store().save_session(
+        current_email(), key, question, advisors, summary, result
     )
+
+
+def get_history(query="", page=0):
+    return get_council_store().history(current_email(), query, page)
@@ -0,0 +1,269 @@
+"""Per-user storage of custom advisors and past council sessions
+
+SQLiteCouncilStore keeps them in a local file with an FTS5 index over
+questions and summaries; SupabaseCouncilStore keeps them in the tables of
+SUPABASE_SCHEMA, searched through a generated tsvector column. Both have
+the same methods, and get_council_store picks one by COUNCIL_STORE_BACKEND.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import streamlit as st
+
+from config import COUNCIL_DB_PATH, COUNCIL_HISTORY_PAGE_SIZE, COUNCIL_STORE_BACKEND
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS council_advisors (
+    email TEXT NOT NULL,
+    role TEXT NOT NULL,
+    description TEXT NOT NULL,
+    expertise TEXT NOT NULL,
+    PRIMARY KEY (email, role)
+);
+CREATE TABLE IF NOT EXISTS council_sessions (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    request_key TEXT NOT NULL,
+    question TEXT NOT NULL,
+    advisors TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (email, request_key)
+);
+CREATE INDEX IF NOT EXISTS council_sessions_by_email ON council_sessions (email, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS council_sessions_search USING fts5(
+    question, summary, content='council_sessions', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS council_sessions_insert AFTER INSERT ON council_sessions BEGIN
+    INSERT INTO council_sessions_search (rowid, question, summary)
+    VALUES (new.id, new.question, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS council_sessions_delete AFTER DELETE ON council_sessions BEGIN
+    INSERT INTO council_sessions_search (council_sessions_search, rowid, question, summary)
+    VALUES ('delete', old.id, old.question, old.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS council_sessions_update AFTER UPDATE ON council_sessions BEGIN
+    INSERT INTO council_sessions_search (council_sessions_search, rowid, question, summary)
+    VALUES ('delete', old.id, old.question, old.summary);
+    INSERT INTO council_sessions_search (rowid, question, summary)
+    VALUES (new.id, new.question, new.summary);
+END;
+"""
+
+# To be run once in the Supabase SQL editor
+SUPABASE_SCHEMA = """
+create table council_advisors (
+    email text not null,
+    role text not null,
+    description text not null,
+    expertise jsonb not null,
+    primary key (email, role)
+);
+create table council_sessions (
+    id bigint generated always as identity primary key,
+    email text not null,
+    request_key text not null,
+    question text not null,
+    advisors jsonb not null,
+    summary text not null,
+    result jsonb not null,
+    created_at timestamptz not null default now(),
+    search tsvector generated always as (to_tsvector('english', question || ' ' || summary)) stored,
+    unique (email, request_key)
+);
+create index council_sessions_by_email on council_sessions (email, id);
+create index council_sessions_search on council_sessions using gin (search);
+"""
+
+HISTORY_COLUMNS = ["id", "question", "advisors", "summary", "created_at"]
+
+
+def request_key(question: str, advisors: Dict[str, Dict], max_tokens: int, rounds: int) -> str:
+    """Identifies a council request: the same question (up to whitespace),
+    put to the same advisors with the same descriptions and expertise, with
+    the same settings"""
+    payload = json.dumps(
+        [" ".join(question.split()), advisors, max_tokens, rounds], sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def fts_query(text: str) -> str:
+    """Every word of text as a quoted prefix term, so that user input is
+    never parsed as FTS5 query syntax"""
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+class SQLiteCouncilStore:
+    def __init__(self, path: str = COUNCIL_DB_PATH):
+        # Streamlit serves each session from its own thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.executescript(SQLITE_SCHEMA)
+
+    def execute(self, sql: str, parameters=()) -> List[sqlite3.Row]:
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def list_advisors(self, email: str) -> Dict[str, Dict]:
+        rows = self.execute(
+            "SELECT role, description, expertise FROM council_advisors WHERE email = ?",
+            (email,),
+        )
+        return {
+            row["role"]: {
+                "description": row["description"],
+                "expertise": json.loads(row["expertise"]),
+            }
+            for row in rows
+        }
+
+    def save_advisor(self, email: str, role: str, description: str, expertise: Dict[str, int]):
+        self.execute(
+            "INSERT OR REPLACE INTO council_advisors VALUES (?, ?, ?, ?)",
+            (email, role, description, json.dumps(expertise)),
+        )
+
+    def delete_advisor(self, email: str, role: str):
+        self.execute(
+            "DELETE FROM council_advisors WHERE email = ? AND role = ?", (email, role)
+        )
+
+    def find_session(self, email: str, key: str) -> Optional[Dict]:
+        rows = self.execute(
+            "SELECT result FROM council_sessions WHERE email = ? AND request_key = ?",
+            (email, key),
+        )
+        return json.loads(rows[0]["result"]) if rows else None
+
+    def save_session(
+        self, email: str, key: str, question: str, advisors: List[str], summary: str, result: Dict
+    ):
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete
+        # doesn't fire the delete trigger (recursive_triggers is off), which
+        # would leave the old text in the search index. The update trigger
+        # reindexes the row instead
+        self.execute(
+            "INSERT INTO council_sessions "
+            "(email, request_key, question, advisors, summary, result) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (email, request_key) DO UPDATE SET question = excluded.question, "
+            "advisors = excluded.advisors, summary = excluded.summary, result = excluded.result",
+            (email, key, question, json.dumps(advisors), summary, json.dumps(result)),
+        )
+
+    def history(
+        self, email: str, query: str = "", page: int = 0, page_size: int = COUNCIL_HISTORY_PAGE_SIZE
+    ) -> Tuple[List[Dict], int]:
+        """One page of past sessions, newest first, and the number of matches
+
+        With a query, only sessions whose question or summary contain its
+        words (or words starting with them) are included.
+        """
+        if query.strip():
+            source = (
+                "council_sessions JOIN council_sessions_search "
+                "ON council_sessions_search.rowid = council_sessions.id "
+                "WHERE council_sessions_search MATCH ? AND email = ?"
+            )
+            parameters = (fts_query(query), email)
+        else:
+            source = "council_sessions WHERE email = ?"
+            parameters = (email,)
+        total = self.execute(f"SELECT count(*) FROM {source}", parameters)[0][0]
+        rows = self.execute(
+            "SELECT id, council_sessions.question, advisors, council_sessions.summary, created_at "
+            f"FROM {source} ORDER BY id DESC LIMIT ? OFFSET ?",
+            (*parameters, page_size, page * page_size),
+        )
+        sessions = [
+            {**dict(zip(HISTORY_COLUMNS, row)), "advisors": json.loads(row["advisors"])}
+            for row in rows
+        ]
+        return sessions, total
+
+
+class SupabaseCouncilStore:
+    def __init__(self, client):
+        self.client = client
+
+    def list_advisors(self, email: str) -> Dict[str, Dict]:
+        response = (
+            self.client.table("council_advisors")
+            .select("role, description, expertise")
+            .eq("email", email)
+            .execute()
+        )
+        return {
+            row["role"]: {"description": row["description"], "expertise": row["expertise"]}
+            for row in response.data
+        }
+
+    def save_advisor(self, email: str, role: str, description: str, expertise: Dict[str, int]):
+        self.client.table("council_advisors").upsert(
+            {"email": email, "role": role, "description": description, "expertise": expertise},
+            on_conflict="email,role",
+        ).execute()
+
+    def delete_advisor(self, email: str, role: str):
+        self.client.table("council_advisors").delete().eq("email", email).eq("role", role).execute()
+
+    def find_session(self, email: str, key: str) -> Optional[Dict]:
+        response = (
+            self.client.table("council_sessions")
+            .select("result")
+            .eq("email", email)
+            .eq("request_key", key)
+            .limit(1)
+            .execute()
+        )
+        return response.data[0]["result"] if response.data else None
+
+    def save_session(
+        self, email: str, key: str, question: str, advisors: List[str], summary: str, result: Dict
+    ):
+        self.client.table("council_sessions").upsert(
+            {
+                "email": email,
+                "request_key": key,
+                "question": question,
+                "advisors": advisors,
+                "summary": summary,
+                "result": result,
+            },
+            on_conflict="email,request_key",
+        ).execute()
+
+    def history(
+        self, email: str, query: str = "", page: int = 0, page_size: int = COUNCIL_HISTORY_PAGE_SIZE
+    ) -> Tuple[List[Dict], int]:
+        request = (
+            self.client.table("council_sessions")
+            .select(", ".join(HISTORY_COLUMNS), count="exact")
+            .eq("email", email)
+        )
+        if query.strip():
+            request = request.text_search(
+                "search", query, options={"config": "english", "type": "websearch"}
+            )
+        response = (
+            request.order("id", desc=True)
+            .range(page * page_size, (page + 1) * page_size - 1)
+            .execute()
+        )
+        return response.data, response.count or 0
+
+
+@st.cache_resource
+def get_council_store():
+    if COUNCIL_STORE_BACKEND == "supabase":
+        from utils.credit_utils import get_supabase_client
+
+        return SupabaseCouncilStore(get_supabase_client())
+    return SQLiteCouncilStore()
@@ -1,114 +1,78 @@
+import asyncio
 import logging
-import re
-from typing import Union, List
-
-import anthropic
-from anthropic.types import TextBlock
+from typing import Optional
 
 from config import (
     ANTHROPIC_MODEL,
+    COUNCIL_SUMMARY_TOOL,
     COUNCIL_SUMMARY_USER_PROMPT_TEMPLATE,
     SUMMARY_MAX_TOKENS
 )
+from utils.anthropic_utils import get_anthropic_async_client
+from utils.retry_utils import call_with_retries
+from .utils import add_usage, read_tool_input
 
 
 logger = logging.getLogger(__name__)
-client = anthropic.Anthropic()
 
 
-def get_summary(question, responses):
+def format_digest(persona: str, response: dict) -> str:
+    """An advisor's summary, takeaways and confidence, without the full advice"""
+    takeaways = "\n".join(f"- {takeaway}" for takeaway in response["key_takeaways"])
+    return (
+        f"{persona} (confidence {response['confidence']}/10): "
+        f"{response['summary']}\n{takeaways}"
+    )
+
+
+def format_digests(responses: dict) -> str:
+    """The advisors' digests as text for the summarizer
+
+    Each digest is a few sentences however long the advice was, so the
+    summarizer's input grows only slowly with the number of advisors.
+    """
+    return "\n\n".join(
+        format_digest(persona, response) for persona, response in responses.items()
+    )
+
+
+async def get_summary_async(question, responses, usage=None) -> Optional[dict]:
+    """The summary, consensus_level, sentiments and key_takeaways, or None
+
+    sentiments maps each advisor to positive, neutral or negative. The
+    call's token usage is added to usage, a Counter, if given.
+    """
     summary_prompt = COUNCIL_SUMMARY_USER_PROMPT_TEMPLATE.format(
         question=question,
         responses=responses
     )
+    client = get_anthropic_async_client()
     try:
-        message = client.messages.create(
-            model=ANTHROPIC_MODEL,
-            max_tokens=SUMMARY_MAX_TOKENS,
-            messages=[{"role": "user", "content": summary_prompt}],
+        message = await call_with_retries(
+            lambda: client.messages.create(
+                model=ANTHROPIC_MODEL,
+                max_tokens=SUMMARY_MAX_TOKENS,
+                messages=[{"role": "user", "content": summary_prompt}],
+                tools=[COUNCIL_SUMMARY_TOOL],
+                tool_choice={"type": "tool", "name": COUNCIL_SUMMARY_TOOL["name"]},
+            ),
+            ANTHROPIC_MODEL,
         )
-        logger.info(f"Raw API response: {message}")
-        return message.content
     except Exception as e:
         logger.error(f"Error in get_summary: {e}", exc_info=True)
-        return "Error: Unable to generate summary."
-
-
-def parse_summary(summary: Union[str, List[TextBlock], TextBlock]) -> dict:
-    try:
-        logger.info(f"Original summary object: {type(summary)}")
+        return None
+    add_usage(usage, message)
 
-        # Handle TextBlock object or list of TextBlocks
-        if (
-            isinstance(summary, list)
-            and len(summary) > 0
-            and isinstance(summary[0], TextBlock)
-        ):
-            summary = summary[0].text
-        elif isinstance(summary, TextBlock):
-            summary = summary.text
-        elif isinstance(summary, list):
-            summary = "\n".join(str(item) for item in summary)
-        elif not isinstance(summary, str):
-            summary = str(summary)
+    summary = read_tool_input(message, COUNCIL_SUMMARY_TOOL)
+    if summary is None:
+        return None
+    return {
+        **summary,
+        "sentiments": {
+            item["advisor"]: item["sentiment"] for item in summary["sentiments"]
+        },
+    }
 
-        logger.info(
-            f"Processed summary text: {summary[:100]}..."
-        )  # Log first 100 characters
 
-        lines = summary.split("\n")
-        parsed_summary = {
-            "summary": "Not available",
-            "consensus_level": 5,
-            "sentiments": {},
-            "key_takeaways": [],
-        }
-        current_section = None
-
-        for line in lines:
-            line = line.strip()
-            logger.debug(f"Processing line: {line}")
-            if line.startswith("SUMMARY:"):
-                current_section = "summary"
-                parsed_summary[current_section] = line.split(":", 1)[1].strip()
-                logger.info(
-                    f"Found summary: {parsed_summary[current_section][:50]}..."
-                )
-            elif line.startswith("CONSENSUS_LEVEL:"):
-                try:
-                    parsed_summary["consensus_level"] = int(
-                        re.search(r"\d+", line).group()
-                    )
-                    logger.info(
-                        f"Found consensus level: {parsed_summary['consensus_level']}"
-                    )
-                except (ValueError, AttributeError):
-                    logger.warning(
-                        "Could not parse consensus level, using default value of 5"
-                    )
-            elif line.startswith("SENTIMENTS:"):
-                current_section = "sentiments"
-            elif line.startswith("KEY_TAKEAWAYS:"):
-                current_section = "key_takeaways"
-            elif current_section == "sentiments" and ":" in line:
-                persona, sentiment = line.split(":", 1)
-                parsed_summary[current_section][
-                    persona.strip()
-                ] = sentiment.strip()
-                logger.info(
-                    f"Found sentiment for {persona.strip()}: {sentiment.strip()}"
-                )
-            elif current_section == "key_takeaways" and line.startswith("-"):
-                parsed_summary[current_section].append(line[1:].strip())
-                logger.info(f"Found key takeaway: {line[1:].strip()}")
-
-        logger.info(f"Final parsed summary: {parsed_summary}")
-        return parsed_summary
-    except Exception as e:
-        logger.error(f"Error in parse_summary: {e}", exc_info=True)
-        return {
-            "summary": "Error: Unable to parse summary.",
-            "consensus_level": 5,
-            "sentiments": {},
-            "key_takeaways": [],
-        }
+def get_summary(question, responses) -> Optional[dict]:
+    return asyncio.run(get_summary_async(question, responses))
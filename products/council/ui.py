@@ -1,6 +1,6 @@
 import streamlit as st
-from config import DEFAULT_PERSONAS
-from .state import add_custom_advisor, remove_custom_advisor
+from config import COUNCIL_DEBATE_MAX_ROUNDS, COUNCIL_HISTORY_PAGE_SIZE, DEFAULT_PERSONAS
+from .state import add_custom_advisor, get_history, remove_custom_advisor
 
 
 def reset_step():
@@ -28,7 +28,18 @@ def render_ui():
 
     max_tokens = st.slider("Max tokens per response", 100, 1000, 800, on_change=reset_step)
 
-    return question, selected_personas, max_tokens
+    rounds = 1
+    if st.toggle(
+        "Debate",
+        on_change=reset_step,
+        help="Advisors see and respond to each other's positions over several "
+        "rounds, stopping early once their consensus stops changing.",
+    ):
+        rounds = st.slider(
+            "Max debate rounds", 2, COUNCIL_DEBATE_MAX_ROUNDS, 3, on_change=reset_step
+        )
+
+    return question, selected_personas, max_tokens, rounds
 
 
 def render_advisor_management():
@@ -56,36 +67,72 @@ def render_advisor_management():
             st.rerun()
 
 
+def reset_history_page():
+    st.session_state.history_page = 1
+
+
 def render_history():
     st.sidebar.title("Question History")
-    for i, item in enumerate(reversed(st.session_state.council_history), 1):
-        if st.sidebar.checkbox(
-            f"Q{i}: {item['question'][:30]}...", key=f"history_{i}"
-        ):
-            st.sidebar.write(f"Advisors: {', '.join(item['advisors'])}")
-            st.sidebar.write(f"Summary: {item['summary'][:100]}...")
+    query = st.sidebar.text_input(
+        "Search questions and summaries", on_change=reset_history_page
+    )
+    # Only one page of sessions is loaded; the page widget is drawn below it
+    page = st.session_state.get("history_page", 1)
+    sessions, total = get_history(query, page - 1)
+
+    if not total:
+        st.sidebar.caption("No matching questions." if query else "No questions yet.")
+    for session in sessions:
+        with st.sidebar.expander(session["question"][:60]):
+            st.write(f"Advisors: {', '.join(session['advisors'])}")
+            st.write(f"Summary: {session['summary']}")
+            st.caption(session["created_at"])
+
+    n_pages = -(-total // COUNCIL_HISTORY_PAGE_SIZE)
+    if n_pages > 1:
+        st.session_state.history_page = min(page, n_pages)
+        st.sidebar.number_input(
+            f"Page (of {n_pages})", 1, n_pages, key="history_page"
+        )
 
 
 def display_advisor_response(persona, response):
     st.subheader(f"{persona}'s Advice:")
-    st.markdown(response)
+    st.markdown(response["advice"])
+    st.markdown(f"**Summary:** {response['summary']}")
+    st.markdown(
+        "**Key Takeaways:**\n"
+        + "\n".join(f"- {takeaway}" for takeaway in response["key_takeaways"])
+    )
+    st.write(f"Confidence: {response['confidence']}/10")
     st.markdown("---")
 
 
-def display_summary(parsed_summary):
-    st.subheader("Summary of Advice")
-    st.markdown(parsed_summary.get("summary", "Summary not available."))
-    st.progress(parsed_summary.get("consensus_level", 5) / 10)
-    st.write(
-        f"Consensus Level: {parsed_summary.get('consensus_level', 'N/A')}/10"
+def display_cached_response(persona, hit):
+    st.caption(
+        f'{persona} answered a similar question before: "{hit.question}" '
+        f"({hit.similarity:.0%} similar)"
     )
+    display_advisor_response(persona, hit.response)
+
+
+def display_consensus(debate_round, score):
+    st.write(f"Consensus after round {debate_round}: {score:.2f}")
+    st.markdown("---")
+
+
+def display_summary(summary):
+    st.subheader("Summary of Advice")
+    st.markdown(summary["summary"])
+    st.progress(summary["consensus_level"] / 10)
+    st.write(f"Consensus Level: {summary['consensus_level']}/10")
 
     with st.expander("Response Sentiments"):
-        for persona, sentiment in parsed_summary.get("sentiments", {}).items():
+        for persona, sentiment in summary["sentiments"].items():
             st.write(f"{persona}: {sentiment}")
 
     with st.expander("Key Takeaways"):
-        for takeaway in parsed_summary.get("key_takeaways", []):
+        for takeaway in summary["key_takeaways"]:
             st.markdown(f"- {takeaway}")
 
 
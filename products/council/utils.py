@@ -1,20 +1,32 @@
 import logging
-import re
+
+import jsonschema
 
 logger = logging.getLogger(__name__)
 
 
-def parse_response(response):
-    if not isinstance(response, str):
-        response = str(response)
+def read_tool_input(message, tool):
+    """The input of the message's call to tool, validated against its schema
 
-    match = re.search(
-        r"TextBlock\(text=[\"'](.*?)[\"']\)", response, re.DOTALL
+    Returns None when the model didn't call the tool or its input doesn't
+    match the schema, e.g. because it was cut off by max_tokens.
+    """
+    for block in message.content:
+        if block.type == "tool_use" and block.name == tool["name"]:
+            try:
+                jsonschema.validate(block.input, tool["input_schema"])
+            except jsonschema.ValidationError as e:
+                logger.warning(f"Invalid {tool['name']} input: {e.message}")
+                return None
+            return block.input
+    logger.warning(
+        f"No {tool['name']} call in the response (stop reason: {message.stop_reason})"
     )
-    content = match.group(1) if match else response
+    return None
 
-    return (
-        re.sub(r",\s*type='text'?\s*$", "", content)
-        .replace("\\n", "\n")
-        .strip()
-    )
+
+def add_usage(usage, message):
+    """Adds the message's input and output tokens to usage, a Counter, if given"""
+    if usage is not None:
+        usage["input_tokens"] += message.usage.input_tokens
+        usage["output_tokens"] += message.usage.output_tokens
@@ -0,0 +1,222 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import LIKERT_LABELS
+from products.survey.demographics import DEMOGRAPHIC_LABELS, demographic_codes
+
+
+MAX_CACHED_RUNS = 32
+
+
+def dimension_codes(df: pd.DataFrame, dimension: str) -> Tuple[np.ndarray, List[str]]:
+    """Integer codes and their labels for one breakdown dimension"""
+    if dimension in DEMOGRAPHIC_LABELS:
+        return demographic_codes(df, dimension), list(DEMOGRAPHIC_LABELS[dimension])
+    codes, uniques = pd.factorize(df[dimension], sort=True)
+    return codes, [str(u) for u in uniques]
+
+
+class LikertAggregates:
+    """Counts of every Likert score in every combination of dimension levels
+
+    Built with a single np.bincount over combined codes; every marginal and
+    crosstab is then a sum over axes of the joint count array. Other closed
+    answers, such as multiple choice options or themes, work the same way
+    with their own answer_labels.
+    """
+
+    def __init__(
+        self,
+        counts: np.ndarray,
+        dimensions: Dict[str, List[str]],
+        answer_labels: Sequence[str] = LIKERT_LABELS,
+    ):
+        # counts has one axis per dimension (with a trailing unknown level)
+        # and a last axis of length len(answer_labels)
+        self.counts = counts
+        self.dimensions = dimensions
+        self.answer_labels = list(answer_labels)
+
+    @classmethod
+    def from_codes(
+        cls,
+        scores: np.ndarray,
+        codes: Dict[str, np.ndarray],
+        labels: Dict[str, List[str]],
+        answer_labels: Sequence[str] = LIKERT_LABELS,
+    ) -> "LikertAggregates":
+        n_scores = len(answer_labels)
+        shape, code_arrays = [], []
+        for name, dimension_codes in codes.items():
+            n_levels = len(labels[name]) + 1  # the last level collects unknowns
+            code_arrays.append(
+                np.where(dimension_codes < 0, n_levels - 1, dimension_codes)
+            )
+            shape.append(n_levels)
+        shape.append(n_scores)
+        code_arrays.append(np.asarray(scores, dtype=np.int64) - 1)
+
+        combined = np.ravel_multi_index(code_arrays, shape)
+        counts = np.bincount(combined, minlength=int(np.prod(shape))).reshape(shape)
+        return cls(counts, dict(labels), answer_labels)
+
+    @classmethod
+    def from_responses(
+        cls,
+        df: pd.DataFrame,
+        dimensions: Optional[List[str]] = None,
+        value_column: str = "score",
+        answer_labels: Sequence[str] = LIKERT_LABELS,
+    ) -> "LikertAggregates":
+        """Aggregates of value_column, which holds either 1-based answer
+        numbers or the answer labels themselves"""
+        if dimensions is None:
+            dimensions = [
+                dim
+                for dim in ["age", "income", "state", "backend"]
+                if dim in df.columns
+            ]
+        codes, labels = {}, {}
+        for dimension in dimensions:
+            codes[dimension], labels[dimension] = dimension_codes(df, dimension)
+        values = df[value_column]
+        if pd.api.types.is_numeric_dtype(values):
+            scores = values.to_numpy()
+        else:
+            scores = pd.Categorical(values, categories=answer_labels).codes + 1
+        return cls.from_codes(scores, codes, labels, answer_labels)
+
+    @classmethod
+    def merge(cls, parts: Sequence["LikertAggregates"]) -> "LikertAggregates":
+        """Aggregates of the union of disjoint sets of responses, such as the
+        shards of a survey, from theirs
+
+        Demographic levels are fixed, so their counts add up axis by axis;
+        other dimensions (e.g. backend) get the sorted union of the parts'
+        levels, with zero counts where a part has no such level.
+        """
+        answer_labels = parts[0].answer_labels
+        if any(part.answer_labels != answer_labels for part in parts):
+            raise ValueError("Only aggregates of the same answers can be merged.")
+        dimensions = {}
+        for name in parts[0].dimensions:
+            if name in DEMOGRAPHIC_LABELS:
+                dimensions[name] = list(DEMOGRAPHIC_LABELS[name])
+            else:
+                dimensions[name] = sorted(
+                    {label for part in parts for label in part.dimensions[name]}
+                )
+
+        shape = [len(labels) + 1 for labels in dimensions.values()]
+        counts = np.zeros(shape + [len(answer_labels)], dtype=np.int64)
+        for part in parts:
+            index = []
+            for name, labels in dimensions.items():
+                positions = {label: i for i, label in enumerate(labels)}
+                index.append(
+                    [positions[label] for label in part.dimensions[name]] + [len(labels)]
+                )
+            index.append(np.arange(len(answer_labels)))
+            # Every level maps to a distinct position, so += adds each count once
+            counts[np.ix_(*index)] += part.counts
+        return cls(counts, dimensions, answer_labels)
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def crosstab(self, *dimensions: str, include_unknown: bool = False) -> np.ndarray:
+        """Counts with one axis per requested dimension plus a Likert axis"""
+        names = list(self.dimensions)
+        other_axes = tuple(i for i, name in enumerate(names) if name not in dimensions)
+        counts = self.counts.sum(axis=other_axes)
+        kept = [name for name in names if name in dimensions]
+        counts = np.transpose(
+            counts, [kept.index(d) for d in dimensions] + [len(dimensions)]
+        )
+        if not include_unknown:
+            counts = counts[tuple(slice(0, -1) for _ in dimensions)]
+        return counts
+
+    def overall(self) -> np.ndarray:
+        return self.crosstab(include_unknown=True)
+
+    def shares(self, *dimensions: str) -> np.ndarray:
+        counts = self.crosstab(*dimensions)
+        totals = counts.sum(axis=-1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return counts / totals
+
+    def response_counts(self) -> pd.DataFrame:
+        """Overall shares in the format of analyze_responses"""
+        counts = self.overall()
+        return pd.DataFrame(
+            {
+                "likert_label": self.answer_labels,
+                "percentage": counts / max(counts.sum(), 1),
+            }
+        )
+
+    def level_labels(self, *dimensions: str) -> List[str]:
+        """Row labels of the flattened crosstab, e.g. "18-24 / 30,000-59,999" """
+        if len(dimensions) == 1:
+            return list(self.dimensions[dimensions[0]])
+        return list(
+            pd.MultiIndex.from_product([self.dimensions[d] for d in dimensions]).map(
+                " / ".join
+            )
+        )
+
+    def pivot(self, *dimensions: str) -> pd.DataFrame:
+        """Shares by one or more dimensions in the format of create_pivot_table
+
+        Crossed dimensions are flattened into one row per combination, labelled
+        like "18-24 / 30,000-59,999" in a column named after the dimensions.
+        """
+        shares = self.shares(*dimensions).reshape(-1, len(self.answer_labels))
+        pivot = pd.DataFrame(shares, columns=self.answer_labels)
+        pivot.insert(0, "_".join(dimensions), self.level_labels(*dimensions))
+        return pivot
+
+    def to_frame(self, *dimensions: str) -> pd.DataFrame:
+        """Long table of counts and shares for a breakdown, e.g. for export"""
+        counts = self.crosstab(*dimensions)
+        index = pd.MultiIndex.from_product(
+            [self.dimensions[d] for d in dimensions] + [self.answer_labels],
+            names=list(dimensions) + ["likert_label"],
+        )
+        frame = pd.DataFrame({"count": counts.reshape(-1)}, index=index)
+        totals = frame.groupby(level=list(dimensions))["count"].transform("sum")
+        frame["share"] = frame["count"] / totals.where(totals > 0)
+        return frame.reset_index()
+
+
+aggregates_cache = OrderedDict()
+
+
+def get_likert_aggregates(
+    run_id: str,
+    df: pd.DataFrame,
+    value_column: str = "score",
+    answer_labels: Sequence[str] = LIKERT_LABELS,
+) -> LikertAggregates:
+    """Aggregates for a survey run, computed once per run id"""
+    if run_id in aggregates_cache:
+        aggregates_cache.move_to_end(run_id)
+        return aggregates_cache[run_id]
+    aggregates = LikertAggregates.from_responses(
+        df, value_column=value_column, answer_labels=answer_labels
+    )
+    cache_likert_aggregates(run_id, aggregates)
+    return aggregates
+
+
+def cache_likert_aggregates(run_id: str, aggregates: LikertAggregates) -> None:
+    """Stores aggregates computed elsewhere, e.g. merged from survey shards"""
+    aggregates_cache[run_id] = aggregates
+    aggregates_cache.move_to_end(run_id)
+    if len(aggregates_cache) > MAX_CACHED_RUNS:
+        aggregates_cache.popitem(last=False)
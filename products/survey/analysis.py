@@ -1,80 +1,201 @@
+import itertools
+import math
+from typing import Optional
+
 import pandas as pd
-from config import LIKERT_LABELS, AGE_BINS, INCOME_BINS
+from config import LIKERT_LABELS
 import numpy as np
-import locale
 
-# Set locale for number formatting
-locale.setlocale(locale.LC_ALL, "")
+from products.survey.aggregation import LikertAggregates, dimension_codes
+from products.survey.demographics import DEMOGRAPHIC_LABELS
 
 
 def analyze_responses(df: pd.DataFrame) -> pd.DataFrame:
-    # Likert scale mapping
-    likert_mapping = {i + 1: LIKERT_LABELS[i] for i in range(5)}
-    df["likert_label"] = df["score"].map(likert_mapping)
-
-    # Calculate the percentage of total responses for each Likert label
-    response_counts = (
-        df["likert_label"].value_counts(normalize=True).reset_index()
-    )
-    response_counts.columns = ["likert_label", "percentage"]
-
-    return response_counts
+    # Share of total responses for each Likert label
+    return LikertAggregates.from_responses(df, dimensions=[]).response_counts()
 
 
 def create_pivot_table(df: pd.DataFrame, groupby_var: str) -> pd.DataFrame:
-    if groupby_var == "age":
-        bins = AGE_BINS
-    elif groupby_var == "income":
-        bins = INCOME_BINS
-    else:
+    if groupby_var not in DEMOGRAPHIC_LABELS and groupby_var not in df.columns:
         raise ValueError(
-            "Unsupported groupby variable. Supported variables are 'age' and 'income'."
+            f"Unsupported groupby variable {groupby_var!r}. Supported variables "
+            f"are {', '.join(DEMOGRAPHIC_LABELS)} and columns of the responses."
         )
+    # Grouping on integer codes, with labels from the shared label table
+    return LikertAggregates.from_responses(df, dimensions=[groupby_var]).pivot(
+        groupby_var
+    )
 
-    labels = generate_labels(bins, groupby_var)
 
-    # Create likert_label column if it doesn't exist
-    if "likert_label" not in df.columns:
-        likert_mapping = {i + 1: LIKERT_LABELS[i] for i in range(5)}
-        df["likert_label"] = df["score"].map(likert_mapping)
+# Respondents are post-stratified to the population's age x income cells
+POSTSTRATIFICATION_VARS = ("age", "income")
+BOOTSTRAP_CHUNK_SIZE = 1_000_000  # Poisson draws per chunk of replicates
 
-    pivot = df.pivot_table(
-        values="score",
-        index=pd.cut(df[groupby_var], bins=bins, labels=labels),
-        columns="likert_label",
-        aggfunc="count",
-        fill_value=0,
-        observed=False,
-    )
 
-    # Ensure all Likert labels are present
-    for label in LIKERT_LABELS:
-        if label not in pivot.columns:
-            pivot[label] = 0
+def combined_dimension_codes(df: pd.DataFrame, dimensions, labels=None):
+    """One integer code per row for the crossing of several dimensions
 
-    # Normalize the pivot table
-    pivot = pivot.div(pivot.sum(axis=1), axis=0)
+    Rows outside any dimension's levels get -1. Pass the labels of another
+    frame (e.g. the respondents) to code a frame (e.g. the population)
+    against the same levels.
+    """
+    if not dimensions:
+        return np.zeros(len(df), dtype=np.int64), [[]], [""]
+    codes, all_labels = [], []
+    for i, dimension in enumerate(dimensions):
+        dimension_labels = None if labels is None else labels[i]
+        if dimension in DEMOGRAPHIC_LABELS or dimension_labels is None:
+            dim_codes, dim_labels = dimension_codes(df, dimension)
+        else:
+            dim_labels = dimension_labels
+            dim_codes = pd.Categorical(
+                df[dimension].astype(str), categories=dim_labels
+            ).codes.astype(np.int64)
+        codes.append(dim_codes)
+        all_labels.append(dim_labels)
+    shape = [len(dim_labels) for dim_labels in all_labels]
+    valid = np.all([dim_codes >= 0 for dim_codes in codes], axis=0)
+    combined = np.full(len(df), -1, dtype=np.int64)
+    combined[valid] = np.ravel_multi_index([c[valid] for c in codes], shape)
+    flat_labels = [" / ".join(levels) for levels in itertools.product(*all_labels)]
+    return combined, all_labels, flat_labels
 
-    return pivot.reset_index()
 
+def poisson_table(bits: int = 16) -> np.ndarray:
+    """Inverse CDF of Poisson(1) at the midpoints of 2**bits equal steps
 
-def generate_labels(bins, groupby_var):
-    labels = []
-    for i in range(len(bins) - 1):
-        if bins[i + 1] == np.inf:
-            if groupby_var == "income":
-                labels.append(
-                    f"{locale.format_string('%d', bins[i], grouping=True)}+"
-                )
-            else:
-                labels.append(f"{bins[i]}+")
-        else:
-            if groupby_var == "income":
-                start = locale.format_string("%d", bins[i], grouping=True)
-                end = locale.format_string(
-                    "%d", bins[i + 1] - 1, grouping=True
-                )
-                labels.append(f"{start}-{end}")
-            else:
-                labels.append(f"{bins[i]}-{bins[i+1] - 1}")
-    return labels
+    Indexing it with uniform random integers draws Poisson(1) replicate
+    weights many times faster than rng.poisson, with probabilities off by
+    at most 2**-bits.
+    """
+    cdf = np.cumsum([math.exp(-1) / math.factorial(k) for k in range(20)])
+    return np.searchsorted(cdf, (np.arange(2**bits) + 0.5) / 2**bits).astype(float)
+
+
+POISSON_TABLE = poisson_table()
+
+
+def bootstrap_weighted_counts(codes, weights, n_codes, n_replicates, seed=0):
+    """Weighted counts per code, and the same under Poisson bootstrap replicates
+
+    Every row gets its own Poisson(1) copies in each replicate, and the
+    copies times the row weights are summed per code with one reduceat over
+    the rows sorted by code. Replicates are drawn in chunks of
+    BOOTSTRAP_CHUNK_SIZE rows x replicates, to bound memory.
+    """
+    point = np.bincount(codes, weights=weights, minlength=n_codes)
+    replicates = np.zeros((n_replicates, n_codes))
+    if len(codes) == 0:
+        return point, replicates
+
+    order = np.argsort(codes, kind="stable")
+    present, starts = np.unique(codes[order], return_index=True)
+    sorted_weights = np.asarray(weights, dtype=float)[order]
+    rng = np.random.default_rng(seed)
+    chunk = max(1, BOOTSTRAP_CHUNK_SIZE // len(codes))
+    copies = np.empty((min(chunk, n_replicates), len(codes)))
+    for start in range(0, n_replicates, chunk):
+        stop = min(start + chunk, n_replicates)
+        draws = rng.integers(0, len(POISSON_TABLE), (stop - start, len(codes)), np.uint16)
+        weighted = np.take(POISSON_TABLE, draws, out=copies[: stop - start], mode="wrap")
+        weighted *= sorted_weights
+        replicates[start:stop, present] = np.add.reduceat(weighted, starts, axis=1)
+    return point, replicates
+
+
+def replicate_quantiles(replicates: np.ndarray, q) -> np.ndarray:
+    """Quantiles over the replicates (axis 0), left NaN for levels that are
+    NaN in every replicate, e.g. those without respondents"""
+    observed = ~np.isnan(replicates).all(axis=0)
+    quantiles = np.full((len(q),) + replicates.shape[1:], np.nan)
+    quantiles[:, observed] = np.nanquantile(replicates[:, observed], q, axis=0)
+    return quantiles
+
+
+def weighted_likert_estimates(
+    df: pd.DataFrame,
+    by=(),
+    population: Optional[pd.DataFrame] = None,
+    weight_col: Optional[str] = None,
+    n_replicates: int = 1000,
+    alpha: float = 0.05,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Population-weighted Likert shares and mean score with bootstrap CIs
+
+    With a population frame (rows with a "weight" column, e.g. the filtered
+    perspectives), respondents are post-stratified to its age x income cell
+    totals, and every bootstrap replicate is post-stratified again. Without
+    one, rows are weighted by weight_col (or equally). Returns one row per
+    level of the `by` dimensions.
+    """
+    by = tuple(by)
+    by_codes, by_labels, by_flat_labels = combined_dimension_codes(df, by)
+    n_by = len(by_flat_labels)
+    scores = df["score"].to_numpy(dtype=np.int64) - 1
+    n_scores = len(LIKERT_LABELS)
+
+    if population is not None:
+        cell_codes, cell_labels, cell_flat_labels = combined_dimension_codes(
+            df, POSTSTRATIFICATION_VARS
+        )
+        n_cells = len(cell_flat_labels)
+        population_cells, _, _ = combined_dimension_codes(
+            population, POSTSTRATIFICATION_VARS, cell_labels
+        )
+        in_cells = population_cells >= 0
+        population_totals = np.bincount(
+            population_cells[in_cells],
+            weights=population["weight"].to_numpy()[in_cells],
+            minlength=n_cells,
+        )
+        weights = np.ones(len(df))
+    else:
+        cell_codes = np.zeros(len(df), dtype=np.int64)
+        n_cells = 1
+        weights = (
+            np.ones(len(df)) if weight_col is None else df[weight_col].to_numpy(float)
+        )
+
+    valid = (by_codes >= 0) & (cell_codes >= 0)
+    codes = np.ravel_multi_index(
+        [by_codes[valid], cell_codes[valid], scores[valid]],
+        (n_by, n_cells, n_scores),
+    )
+    point, replicates = bootstrap_weighted_counts(
+        codes, weights[valid], n_by * n_cells * n_scores, n_replicates, seed
+    )
+    # Point estimate first, then the replicates: (1 + R, by, cell, score)
+    counts = np.vstack([point, replicates]).reshape(-1, n_by, n_cells, n_scores)
+
+    if population is not None:
+        # Scale each cell so that it sums to the population total of the cell
+        respondents_per_cell = counts.sum(axis=(1, 3))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            factor = np.where(
+                respondents_per_cell > 0,
+                population_totals / respondents_per_cell,
+                0.0,
+            )
+    else:
+        factor = np.ones((len(counts), n_cells))
+    # Scaled and summed over cells in one pass: (1 + R, by, score)
+    counts = np.einsum("rbcs,rc->rbs", counts, factor)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = counts / counts.sum(axis=-1, keepdims=True)
+    means = shares @ np.arange(1, n_scores + 1)
+
+    lower_q, upper_q = alpha / 2, 1 - alpha / 2
+    estimates = pd.DataFrame({"n": np.bincount(by_codes[valid], minlength=n_by)})
+    if by:
+        estimates.insert(0, "_".join(by), by_flat_labels)
+    estimates["mean"] = means[0]
+    estimates["mean_lower"], estimates["mean_upper"] = replicate_quantiles(
+        means[1:], [lower_q, upper_q]
+    )
+    share_lower, share_upper = replicate_quantiles(shares[1:], [lower_q, upper_q])
+    for i, label in enumerate(LIKERT_LABELS):
+        estimates[label] = shares[0, :, i]
+        estimates[f"{label} lower"] = share_lower[:, i]
+        estimates[f"{label} upper"] = share_upper[:, i]
+    return estimates
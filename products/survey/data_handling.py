@@ -1,27 +1,78 @@
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-from typing import Tuple, List
-import streamlit as st
+from typing import List, Optional, Tuple
+
+from products.survey.demographics import CODE_COLUMNS, add_demographic_codes
+from products.survey.prompts import PERSONA_SLOTS
+
 
+# Next to the code rather than in the working directory, so scripts and
+# workers can run from anywhere. The Parquet table written by
+# scripts/make_perspectives.py is used when present, the CSV otherwise
+PERSPECTIVES_PATH = Path(__file__).resolve().parents[2] / "perspectives.parquet"
+LEGACY_PERSPECTIVES_PATH = PERSPECTIVES_PATH.with_suffix(".csv")
 
-@st.cache_data
+
+@lru_cache(maxsize=None)
 def load_perspectives_data() -> pd.DataFrame:
-    return pd.read_csv("perspectives.csv")
+    # Loaded on first use rather than at import, and shared rather than
+    # copied on every call (callers only read it). Bin and state codes are
+    # computed once here and carried through to the responses, so breakdowns
+    # are integer group-bys
+    if PERSPECTIVES_PATH.exists():
+        perspectives = pd.read_parquet(PERSPECTIVES_PATH)
+    else:
+        perspectives = pd.read_csv(LEGACY_PERSPECTIVES_PATH)
+    return add_demographic_codes(perspectives)
 
 
-perspectives_data = load_perspectives_data()
+def persona_attributes() -> List[str]:
+    """Columns of the perspectives table that prompts can add to the persona
+    sentence, such as sex or household size"""
+    reserved = {*PERSONA_SLOTS, "weight", *CODE_COLUMNS.values()}
+    return [
+        column for column in load_perspectives_data().columns if column not in reserved
+    ]
 
 
-def select_diverse_personas(
-    num_queries: int,
+def filter_perspectives(
     age_range: Tuple[int, int],
     income_range: Tuple[float, float],
-) -> List[dict]:
-    filtered_data = perspectives_data[
+) -> pd.DataFrame:
+    perspectives_data = load_perspectives_data()
+    return perspectives_data[
         (perspectives_data["age"] >= age_range[0])
         & (perspectives_data["age"] <= age_range[1])
         & (perspectives_data["income"] >= income_range[0])
         & (perspectives_data["income"] <= income_range[1])
     ]
-    return filtered_data.sample(
-        n=min(num_queries, len(filtered_data)), weights="weight"
-    ).to_dict("records")
+
+
+def sample_personas(
+    num_queries: int,
+    age_range: Tuple[int, int],
+    income_range: Tuple[float, float],
+    seed: Optional[int] = None,
+) -> pd.DataFrame:
+    filtered_data = filter_perspectives(age_range, income_range)
+    weights = filtered_data["weight"].to_numpy()
+    # pandas refuses weighted sampling without replacement once any weight is
+    # above 1/n of the total, which our weights are for a few hundred rows;
+    # numpy draws without replacement sequentially instead
+    n = min(num_queries, int(np.count_nonzero(weights)))
+    rows = np.random.default_rng(seed).choice(
+        len(filtered_data), size=n, replace=False, p=weights / weights.sum()
+    )
+    return filtered_data.iloc[rows].reset_index(drop=True)
+
+
+def select_diverse_personas(
+    num_queries: int,
+    age_range: Tuple[int, int],
+    income_range: Tuple[float, float],
+    seed: Optional[int] = None,
+) -> List[dict]:
+    return sample_personas(num_queries, age_range, income_range, seed).to_dict("records")
@@ -0,0 +1,67 @@
+from types import MappingProxyType
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from config import AGE_BINS, INCOME_BINS, STATES
+
+
+def bin_codes(values, bins) -> np.ndarray:
+    """Index of the [bins[i], bins[i+1]) interval each value falls in, -1 if none"""
+    values = np.asarray(values, dtype=float)
+    codes = np.searchsorted(bins, values, side="right") - 1
+    codes[(codes < 0) | (codes >= len(bins) - 1) | np.isnan(values)] = -1
+    return codes.astype(np.int8)
+
+
+def bin_labels(bins, groupby_var) -> List[str]:
+    labels = []
+    for start, end in zip(bins[:-1], bins[1:]):
+        if groupby_var == "income":
+            start_text = f"{int(start):,}"
+            end_text = "" if end == np.inf else f"{int(end) - 1:,}"
+        else:
+            start_text = f"{start}"
+            end_text = "" if end == np.inf else f"{end - 1}"
+        labels.append(f"{start_text}+" if end == np.inf else f"{start_text}-{end_text}")
+    return labels
+
+
+# Built once at import, and read-only, so every breakdown shares one table
+DEMOGRAPHIC_LABELS = MappingProxyType(
+    {
+        "age": tuple(bin_labels(AGE_BINS, "age")),
+        "income": tuple(bin_labels(INCOME_BINS, "income")),
+        "state": STATES,
+    }
+)
+STATE_INDEX = pd.Index(STATES)
+CODE_COLUMNS = MappingProxyType(
+    {dimension: f"{dimension}_code" for dimension in DEMOGRAPHIC_LABELS}
+)
+
+
+def compute_demographic_codes(df: pd.DataFrame, dimension: str) -> np.ndarray:
+    if dimension == "age":
+        return bin_codes(df["age"], AGE_BINS)
+    if dimension == "income":
+        return bin_codes(df["income"], INCOME_BINS)
+    if dimension == "state":
+        return STATE_INDEX.get_indexer(df["state"]).astype(np.int8)
+    raise ValueError(f"No demographic codes for {dimension!r}.")
+
+
+def demographic_codes(df: pd.DataFrame, dimension: str) -> np.ndarray:
+    """Precomputed codes when the frame carries them, computed otherwise"""
+    column = CODE_COLUMNS[dimension]
+    if column in df.columns:
+        return df[column].to_numpy()
+    return compute_demographic_codes(df, dimension)
+
+
+def add_demographic_codes(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds small integer code columns (-1 when out of range) for each dimension"""
+    for dimension, column in CODE_COLUMNS.items():
+        df[column] = compute_demographic_codes(df, dimension)
+    return df
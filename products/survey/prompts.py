@@ -1,43 +1,278 @@
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from numpy.dtypes import StringDType
+
 from config import LIKERT_LABELS
 
 
-def create_prompt(
-    persona: Dict,
-    statement: str,
-    question_type: str,
-    choices: Optional[List[str]] = None,
-) -> str:
-    persona_info = f"You are roleplaying as a {persona['age']}-year-old from {persona['state']} with annual income of ${persona['income']}."
-    general_instructions = "Respond to the following question based on this persona's likely perspective, beliefs, and experiences."
+GENERAL_INSTRUCTIONS = "Respond to the following question based on this persona's likely perspective, beliefs, and experiences."
+LIKERT_SCALE = ", ".join(f"{i+1} = {label}" for i, label in enumerate(LIKERT_LABELS))
+
+# The persona sentence is split around its slots. Each slot starts and ends
+# where the tokenizer's pre-tokenization always splits (digits between
+# non-digits; a word or "$" together with its leading space), so a prompt's
+# token count is the sum of the counts of its static pieces and slot values.
+# Attribute values may end in punctuation, so they are counted together with
+# the newline that follows them (see PromptTemplate.count_tokens).
+PERSONA_PIECES = (
+    "You are roleplaying as a ",
+    "-year-old from",
+    " with annual income of",
+    ".",
+)
+PERSONA_SLOTS = ("age", "state", "income")
+
+# Any other column of the perspectives table can follow the sentence as a
+# "Label: value" line; these are the labels of the known ones, and other
+# columns are labelled after their name
+ATTRIBUTE_LABELS = {
+    "sex": "Sex",
+    "race": "Race",
+    "household_size": "Household size",
+    "employment": "Employment",
+}
+MISSING_VALUE = "unknown"
+
+
+def attribute_label(attribute: str) -> str:
+    return ATTRIBUTE_LABELS.get(attribute, attribute.replace("_", " ").capitalize())
+
+
+def format_slot(slot: str, values: pd.Series) -> pd.Series:
+    """Slot values as strings, compactly: numbers are rounded to whole
+    numbers, booleans are yes/no and text is whitespace-normalized"""
+    if slot == "age":
+        return values.round().astype("int64").astype(str)
+    if slot == "state":
+        return " " + values.astype(str)
+    if slot == "income":
+        return " $" + values.round().astype("int64").astype(str)
+    formatted = pd.Series(" " + MISSING_VALUE, index=values.index, dtype=object)
+    present = values.notna()
+    if pd.api.types.is_bool_dtype(values):
+        formatted[present] = np.where(values[present].astype(bool), " yes", " no")
+    elif pd.api.types.is_numeric_dtype(values):
+        formatted[present] = " " + values[present].round().astype("int64").astype(str)
+    else:
+        formatted[present] = " " + values[present].astype(str).map(normalize_whitespace)
+    return formatted
+
+
+def format_slot_value(slot: str, value) -> str:
+    """format_slot for a single value, by the same rules without a Series"""
+    if slot == "age":
+        return str(int(round(value)))
+    if slot == "state":
+        return f" {value}"
+    if slot == "income":
+        return f" ${int(round(value))}"
+    if pd.isna(value):
+        return " " + MISSING_VALUE
+    if isinstance(value, (bool, np.bool_)):
+        return " yes" if value else " no"
+    if isinstance(value, (int, float, np.number)):
+        return f" {int(round(value))}"
+    return " " + normalize_whitespace(str(value))
+
+
+def normalize_whitespace(text: str) -> str:
+    return " ".join(text.split())
+
+
+def persona_template(attributes: Sequence[str] = ()) -> Tuple[List[str], Tuple[str, ...]]:
+    """Pieces and slots of the persona sentence followed by a line for each
+    attribute; the last piece is left open for the question"""
+    pieces = list(PERSONA_PIECES)
+    for attribute in attributes:
+        if attribute in PERSONA_SLOTS:
+            raise ValueError(f"{attribute!r} is already in the persona sentence.")
+        pieces[-1] += f"\n{attribute_label(attribute)}:"
+        pieces.append("")
+    return pieces, PERSONA_SLOTS + tuple(attributes)
+
+
+class PromptTemplate:
+    """A prompt with the statement filled in and persona slots left open
+
+    pieces and slots alternate: pieces[0] + slot 0 + pieces[1] + ... + pieces[-1].
+    """
+
+    def __init__(self, pieces: Sequence[str], slots: Sequence[str]):
+        if len(pieces) != len(slots) + 1:
+            raise ValueError("A template needs one more piece than it has slots.")
+        self.pieces = tuple(pieces)
+        self.slots = tuple(slots)
+        self.format = "{}".join(
+            piece.replace("{", "{{").replace("}", "}}") for piece in pieces
+        ).format
+
+    def slot_codes(self, personas: pd.DataFrame) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """For each slot, the code of every persona's value and the formatted
+        distinct values, so each distinct value is formatted only once"""
+        slot_codes = []
+        for slot in self.slots:
+            codes, uniques = pd.factorize(personas[slot], use_na_sentinel=False)
+            formatted = format_slot(slot, pd.Series(uniques))
+            slot_codes.append((codes, formatted.to_numpy(dtype=StringDType())))
+        return slot_codes
+
+    def render_many(self, personas: pd.DataFrame) -> List[str]:
+        """Prompts for every persona, concatenated column by column in numpy
+        rather than formatted row by row"""
+        rendered = np.full(len(personas), self.pieces[0], dtype=StringDType())
+        for (codes, values), piece in zip(self.slot_codes(personas), self.pieces[1:]):
+            rendered = np.strings.add(np.strings.add(rendered, values[codes]), piece)
+        return rendered.tolist()
+
+    def render(self, persona: Dict) -> str:
+        return self.format(*(format_slot_value(slot, persona[slot]) for slot in self.slots))
+
+    def count_tokens(self, personas: pd.DataFrame, encoding) -> np.ndarray:
+        """Exact tokens in each persona's prompt, without encoding the prompts
 
+        The static pieces are encoded once and each distinct slot value once.
+        Punctuation ending a text value is pre-tokenized together with the
+        newlines after it (".\\n"), so the newlines that start a piece are
+        encoded with the values before them; the letter that follows always
+        starts a new pre-token.
+        """
+        newlines = [piece[: len(piece) - len(piece.lstrip("\n"))] for piece in self.pieces[1:]]
+        static = [self.pieces[0]] + [piece.lstrip("\n") for piece in self.pieces[1:]]
+        static_tokens = sum(len(t) for t in encoding.encode_ordinary_batch(static))
+        counts = np.full(len(personas), static_tokens, dtype=np.int64)
+        for (codes, values), newline in zip(self.slot_codes(personas), newlines):
+            unique_counts = np.fromiter(
+                (
+                    len(t)
+                    for t in encoding.encode_ordinary_batch(
+                        np.strings.add(values, newline).tolist()
+                    )
+                ),
+                dtype=np.int64,
+                count=len(values),
+            )
+            counts += unique_counts[codes]
+        return counts
+
+
+@lru_cache(maxsize=64)
+def compile_prompt(
+    question_type: str,
+    statement: str,
+    choices: Optional[Tuple[str, ...]] = None,
+    attributes: Tuple[str, ...] = (),
+) -> PromptTemplate:
+    """The template for a question, compiled once per (type, statement,
+    choices, attributes)"""
+    statement = normalize_whitespace(statement)
     if question_type == "likert":
-        likert_scale = ", ".join(
-            [f"{i+1} = {label}" for i, label in enumerate(LIKERT_LABELS)]
-        )
-        return f"""{persona_info}
-        {general_instructions}
-        Use a 5-point scale where {likert_scale}.
-        Statement: "{statement}"
-        How much do you agree with the statement?
-        Respond with ONLY a single number from 1 to 5, no additional explanation."""
+        lines = [
+            GENERAL_INSTRUCTIONS,
+            f"Use a 5-point scale where {LIKERT_SCALE}.",
+            f'Statement: "{statement}"',
+            "How much do you agree with the statement?",
+            "Respond with ONLY a single number from 1 to 5, no additional explanation.",
+        ]
 
     elif question_type == "multiple_choice":
         if choices is None:
             raise ValueError(
                 "Choices must be provided for multiple choice questions."
             )
-        numbered_choices = "\n".join(
-            [f"{i+1}. {choice}" for i, choice in enumerate(choices)]
-        )
-        return f"""{persona_info}
-        {general_instructions}
-        Question: "{statement}"
-        Choose from the following options:
-        {numbered_choices}
-        Respond with ONLY the single number of your chosen option (1, 2, 3, etc.), nothing else. Do not include the choice text or any explanation."""
+        lines = [
+            GENERAL_INSTRUCTIONS,
+            f'Question: "{statement}"',
+            "Choose from the following options:",
+            *(f"{i+1}. {normalize_whitespace(choice)}" for i, choice in enumerate(choices)),
+            "Respond with ONLY the single number of your chosen option (1, 2, 3, etc.), nothing else. Do not include the choice text or any explanation.",
+        ]
+
+    elif question_type == "open_ended":
+        lines = [
+            GENERAL_INSTRUCTIONS,
+            f'Question: "{statement}"',
+            "Answer in one or two short sentences, in this persona's own words, giving your view and the main reason for it.",
+        ]
 
     else:
         raise ValueError(
-            "Unsupported question type. Supported types are 'likert' and 'multiple_choice'."
+            "Unsupported question type. Supported types are 'likert', 'multiple_choice' and 'open_ended'."
+        )
+
+    pieces, slots = persona_template(attributes)
+    pieces[-1] += "\n" + "\n".join(lines)
+    return PromptTemplate(pieces, slots)
+
+
+def attribute_token_counts(
+    question_type: str,
+    statement: str,
+    choices: Optional[Tuple[str, ...]],
+    attributes: Sequence[str],
+    personas: pd.DataFrame,
+    encoding,
+) -> pd.DataFrame:
+    """What each attribute adds to the prompts, in the order given
+
+    One row per attribute with the tokens it adds per prompt on average and
+    in total, and the largest prompt once it (and those before it) are in.
+    """
+    counts = compile_prompt(question_type, statement, choices).count_tokens(
+        personas, encoding
+    )
+    rows = []
+    for i, attribute in enumerate(attributes):
+        with_attribute = compile_prompt(
+            question_type, statement, choices, tuple(attributes[: i + 1])
+        ).count_tokens(personas, encoding)
+        added = with_attribute - counts
+        rows.append(
+            {
+                "attribute": attribute,
+                "tokens_per_prompt": float(added.mean()) if len(added) else 0.0,
+                "total_tokens": int(added.sum()),
+                "max_prompt_tokens": int(with_attribute.max()) if len(added) else 0,
+            }
         )
+        counts = with_attribute
+    return pd.DataFrame(
+        rows,
+        columns=["attribute", "tokens_per_prompt", "total_tokens", "max_prompt_tokens"],
+    )
+
+
+def create_prompts(
+    personas: Union[List[Dict], pd.DataFrame],
+    statement: str,
+    question_type: str,
+    choices: Optional[List[str]] = None,
+    attributes: Sequence[str] = (),
+) -> List[str]:
+    if not isinstance(personas, pd.DataFrame):
+        personas = pd.DataFrame(personas, columns=[*PERSONA_SLOTS, *attributes])
+    template = compile_prompt(
+        question_type,
+        statement,
+        tuple(choices) if choices is not None else None,
+        tuple(attributes),
+    )
+    return template.render_many(personas)
+
+
+def create_prompt(
+    persona: Dict,
+    statement: str,
+    question_type: str,
+    choices: Optional[List[str]] = None,
+    attributes: Sequence[str] = (),
+) -> str:
+    template = compile_prompt(
+        question_type,
+        statement,
+        tuple(choices) if choices is not None else None,
+        tuple(attributes),
+    )
+    return template.render(persona)
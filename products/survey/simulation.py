@@ -1,16 +1,47 @@
-from typing import List, Dict, Callable
-import streamlit as st
-from utils.openai_utils import run_batch_query
+import logging
+from typing import List, Dict, Callable, Optional, Union
+import numpy as np
+import pandas as pd
+from utils.backend_utils import BackendPool
+from utils.openai_utils import run_batch_query, run_pooled_batch_query
+from config import (
+    SURVEY_HEDGE_PERCENTILE,
+    SURVEY_MAX_CONCURRENCY,
+    SURVEY_MAX_HEDGE_FRACTION,
+    SURVEY_MAX_TOKENS,
+)
 
 
-def parse_numeric_response(response, max_value):
-    try:
-        score = int(response.strip())
-        if 1 <= score <= max_value:
-            return score
-    except ValueError:
-        pass
-    return None
+MAX_WARNING_EXAMPLES = 3
+
+logger = logging.getLogger(__name__)
+
+
+def parse_numeric_responses(responses: pd.Series, max_value: int) -> pd.Series:
+    """Integer answers between 1 and max_value, NaN for anything else"""
+    values = pd.to_numeric(
+        responses.str.extract(r"^\s*([+-]?\d+)\s*$", expand=False),
+        errors="coerce",
+    )
+    return values.where((values >= 1) & (values <= max_value))
+
+
+def parse_choice_responses(responses: pd.Series, choices: List[str]) -> pd.Series:
+    """1-based choice numbers, NaN for anything else
+
+    Accepts the number on its own or leading the answer ("2", "2.", "2) Dogs").
+    The text of a choice isn't matched: answers get a single token
+    (SURVEY_MAX_TOKENS), which fits the number but not the text.
+    """
+    numbers = pd.to_numeric(
+        responses.str.extract(r"^\s*(\d+)(?![\d,])", expand=False), errors="coerce"
+    )
+    return numbers.where((numbers >= 1) & (numbers <= len(choices))).astype(float)
+
+
+def summarize_failures(label: str, responses: pd.Series) -> str:
+    examples = responses.drop_duplicates().head(MAX_WARNING_EXAMPLES).tolist()
+    return f"{len(responses)} {label} (e.g. {', '.join(repr(e) for e in examples)})"
 
 
 def batch_simulate_responses(
@@ -18,53 +49,98 @@ def batch_simulate_responses(
     choices: List[str],
     num_queries: int,
     model_type: str,
-    personas: List[str],
+    personas: Union[List[Dict], pd.DataFrame],
     prompts: List[str],
     question_type: str,
     progress_callback: Callable[[float], None] = None,
-) -> List[Dict]:
+    backend_pool: Optional[BackendPool] = None,
+    warning_callback: Callable[[str], None] = None,
+    max_concurrency: int = SURVEY_MAX_CONCURRENCY,
+) -> pd.DataFrame:
+
+    max_tokens = SURVEY_MAX_TOKENS[question_type]
 
     # Run all prompts in a single batch
-    all_responses = run_batch_query(prompts, model_type, max_tokens=1)
+    if backend_pool is None:
+        all_responses = run_batch_query(
+            prompts,
+            model_type,
+            max_tokens=max_tokens,
+            hedge_percentile=SURVEY_HEDGE_PERCENTILE,
+            max_hedge_fraction=SURVEY_MAX_HEDGE_FRACTION,
+            max_concurrency=max_concurrency,
+        )
+        backends = [model_type] * len(all_responses)
+    else:
+        all_responses, backends = run_pooled_batch_query(
+            prompts,
+            backend_pool,
+            max_tokens=max_tokens,
+            hedge_percentile=SURVEY_HEDGE_PERCENTILE,
+            max_hedge_fraction=SURVEY_MAX_HEDGE_FRACTION,
+        )
 
     if progress_callback:
         progress_callback(1.0)  # Set progress to 100% after batch completion
 
-    valid_responses = []
-    for persona, response in zip(personas, all_responses):
-        if response.startswith("Error"):
-            st.warning(f"API Error: {response}")
-            continue
-        if question_type == "likert":
-            score = parse_numeric_response(response, 5)
-            if score is not None:
-                valid_responses.append(
-                    {
-                        "persona": f"{persona['age']}-year-old from {persona['state']} with annual income of ${persona['income']}",
-                        "age": persona["age"],
-                        "income": persona["income"],
-                        "state": persona["state"],
-                        "score": score,
-                        "original_response": response,
-                    }
-                )
-        else:  # multiple choice
-            try:
-                choice_index = int(response.strip()) - 1
-                if 0 <= choice_index < len(choices):
-                    valid_responses.append(
-                        {
-                            "persona": f"{persona['age']}-year-old from {persona['state']} with annual income of ${persona['income']}",
-                            "age": persona["age"],
-                            "income": persona["income"],
-                            "state": persona["state"],
-                            "choice": choices[choice_index],
-                            "original_response": response,
-                        }
-                    )
-                else:
-                    st.warning(f"Invalid choice index: {response}")
-            except ValueError:
-                st.warning(f"Invalid response for multiple choice: {response}")
-
-    return valid_responses
+    responses = pd.Series(all_responses, dtype=object).astype(str)
+    persona_df = (
+        personas if isinstance(personas, pd.DataFrame) else pd.DataFrame(personas)
+    ).reset_index(drop=True)
+
+    is_error = responses.str.startswith("Error")
+    if question_type == "likert":
+        values = parse_numeric_responses(responses, 5)
+        value_column = "score"
+        invalid_label = "invalid Likert responses"
+    elif question_type == "multiple_choice":
+        values = parse_choice_responses(responses, choices)
+        value_column = "choice"
+        invalid_label = "invalid multiple choice responses"
+    else:  # open-ended
+        values = responses.str.strip().replace("", np.nan)
+        value_column = "response"
+        invalid_label = "empty responses"
+    is_valid = values.notna() & ~is_error
+    is_invalid = ~is_valid & ~is_error
+
+    failures = []
+    if is_error.any():
+        failures.append(summarize_failures("API errors", responses[is_error]))
+    if is_invalid.any():
+        failures.append(summarize_failures(invalid_label, responses[is_invalid]))
+    if failures:
+        (warning_callback or logger.warning)("Skipped " + "; ".join(failures))
+
+    valid = persona_df.loc[is_valid.to_numpy()]
+    if question_type == "likert":
+        parsed = values[is_valid].astype(int).to_numpy()
+    elif question_type == "multiple_choice":
+        parsed = np.asarray(choices, dtype=object)[
+            values[is_valid].astype(int).to_numpy() - 1
+        ]
+    else:
+        parsed = values[is_valid].to_numpy(dtype=object)
+
+    results = pd.DataFrame(
+        {
+            "persona": (
+                valid["age"].astype(str)
+                + "-year-old from "
+                + valid["state"].astype(str)
+                + " with annual income of $"
+                + valid["income"].astype(str)
+            ).to_numpy(),
+            "age": valid["age"].to_numpy(),
+            "income": valid["income"].to_numpy(),
+            "state": valid["state"].to_numpy(),
+            value_column: parsed,
+            "backend": np.asarray(backends, dtype=object)[is_valid.to_numpy()],
+            "original_response": responses[is_valid].to_numpy(),
+        }
+    )
+    # Weights, demographic codes and any other persona attributes
+    for column in valid.columns:
+        if column not in results.columns:
+            results[column] = valid[column].to_numpy()
+    return results
@@ -1,15 +1,20 @@
+import uuid
+
 import streamlit as st
 import pandas as pd
-from supabase import create_client, Client
-import stripe
-
-from products.survey.visualization import create_enhanced_visualizations
-from products.survey.analysis import analyze_responses, create_pivot_table
-from products.survey.simulation import batch_simulate_responses
-from products.survey.data_handling import select_diverse_personas                                                                                                                                                                      
-from products.survey.prompts import create_prompt  
-from utils.custom_components import download_button
-from utils.openai_utils import estimate_input_tokens
+
+from products.survey.visualization import (
+    create_breakdown_figure,
+    create_overall_figure,
+    get_cached_figure,
+)
+from hivesight.distributed import run_plan_distributed
+from hivesight.survey import new_sampling_seed, plan_survey, run_plan
+from products.survey.aggregation import cache_likert_aggregates, get_likert_aggregates
+from products.survey.analysis import weighted_likert_estimates
+from products.survey.data_handling import filter_perspectives, persona_attributes
+from products.survey.prompts import attribute_label
+from utils.custom_components import export_buttons
 from utils.credit_utils import (
     get_or_create_stripe_customer,
     get_credits_available,
@@ -22,7 +27,23 @@ from utils.credit_utils import (
     create_credit_purchase_sidebar,
     create_free_credits_sidebar
 )
-from config import MODEL_MAP, MODEL_COST_MAP, PRESET_DOLLAR_AMOUNTS
+from config import (
+    LIKERT_LABELS,
+    MODEL_MAP,
+    PRESET_DOLLAR_AMOUNTS,
+    SURVEY_QUESTION_TYPES,
+    SURVEY_SHARD_SIZE,
+    SURVEY_WORKERS,
+)
+
+
+BREAKDOWNS = {
+    "By Age": ("age",),
+    "By Income": ("income",),
+    "By State": ("state",),
+    "By Age and Income": ("age", "income"),
+    "By Backend": ("backend",),
+}
 
 
 def init_session_state():
@@ -30,10 +51,14 @@ def init_session_state():
         st.session_state.responses = None
     if "show_success" not in st.session_state:
         st.session_state.show_success = False
+    if "sampling_seed" not in st.session_state:
+        st.session_state.sampling_seed = new_sampling_seed()
 
 
 def reset_step():
     st.session_state.step = 1
+    # Personas are redrawn when the inputs change, and only then
+    st.session_state.sampling_seed = new_sampling_seed()
 
 
 def render():
@@ -45,12 +70,38 @@ def render():
     col1, col2 = st.columns(2)
 
     with col1:
-        question_ls = st.text_area(
-            "Enter your statement for agreement/disagreement:",
-            key="widget",
-            on_change=reset_step,
-            help="Enter a statement that people can agree or disagree with.",
-        )
+        question_type = SURVEY_QUESTION_TYPES[
+            st.selectbox(
+                "Question Type",
+                list(SURVEY_QUESTION_TYPES),
+                on_change=reset_step,
+                help="Agreement on a 5-point scale, a choice between options, "
+                "or a short answer in the persona's own words, grouped into themes.",
+            )
+        ]
+        if question_type == "likert":
+            question_ls = st.text_area(
+                "Enter your statement for agreement/disagreement:",
+                key="widget",
+                on_change=reset_step,
+                help="Enter a statement that people can agree or disagree with.",
+            )
+        else:
+            question_ls = st.text_area(
+                "Enter your question:",
+                key="widget",
+                on_change=reset_step,
+            )
+
+        choices = None
+        if question_type == "multiple_choice":
+            choices = [
+                " ".join(line.split())
+                for line in st.text_area(
+                    "Choices (one per line):", on_change=reset_step
+                ).splitlines()
+                if line.strip()
+            ]
 
     with col2:
         num_queries = st.number_input(
@@ -90,23 +141,67 @@ def render():
             help="Filter responses by annual income range.",
         )
 
+    attributes, max_prompt_tokens = [], None
+    if persona_attributes():
+        with st.expander("Persona Attributes", expanded=False):
+            st.write(
+                "Describe each persona by more than age, state and income. "
+                "Every attribute makes each prompt longer, and so costs more."
+            )
+            attributes = st.multiselect(
+                "Attributes",
+                persona_attributes(),
+                format_func=attribute_label,
+                help="Added in the order chosen.",
+            )
+            max_prompt_tokens = st.number_input(
+                "Prompt Token Budget",
+                min_value=0,
+                value=0,
+                step=10,
+                help="Attributes, in the order chosen, are only added while every "
+                "prompt stays within this many tokens. 0 means no budget.",
+            ) or None
+
     create_credit_purchase_sidebar()
 
 
     if not question_ls.strip():
         st.info("When you finish typing your your statement, a button will appear.")
+    elif choices is not None and len(choices) < 2:
+        st.info("Enter at least two choices, one per line.")
     else:
-        question_type = "likert"
-        choices = None
-        personas = select_diverse_personas(num_queries, age_range, income_range)
-        prompts = [create_prompt(persona, question_ls, question_type, choices) for persona in personas]
-
-        input_tokens_est = estimate_input_tokens(prompts, model_type)
-        output_tokens_est = 1 * num_queries
-        input_tokens_cost = input_tokens_est * MODEL_COST_MAP[model_type].Input / 1E6
-        output_tokens_cost = output_tokens_est * MODEL_COST_MAP[model_type].Output / 1E6
-        total_compute_cost_in_usd = round(input_tokens_cost + output_tokens_cost, 5)
-        cost_in_credits = get_cost_in_credits(total_compute_cost_in_usd)
+        plan = plan_survey(
+            question_ls,
+            num_queries,
+            model_type,
+            question_type,
+            choices,
+            age_range,
+            income_range,
+            seed=st.session_state.sampling_seed,
+            attributes=attributes,
+            max_prompt_tokens=max_prompt_tokens,
+        )
+        if attributes:
+            st.write("#### Cost of persona attributes")
+            st.dataframe(
+                plan.attribute_costs.assign(
+                    attribute=plan.attribute_costs["attribute"].map(attribute_label)
+                )[["attribute", "tokens_per_prompt", "cost_in_usd"]],
+                hide_index=True,
+                column_config={
+                    "tokens_per_prompt": st.column_config.NumberColumn(format="%.1f"),
+                    "cost_in_usd": st.column_config.NumberColumn(format="$%.4f"),
+                },
+            )
+            skipped = [a for a in attributes if a not in plan.attributes]
+            if skipped:
+                st.info(
+                    "Left out to stay within the prompt token budget: "
+                    + ", ".join(attribute_label(a) for a in skipped)
+                )
+        cost_in_credits = get_cost_in_credits(plan.cost_in_usd)
         # create_free_credits_sidebar()
         credits_available = get_credits_available(st.session_state["email"])
         enough_credits = credits_available >= cost_in_credits
@@ -114,11 +209,20 @@ def render():
             if st.button(f"Run Simulation for {cost_in_credits} credit(s)",
                          help="Click to start the simulation with the current settings."):
                 update_credit_usage_history(st.session_state['email'], cost_in_credits)
-                run_simulation(question_ls, num_queries, model_type, personas, prompts)
-                show_results()
+                st.session_state.survey_filters = (age_range, income_range)
+                st.session_state.run_metadata = {
+                    **plan.metadata(),
+                    "cost_in_credits": cost_in_credits,
+                }
+                run_simulation(plan)
         else:
             st.write("Not enough credits! See the sidebar to buy more.")
 
+    # On every rerun, not just the one that ran the simulation, so that
+    # changing a breakdown or ticking a checkbox redraws the last run's
+    # results from its cached aggregates
+    show_results()
+
     ## Step 1: Cost Estimation
     #if st.session_state.step == 1:
     #    if st.button("Proceed to Cost Estimation"):
@@ -155,70 +259,148 @@ def render():
     #        st.write("Not enough credits! See the sidebar to buy more.")
 
 
-def run_simulation(
-    question_ls, num_queries, model_type, personas, prompts
-):
+def run_simulation(plan):
     with st.spinner("Simulating responses..."):
         progress_bar = st.progress(0)
-        responses = batch_simulate_responses(
-            question_ls,
-            None,  # No choices for Likert scale
-            num_queries,
-            model_type,
-            personas,
-            prompts,
-            "likert",  # Passing "likert" as a fixed parameter
-            progress_callback=lambda x: progress_bar.progress(x),
-        )
-
-        if not responses:
-            st.error(
-                "No valid responses were generated. Please try again or adjust your parameters."
-            )
+        callbacks = {
+            "progress_callback": lambda x: progress_bar.progress(x),
+            "warning_callback": st.warning,
+        }
+        if SURVEY_WORKERS > 1 and len(plan.prompts) > SURVEY_SHARD_SIZE:
+            # Large surveys run in worker processes, leaving this one to the UI
+            result = run_plan_distributed(plan, SURVEY_WORKERS, **callbacks)
         else:
-            st.session_state.responses = responses
-            st.session_state.show_success = True
+            result = run_plan(plan, **callbacks)
+
+    if result.responses.empty:
+        st.error(
+            "No valid responses were generated. Please try again or adjust your parameters."
+        )
+        return
+
+    st.session_state.responses = result.responses
+    st.session_state.question_type = plan.question_type
+    st.session_state.choices = plan.choices
+    st.session_state.themes = result.themes
+    st.session_state.run_id = uuid.uuid4().hex
+    if result.aggregates is not None:
+        cache_likert_aggregates(st.session_state.run_id, result.aggregates)
+    st.session_state.show_success = True
+
+
+def get_answer_columns():
+    """(column, labels, chart subject) of the closed answers of the last run,
+    or None for open-ended answers that couldn't be grouped into themes"""
+    question_type = st.session_state.get("question_type", "likert")
+    if question_type == "likert":
+        return "score", LIKERT_LABELS, "Likert Scale Results"
+    if question_type == "multiple_choice":
+        return "choice", st.session_state.choices, "Choices"
+    if st.session_state.get("themes") is not None:
+        return "theme", st.session_state.themes["theme"].tolist(), "Themes"
+    return None
+
+
+def get_weighted_estimates(df, run_id, dimensions):
+    """weighted_likert_estimates of the run, by dimensions (() for overall)
+
+    The bootstrap is run once per run and breakdown, not on every rerun while
+    the estimates are shown. Only the current run's estimates are kept.
+    """
+    estimates = st.session_state.get("weighted_estimates", {})
+    key = (run_id, dimensions)
+    if key not in estimates:
+        estimates = {k: v for k, v in estimates.items() if k[0] == run_id}
+        population = filter_perspectives(*st.session_state.survey_filters)
+        estimates[key] = weighted_likert_estimates(df, by=dimensions, population=population)
+        st.session_state.weighted_estimates = estimates
+    return estimates[key]
+
+
+def show_answer_breakdowns(df, run_id, metadata, value_column, answer_labels, subject):
+    # Counts for every breakdown are computed once per run, so switching
+    # breakdowns on rerun only slices the cached arrays
+    aggregates = get_likert_aggregates(run_id, df, value_column, answer_labels)
+
+    st.subheader("Overall Distribution")
+    overall_fig = get_cached_figure(
+        (run_id, "overall"),
+        lambda: create_overall_figure(
+            aggregates.overall() / max(aggregates.total, 1), answer_labels
+        ),
+    )
+    st.plotly_chart(overall_fig, use_container_width=True)
+
+    st.subheader("Demographic Breakdown")
+    breakdown_types = [
+        breakdown
+        for breakdown, dimensions in BREAKDOWNS.items()
+        if breakdown != "By Backend" or df["backend"].nunique() > 1
+    ]
+    breakdown_type = st.selectbox(
+        "Select breakdown type:", breakdown_types
+    )
+    dimensions = BREAKDOWNS[breakdown_type]
+    # Only the selected breakdown is drawn, once per run
+    breakdown_fig = get_cached_figure(
+        (run_id, dimensions),
+        lambda: create_breakdown_figure(
+            aggregates.shares(*dimensions).reshape(-1, len(answer_labels)),
+            aggregates.level_labels(*dimensions),
+            "_".join(dimensions),
+            labels=answer_labels,
+            subject=subject,
+        ),
+    )
+    st.plotly_chart(breakdown_fig, use_container_width=True)
+
+    if value_column == "score" and st.checkbox(
+        "Show population-weighted estimates with 95% confidence intervals",
+        help="Responses are post-stratified to the age and income mix of "
+        "the filtered population; intervals come from 1,000 bootstrap replicates.",
+    ):
+        st.dataframe(get_weighted_estimates(df, run_id, ()), hide_index=True)
+        st.dataframe(get_weighted_estimates(df, run_id, dimensions), hide_index=True)
+
+    export_buttons(
+        lambda: aggregates.to_frame(*dimensions),
+        f"breakdown_{'_'.join(dimensions)}",
+        f"Download {breakdown_type} Breakdown",
+        metadata,
+    )
 
 
 def show_results():
     if st.session_state.show_success:
         success_message = f"Simulation complete. Generated {len(st.session_state.responses)} valid responses."
         st.success(success_message)
+        st.session_state.show_success = False  # only right after the run
 
     st.header("Simulation Results")
 
-    if st.session_state.responses:
-        df = pd.DataFrame(st.session_state.responses)
-        response_counts = analyze_responses(df)
-
-        st.subheader("Overall Distribution")
-        overall_viz = create_enhanced_visualizations(
-            response_counts, None, None
-        )
-        st.plotly_chart(overall_viz[0], use_container_width=True)
-
-        st.subheader("Demographic Breakdown")
-        breakdown_type = st.selectbox(
-            "Select breakdown type:", ("By Age", "By Income")
-        )
-
-        if breakdown_type == "By Age":
-            age_pivot = create_pivot_table(df, "age")
-            age_viz = create_enhanced_visualizations(
-                response_counts, age_pivot, "age"
+    if st.session_state.responses is not None:
+        df = st.session_state.responses
+        run_id = st.session_state.run_id
+        metadata = {
+            "run_id": run_id,
+            **st.session_state.get("run_metadata", {}),
+        }
+        answer_columns = get_answer_columns()
+
+        if st.session_state.get("themes") is not None:
+            st.subheader("Themes")
+            st.dataframe(
+                st.session_state.themes,
+                hide_index=True,
+                column_config={"share": st.column_config.NumberColumn(format="percent")},
             )
-            st.plotly_chart(age_viz[1], use_container_width=True)
-        elif breakdown_type == "By Income":
-            income_pivot = create_pivot_table(df, "income")
-            income_viz = create_enhanced_visualizations(
-                response_counts, income_pivot, "income"
-            )
-            st.plotly_chart(income_viz[1], use_container_width=True)
 
-        download_button_str = download_button(
-            df, "simulated_responses.csv", "Download Simulated Responses"
+        if answer_columns is not None:
+            show_answer_breakdowns(df, run_id, metadata, *answer_columns)
+
+        export_buttons(
+            df, "simulated_responses", "Download Simulated Responses", metadata
         )
-        st.markdown(download_button_str, unsafe_allow_html=True)
 
     else:
         st.info(
@@ -0,0 +1,122 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.vq import kmeans2
+
+from config import MAX_THEMES
+
+
+MIN_ANSWERS_PER_THEME = 5
+N_KEYWORDS = 5
+N_EXAMPLES = 3
+STOPWORDS = frozenset(
+    """
+    a about after all also am an and any are as at be because been but by can
+    could do does for from had has have he her his how i if in into is it its
+    just like many may me more most much my no not of on one only or other our
+    out over own should so some such than that the their them then there these
+    they this those to too up us very was we were what when which while who
+    why will with would you your
+    """.split()
+)
+
+
+def choose_theme_count(n_answers: int, max_themes: int = MAX_THEMES) -> int:
+    return int(np.clip(n_answers // MIN_ANSWERS_PER_THEME, 1, max_themes))
+
+
+def cluster_embeddings(
+    embeddings: np.ndarray, n_themes: int, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(theme of each answer, theme centroids), themes numbered by size
+
+    k-means on unit-normalized embeddings, i.e. by cosine similarity.
+    """
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = embeddings / np.where(norms > 0, norms, 1)
+    centroids, labels = kmeans2(unit, n_themes, minit="++", seed=seed)
+    # Clusters can come out empty; renumber the used ones from largest to smallest
+    sizes = np.bincount(labels, minlength=n_themes)
+    order = np.argsort(-sizes, kind="stable")[: np.count_nonzero(sizes)]
+    renumber = np.empty(n_themes, dtype=np.int64)
+    renumber[order] = np.arange(len(order))
+    return renumber[labels], centroids[order]
+
+
+def theme_keywords(texts: pd.Series, labels: np.ndarray) -> pd.Series:
+    """The words most over-represented in each theme, relative to all answers"""
+    words = (
+        texts.str.lower()
+        .str.findall(r"[a-z][a-z']+")
+        .explode()
+        .dropna()
+    )
+    words = words[~words.isin(STOPWORDS)]
+    # Each word counts once per answer
+    occurrences = pd.DataFrame(
+        {"theme": labels[words.index.to_numpy()], "word": words.to_numpy()},
+        index=words.index,
+    ).reset_index().drop_duplicates()
+    theme_sizes = np.bincount(labels)
+    in_theme = occurrences.groupby(["theme", "word"]).size()
+    overall = occurrences.groupby("word").size() / len(labels)
+    themes = in_theme.index.get_level_values("theme").to_numpy()
+    lift = in_theme / theme_sizes[themes] - overall.reindex(
+        in_theme.index.get_level_values("word")
+    ).to_numpy()
+    top = lift.sort_values(ascending=False).groupby(level="theme").head(N_KEYWORDS)
+    return (
+        top.reset_index()
+        .groupby("theme")["word"]
+        .agg(", ".join)
+        .reindex(range(len(theme_sizes)), fill_value="")
+    )
+
+
+def extract_themes(
+    texts: pd.Series,
+    embeddings: np.ndarray,
+    n_themes: Optional[int] = None,
+    seed: int = 0,
+) -> Tuple[np.ndarray, pd.DataFrame]:
+    """Groups open-ended answers into themes without any further LLM calls
+
+    Returns the theme number of each answer and one row per theme with its
+    share of answers, distinctive keywords and the answers closest to its
+    centroid as examples.
+    """
+    texts = texts.reset_index(drop=True)
+    if n_themes is None:
+        n_themes = choose_theme_count(len(texts))
+    # k-means++ can't seed more clusters than there are distinct answers
+    n_themes = min(n_themes, len(np.unique(embeddings, axis=0)))
+    labels, centroids = cluster_embeddings(embeddings, n_themes, seed)
+
+    norms = np.linalg.norm(embeddings, axis=1)
+    similarity = np.einsum(
+        "ij,ij->i", embeddings, centroids[labels]
+    ) / np.where(norms > 0, norms, 1)
+    closest_first = np.lexsort((-similarity, labels))
+    ranked = pd.DataFrame(
+        {"theme": labels[closest_first], "text": texts.to_numpy()[closest_first]}
+    ).drop_duplicates()
+    examples = ranked.groupby("theme").head(N_EXAMPLES).groupby("theme")["text"].agg(list)
+
+    sizes = np.bincount(labels, minlength=len(centroids))
+    keywords = theme_keywords(texts, labels)
+    themes = pd.DataFrame(
+        {
+            "theme": [
+                f"Theme {i + 1}: " + ", ".join(keywords[i].split(", ")[:3])
+                if keywords[i]
+                else f"Theme {i + 1}"
+                for i in range(len(centroids))
+            ],
+            "answers": sizes,
+            "share": sizes / sizes.sum(),
+            "keywords": keywords.to_numpy(),
+            "examples": examples.reindex(range(len(centroids))).to_numpy(),
+        }
+    )
+    return labels, themes
@@ -1,34 +1,43 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Sequence
+
+import numpy as np
 import plotly.graph_objects as go
-from typing import List, Optional
 import pandas as pd
 from config import LIKERT_LABELS, LIKERT_COLORS
 
 
-def create_enhanced_visualizations(
-    response_counts: pd.DataFrame,
-    pivot: Optional[pd.DataFrame],
-    groupby_var: Optional[str],
-) -> List[go.Figure]:
-    figures = []
-
-    # Distribution of scores as horizontal stacked bar chart
-    fig1 = go.Figure()
-    for label in LIKERT_LABELS:
-        count = response_counts.loc[
-            response_counts["likert_label"] == label, "percentage"
-        ]
-        fig1.add_trace(
+COMPACT_MIN_CATEGORIES = 15  # breakdowns with this many rows render as a heatmap
+SHARE_DECIMALS = 4  # shares are rounded before they are serialized
+MAX_CACHED_FIGURES = 64
+
+
+def breakdown_title(groupby_var: str, subject: str = "Likert Scale Results") -> str:
+    return f"{subject} by {groupby_var.replace('_', ' and ').capitalize()} Group"
+
+
+def create_overall_figure(
+    shares: np.ndarray, labels: Sequence[str] = LIKERT_LABELS
+) -> go.Figure:
+    """Horizontal stacked bar of the overall share of each answer label
+
+    Labels without a color in LIKERT_COLORS get plotly's default colors.
+    """
+    shares = np.round(np.asarray(shares, dtype=float), SHARE_DECIMALS)
+    fig = go.Figure()
+    for label, share in zip(labels, shares):
+        fig.add_trace(
             go.Bar(
                 y=["Distribution of Responses"],
-                x=[count.values[0] if not count.empty else 0],
+                x=[share],
                 name=label,
                 orientation="h",
-                marker=dict(color=LIKERT_COLORS[label]),
-                text=[f"{count.values[0]:.1%}" if not count.empty else "0%"],
+                marker=dict(color=LIKERT_COLORS.get(label)),
+                texttemplate="%{x:.1%}",
                 textposition="inside",
             )
         )
-    fig1.update_layout(
+    fig.update_layout(
         barmode="stack",
         title="Overall Distribution of Responses",
         xaxis_title="Percentage",
@@ -36,38 +45,116 @@ def create_enhanced_visualizations(
         yaxis=dict(showticklabels=False),
         xaxis=dict(tickformat=".0%", range=[0, 1]),
     )
-    figures.append(fig1)
+    return fig
+
+
+def create_breakdown_figure(
+    shares: np.ndarray,
+    categories: Sequence[str],
+    groupby_var: str,
+    compact: Optional[bool] = None,
+    labels: Sequence[str] = LIKERT_LABELS,
+    subject: str = "Likert Scale Results",
+) -> go.Figure:
+    """Likert shares by category, from a (categories x labels) share array
+
+    Categories without responses are dropped. Compact mode (the default for
+    COMPACT_MIN_CATEGORIES or more categories) draws a single heatmap trace
+    without per-bar text, which keeps the figure JSON small for breakdowns
+    such as 51 states x 5 labels.
+    """
+    shares = np.asarray(shares, dtype=float)
+    has_data = ~np.isnan(shares).any(axis=1)
+    shares = np.round(shares[has_data], SHARE_DECIMALS)
+    categories = [str(c) for c, keep in zip(categories, has_data) if keep]
+    if compact is None:
+        compact = len(categories) >= COMPACT_MIN_CATEGORIES
+
+    fig = go.Figure()
+    if compact:
+        fig.add_trace(
+            go.Heatmap(
+                z=shares,
+                x=list(labels),
+                y=categories,
+                colorscale=[
+                    [0, LIKERT_COLORS["Neutral"]],
+                    [1, LIKERT_COLORS["Strongly Agree"]],
+                ],
+                zmin=0,
+                zmax=1,
+                hovertemplate="%{y}<br>%{x}: %{z:.1%}<extra></extra>",
+                colorbar=dict(tickformat=".0%"),
+            )
+        )
+        fig.update_layout(
+            title=breakdown_title(groupby_var, subject),
+            height=max(400, 16 * len(categories)),
+            yaxis=dict(autorange="reversed", type="category"),
+        )
+        return fig
+
+    for i, label in enumerate(labels):
+        fig.add_trace(
+            go.Bar(
+                y=categories,
+                x=shares[:, i],
+                name=label,
+                orientation="h",
+                marker=dict(color=LIKERT_COLORS.get(label)),
+                texttemplate="%{x:.1%}",
+                textposition="inside",
+            )
+        )
+    fig.update_layout(
+        barmode="stack",
+        title=breakdown_title(groupby_var, subject),
+        xaxis_title="Percentage",
+        height=max(400, 25 * len(categories)),
+        yaxis=dict(
+            type="category",
+            tickprefix="$" if groupby_var == "income" else "",
+        ),
+        xaxis=dict(tickformat=".0%", range=[0, 1]),
+    )
+    return fig
+
+
+figure_cache = OrderedDict()
+
+
+def get_cached_figure(key: Hashable, build: Callable[[], go.Figure]) -> go.Figure:
+    """Builds a figure once per key, e.g. (run id, breakdown)"""
+    if key in figure_cache:
+        figure_cache.move_to_end(key)
+        return figure_cache[key]
+    figure = build()
+    figure_cache[key] = figure
+    if len(figure_cache) > MAX_CACHED_FIGURES:
+        figure_cache.popitem(last=False)
+    return figure
+
+
+def create_enhanced_visualizations(
+    response_counts: pd.DataFrame,
+    pivot: Optional[pd.DataFrame],
+    groupby_var: Optional[str],
+) -> List[go.Figure]:
+    overall_shares = (
+        response_counts.set_index("likert_label")["percentage"]
+        .reindex(LIKERT_LABELS, fill_value=0)
+        .to_numpy()
+    )
+    figures = [create_overall_figure(overall_shares)]
 
     # Likert scale results by groupby variable (if pivot is provided)
     if pivot is not None and groupby_var is not None:
-        fig2 = go.Figure()
-        for label in LIKERT_LABELS:
-            if label in pivot.columns:
-                fig2.add_trace(
-                    go.Bar(
-                        y=pivot[groupby_var].astype(str),
-                        x=pivot[label],
-                        name=label,
-                        orientation="h",
-                        marker=dict(color=LIKERT_COLORS[label]),
-                        text=[f"{val:.1%}" for val in pivot[label]],
-                        textposition="inside",
-                    )
-                )
-
-        y_axis_tickformat = "" if groupby_var == "age" else "$,d"
-
-        fig2.update_layout(
-            barmode="stack",
-            title=f"Likert Scale Results by {groupby_var.capitalize()} Group",
-            xaxis_title="Percentage",
-            height=400,
-            yaxis=dict(
-                tickformat=y_axis_tickformat,
-                tickprefix="$" if groupby_var == "income" else "",
-            ),
-            xaxis=dict(tickformat=".0%", range=[0, 1]),
+        figures.append(
+            create_breakdown_figure(
+                pivot[LIKERT_LABELS].to_numpy(),
+                pivot[groupby_var].astype(str).tolist(),
+                groupby_var,
+            )
         )
-        figures.append(fig2)
 
     return figures
@@ -0,0 +1,93 @@
+"""Puts a list of questions to the same council of advisors, headlessly
+
+    python -m scripts.bulk_council questions.csv --advisors CEO CFO COO \
+        --output council_results.parquet --max-concurrency 16 --rpm 500
+
+Questions come from a .txt file (one per line) or the --column of a CSV.
+Progress is checkpointed to OUTPUT.checkpoint.jsonl as it happens; running
+the same command again after an interruption resumes from it. Results are
+written to Parquet (one row per question and advisor) or, for a .jsonl
+output, one question per line, followed by a cost report.
+"""
+import argparse
+import json
+import sys
+
+import pandas as pd
+
+from config import DEFAULT_PERSONAS
+from products.council.bulk import run_bulk_council
+from utils.backend_utils import RateLimiter
+
+
+def read_questions(path, column):
+    if path.endswith(".txt"):
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()]
+    questions = pd.read_csv(path)[column].dropna().astype(str).str.strip()
+    return questions[questions != ""].tolist()
+
+
+def read_advisors(names, custom_path):
+    advisors = dict(DEFAULT_PERSONAS)
+    if custom_path:
+        with open(custom_path) as f:
+            advisors.update(json.load(f))
+    unknown = [name for name in names if name not in advisors]
+    if unknown:
+        raise SystemExit(f"Unknown advisors: {', '.join(unknown)}")
+    return {name: advisors[name] for name in names}
+
+
+def print_progress(done, total):
+    print(f"\r{done}/{total} questions", end="", file=sys.stderr, flush=True)
+
+
+def print_report(report):
+    print(f"Questions:   {report['questions']:,} ({report['completed']:,} completed)")
+    for key, reason in report["failed"].items():
+        print(f"Failed:      {key[:12]} {reason}")
+    print(f"Advisors:    {report['advisor_tokens']} ${report['advisor_cost']:.4f}")
+    print(f"Summaries:   {report['summary_tokens']} ${report['summary_cost']:.4f}")
+    print(f"Total:       ${report['total_cost']:.4f} in this run")
+    print(f"Estimate:    ${report['estimated_max_cost']:.4f} at most for all questions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help=".txt (one question per line) or .csv")
+    parser.add_argument("--column", default="question", help="of the CSV")
+    parser.add_argument("--advisors", nargs="+", default=["CEO", "CFO"])
+    parser.add_argument(
+        "--custom-advisors",
+        help="JSON file of {role: {description, expertise: {skill: score}}}",
+    )
+    parser.add_argument("--output", default="council_results.parquet")
+    parser.add_argument("--checkpoint", help="defaults to OUTPUT.checkpoint.jsonl")
+    parser.add_argument("--max-tokens", type=int, default=800)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--rpm", type=int, default=None)
+    parser.add_argument("--tpm", type=int, default=None)
+    parser.add_argument("--report", help="Also write the cost report to this JSON path")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions, args.column)
+    advisors = read_advisors(args.advisors, args.custom_advisors)
+    run = run_bulk_council(
+        questions,
+        advisors,
+        args.checkpoint or f"{args.output}.checkpoint.jsonl",
+        args.max_tokens,
+        RateLimiter(args.rpm, args.tpm, args.max_concurrency),
+        print_progress,
+    )
+    print(file=sys.stderr)
+    report = run.cost_report()
+    run.write_results(
+        args.output,
+        {"advisors": advisors, "max_tokens": args.max_tokens, "cost": report},
+    )
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
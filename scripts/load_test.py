@@ -0,0 +1,162 @@
+"""Drives survey-sized batches through the real retry/hedging code against the mock LLM
+
+    python -m scripts.load_test --requests 10000 --rate-limit-rate 0.02 \
+        --server-error-rate 0.01 --malformed-rate 0.01 --hedge-percentile 95
+
+--mode backend (default) runs MockBackend in process through BackendPool;
+--mode openai starts the mock HTTP server and goes through query_openai_async
+and the real AsyncOpenAI client.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from config import LIKERT_LABELS
+from products.survey.prompts import create_prompts
+from scripts.mock_llm_server import add_mock_llm_arguments, mock_llm_from_args
+from utils.backend_utils import BackendPool
+from utils.hedge_utils import HedgeBudget, LatencyTracker, hedged_call
+from utils.mock_llm import MockBackend, serve
+from utils.retry_utils import reset_attempt_metrics, summarize_attempt_metrics
+
+
+STATES = ["CA", "TX", "NY", "FL", "OH", "WA", "GA", "MI"]
+
+
+def make_prompts(n, seed):
+    rng = np.random.default_rng(seed)
+    personas = pd.DataFrame(
+        {
+            "age": rng.integers(18, 90, n),
+            "state": rng.choice(STATES, n),
+            "income": rng.integers(0, 200, n) * 1000,
+        }
+    )
+    return create_prompts(
+        personas, "The government should invest more in public transit.", "likert"
+    )
+
+
+async def timed(make_call):
+    start = time.monotonic()
+    result = await make_call()
+    if isinstance(result, tuple):  # (response, backend) from a pool
+        result = result[0]
+    return result, time.monotonic() - start
+
+
+async def drive(make_calls, hedge_percentile, max_hedge_fraction):
+    if hedge_percentile is None:
+        tasks = [timed(make_call) for make_call in make_calls]
+        return await asyncio.gather(*tasks), 0
+
+    tracker = LatencyTracker(hedge_percentile)
+    budget = HedgeBudget(len(make_calls), max_hedge_fraction)
+    tasks = [
+        timed(lambda make_call=make_call: hedged_call(make_call, tracker, budget))
+        for make_call in make_calls
+    ]
+    return await asyncio.gather(*tasks), budget.spent
+
+
+def run_load_test(args):
+    prompts = make_prompts(args.requests, args.seed)
+    llm = mock_llm_from_args(args)
+    reset_attempt_metrics()
+
+    if args.mode == "openai":
+        server = serve(llm, port=args.port, in_thread=True)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "mock")
+        from utils.openai_utils import query_openai_async
+
+        make_calls = [
+            lambda prompt=prompt: query_openai_async(prompt, args.model_type, max_tokens=1)
+            for prompt in prompts
+        ]
+    else:
+        server = None
+        pool = BackendPool([MockBackend("mock", llm, max_concurrency=args.max_concurrency)])
+        make_calls = [
+            lambda prompt=prompt: pool.complete(prompt, 1.0, 1) for prompt in prompts
+        ]
+
+    start = time.monotonic()
+    try:
+        results, hedges = asyncio.run(
+            drive(make_calls, args.hedge_percentile, args.max_hedge_fraction)
+        )
+    finally:
+        if server is not None:
+            server.shutdown()
+    wall_time = time.monotonic() - start
+
+    responses = [response for response, _ in results]
+    latencies = np.array([latency for _, latency in results])
+    errors = Counter(
+        response.removeprefix("Error:").strip()[:60]
+        for response in responses
+        if response.startswith("Error")
+    )
+    valid_answers = {str(i + 1) for i in range(len(LIKERT_LABELS))}
+    valid = sum(response in valid_answers for response in responses)
+
+    return {
+        "mode": args.mode,
+        "requests": len(prompts),
+        "wall_time": wall_time,
+        "throughput": len(prompts) / wall_time,
+        "latency": {
+            f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)
+        }
+        | {"max": float(latencies.max())},
+        "valid": valid,
+        "malformed": len(responses) - valid - sum(errors.values()),
+        "errors": dict(errors),
+        "hedged_requests": hedges,
+        "attempts": summarize_attempt_metrics(),
+    }
+
+
+def print_report(report):
+    print(f"Mode:        {report['mode']}")
+    print(f"Requests:    {report['requests']:,}")
+    print(f"Wall time:   {report['wall_time']:.2f} s")
+    print(f"Throughput:  {report['throughput']:,.1f} requests/s")
+    print(
+        "Latency:     "
+        + ", ".join(f"{k} {v:.3f} s" for k, v in report["latency"].items())
+    )
+    print(f"Valid:       {report['valid']:,}")
+    print(f"Malformed:   {report['malformed']:,}")
+    print(f"Errors:      {sum(report['errors'].values()):,} {report['errors']}")
+    print(f"Hedged:      {report['hedged_requests']:,}")
+    attempts = report["attempts"]
+    print(f"Attempts:    {attempts['attempts']:,} {attempts['outcomes']}")
+    print(f"Retry delay: {attempts['total_retry_delay']:.1f} s in total")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--mode", choices=["backend", "openai"], default="backend")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--model-type", default="GPT-4o-mini")
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--hedge-percentile", type=float, default=None)
+    parser.add_argument("--max-hedge-fraction", type=float, default=0.05)
+    parser.add_argument("--json", help="Also write the report to this path")
+    add_mock_llm_arguments(parser)
+    args = parser.parse_args()
+
+    report = run_load_test(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
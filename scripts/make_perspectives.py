@@ -1,22 +1,184 @@
-from policyengine_us import Microsimulation
+"""Regenerates the perspectives table the survey samples personas from
+
+    python -m scripts.make_perspectives --income-step 5000 \
+        --attributes sex race household_size employment --report validation.csv
+
+Every person in the PolicyEngine enhanced CPS is calculated in one
+calculate_dataframe call. Ages are whole years and incomes are quantized to
+--income-step dollar bands, and people with the same attributes are merged into
+one weighted row, so that a richer table still has far fewer rows than
+unique incomes. The result is written to perspectives.parquet, sorted by
+state, age and income, with the settings as metadata.
+
+--source re-bins an existing table (e.g. the old perspectives.csv) instead
+of running the microsimulation. A validation report compares the weighted
+marginals of every attribute in the source and the output.
+"""
+import argparse
+
+import numpy as np
 import pandas as pd
 
-sim = Microsimulation(dataset="enhanced_cps_2022")
+from config import AGE_BINS, INCOME_BINS
+from products.survey.data_handling import PERSPECTIVES_PATH
+from products.survey.demographics import bin_codes, bin_labels
+from utils.export_utils import write_parquet
+
+
+DATASET = "enhanced_cps_2022"
+PERIOD = 2024
+MAX_HOUSEHOLD_SIZE = 7  # larger households are merged into this size
+
+# PolicyEngine variables each column is derived from, at the person level
+VARIABLES = {
+    "age": ["age"],
+    "state": ["state_code"],
+    "income": ["employment_income"],
+    "sex": ["is_male"],
+    "race": ["race"],
+    "household_size": ["household_size"],
+    "employment": ["employment_income", "self_employment_income"],
+}
+ATTRIBUTES = ["sex", "race", "household_size", "employment"]
+KEY_COLUMNS = ["state", "age", "income"]
+
+
+def derive_columns(calculated: pd.DataFrame, attributes) -> pd.DataFrame:
+    """Person-level columns from the calculated variables, vectorized"""
+    columns = {
+        "age": calculated["age"].to_numpy(),
+        "state": calculated["state_code"].astype(str).to_numpy(),
+        "income": calculated["employment_income"].to_numpy(),
+    }
+    if "sex" in attributes:
+        columns["sex"] = np.where(calculated["is_male"].to_numpy(), "male", "female")
+    if "race" in attributes:
+        columns["race"] = calculated["race"].astype(str).str.lower().to_numpy()
+    if "household_size" in attributes:
+        columns["household_size"] = calculated["household_size"].to_numpy()
+    if "employment" in attributes:
+        # The CPS has no employment status variable; anyone with earnings counts
+        earnings = calculated["employment_income"] + calculated["self_employment_income"]
+        columns["employment"] = np.where(earnings.to_numpy() > 0, "employed", "not employed")
+    return pd.DataFrame(columns)
+
+
+def calculate_people(dataset, period, attributes) -> pd.DataFrame:
+    from policyengine_us import Microsimulation
+
+    sim = Microsimulation(dataset=dataset)
+    variables = sorted(
+        {variable for column in KEY_COLUMNS + attributes for variable in VARIABLES[column]}
+    )
+    calculated = sim.calculate_dataframe(variables, period=period, map_to="person")
+    people = derive_columns(pd.DataFrame(calculated), attributes)
+    people["weight"] = np.asarray(calculated.weights)
+    return people
+
+
+def quantize(people: pd.DataFrame, income_step: int) -> pd.DataFrame:
+    quantized = people.copy()
+    quantized["age"] = people["age"].round().astype(np.int16)
+    # The middle of each income_step band, so that incomes stay within the
+    # app's INCOME_BINS when those are multiples of the step. No income stays 0
+    income = people["income"].to_numpy()
+    quantized["income"] = np.where(
+        income == 0, 0, np.floor(income / income_step) * income_step + income_step // 2
+    ).astype(np.int64)
+    if "household_size" in people.columns:
+        quantized["household_size"] = np.minimum(
+            people["household_size"].round(), MAX_HOUSEHOLD_SIZE
+        ).astype(np.int8)
+    return quantized
+
+
+def merge_rows(people: pd.DataFrame) -> pd.DataFrame:
+    """One row per distinct combination of attributes, with the summed weight"""
+    columns = [column for column in people.columns if column != "weight"]
+    ordered = KEY_COLUMNS + [column for column in columns if column not in KEY_COLUMNS]
+    return people.groupby(ordered, sort=True, observed=True)["weight"].sum().reset_index()
+
+
+def weighted_shares(df: pd.DataFrame, column: str) -> pd.Series:
+    if column == "age":
+        codes, labels = bin_codes(df["age"], AGE_BINS), bin_labels(AGE_BINS, "age")
+    elif column == "income":
+        codes, labels = bin_codes(df["income"], INCOME_BINS), bin_labels(INCOME_BINS, "income")
+    else:
+        codes, uniques = pd.factorize(df[column], sort=True)
+        labels = [str(u) for u in uniques]
+    valid = codes >= 0
+    totals = np.bincount(codes[valid], weights=df["weight"].to_numpy()[valid], minlength=len(labels))
+    return pd.Series(totals / df["weight"].sum(), index=labels)
+
+
+def validation_report(source: pd.DataFrame, output: pd.DataFrame) -> pd.DataFrame:
+    """Weighted share of every level of every attribute, in source and output"""
+    frames = []
+    for column in output.columns.drop("weight"):
+        shares = pd.concat(
+            [weighted_shares(source, column), weighted_shares(output, column)],
+            axis=1,
+            keys=["source_share", "output_share"],
+        ).fillna(0.0)
+        shares["difference"] = shares["output_share"] - shares["source_share"]
+        frames.append(shares.rename_axis("level").reset_index().assign(attribute=column))
+    report = pd.concat(frames, ignore_index=True)
+    return report[["attribute", "level", "source_share", "output_share", "difference"]]
 
 
-def get(var):
-    return sim.calc(var, period=2024, map_to="person")
+def print_summary(source, output, report):
+    print(f"Rows:        {len(source):,} -> {len(output):,}")
+    print(f"Weight:      {source['weight'].sum():,.0f} -> {output['weight'].sum():,.0f}")
+    for column in ["age", "income"]:
+        before = np.average(source[column], weights=source["weight"])
+        after = np.average(output[column], weights=output["weight"])
+        print(f"Mean {column + ':':<7} {before:,.1f} -> {after:,.1f}")
+    largest = report.loc[report.groupby("attribute")["difference"].apply(lambda d: d.abs().idxmax())]
+    print("Largest difference in weighted share by attribute:")
+    for row in largest.itertuples():
+        print(f"  {row.attribute:<15} {row.level:<20} {row.difference:+.4%}")
 
 
-age = get("age")
-state = get("state_code")
-income = get("employment_income")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", help="re-bin this CSV or Parquet table instead")
+    parser.add_argument("--dataset", default=DATASET)
+    parser.add_argument("--period", type=int, default=PERIOD)
+    parser.add_argument(
+        "--income-step", type=int, default=5000, help="width of the income bands in dollars"
+    )
+    parser.add_argument(
+        "--attributes", nargs="*", choices=ATTRIBUTES, default=ATTRIBUTES,
+        help="columns to add to age, state and income",
+    )
+    parser.add_argument("--output", default=str(PERSPECTIVES_PATH))
+    parser.add_argument("--report", help="write the validation report to this CSV")
+    args = parser.parse_args()
 
-df = pd.DataFrame(
-    {"age": age, "state": state, "income": income, "weight": age.weights}
-)
+    if args.source:
+        read = pd.read_parquet if args.source.endswith(".parquet") else pd.read_csv
+        source = read(args.source)
+        attributes = [column for column in args.attributes if column in source.columns]
+        source = source[KEY_COLUMNS + attributes + ["weight"]]
+    else:
+        attributes = args.attributes
+        source = calculate_people(args.dataset, args.period, attributes)
 
-# Aggregate by all variables except weight.
-df_dedup = df.groupby(["age", "state", "income"]).weight.sum().reset_index()
+    output = merge_rows(quantize(source, args.income_step))
+    with open(args.output, "wb") as f:
+        write_parquet(
+            output,
+            f,
+            {
+                "source": args.source or f"{args.dataset} ({args.period})",
+                "income_step": args.income_step,
+                "attributes": attributes,
+            },
+        )
 
-df_dedup.to_csv("perspectives.csv", index=False)
+    report = validation_report(source, output)
+    print_summary(source, output, report)
+    if args.report:
+        report.to_csv(args.report, index=False)
+    print(f"Wrote {args.output}")
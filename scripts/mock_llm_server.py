@@ -0,0 +1,45 @@
+"""Runs the mock LLM API locally so the app can be used without API keys
+
+    python -m scripts.mock_llm_server --port 8765 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock \
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=mock \
+    streamlit run app.py
+"""
+import argparse
+
+from utils.mock_llm import DEFAULT_PORT, MockLLM, serve
+
+
+def add_mock_llm_arguments(parser):
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-median", type=float, default=0.3, help="seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds")
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--null-content-rate", type=float, default=0.0)
+
+
+def mock_llm_from_args(args):
+    return MockLLM(
+        seed=args.seed,
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        server_error_rate=args.server_error_rate,
+        malformed_rate=args.malformed_rate,
+        null_content_rate=args.null_content_rate,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_mock_llm_arguments(parser)
+    args = parser.parse_args()
+
+    print(f"Mock LLM API listening on http://{args.host}:{args.port}")
+    serve(mock_llm_from_args(args), args.host, args.port)
@@ -0,0 +1,95 @@
+"""Import-time and memory breakdown of the app's cold start
+
+    python -m scripts.profile_startup app products.survey.survey --top 15
+
+Each module is imported in a fresh interpreter under python -X importtime.
+The report gives the total import time and peak memory, the time spent in
+each top-level package, and the slowest imports made directly by the module.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from collections import Counter
+
+
+CHILD_CODE = """
+import json, resource, sys, time
+start = time.perf_counter()
+error = None
+try:
+    # An import statement, unlike importlib, is logged with its nested imports
+    exec(f"import {sys.argv[1]}")
+except Exception as e:  # still report what was imported before the failure
+    error = f"{type(e).__name__}: {e}"
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "error": error,
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """(depth, self seconds, cumulative seconds, module) for each import"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append(
+            (depth, int(self_us) / 1e6, int(cumulative_us) / 1e6, name.strip())
+        )
+    return imports
+
+
+def profile_module(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_CODE, module],
+        capture_output=True,
+        text=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(result.stderr)
+    by_package = Counter()
+    for _, self_seconds, _, name in imports:
+        by_package[name.split(".")[0]] += self_seconds
+    report["module"] = module
+    report["by_package"] = dict(by_package.most_common())
+    # Depth 0 is the module itself; its direct imports are at depth 1
+    report["direct_imports"] = sorted(
+        ((name, cumulative) for depth, _, cumulative, name in imports if depth == 1),
+        key=lambda item: -item[1],
+    )
+    return report
+
+
+def print_report(report, top):
+    print(f"== {report['module']}")
+    print(f"Import time: {report['seconds']:.2f} s")
+    print(f"Peak memory: {report['max_rss_mb']:.0f} MB")
+    if report["error"]:
+        print(f"Import failed: {report['error']}")
+    print("By top-level package (self time):")
+    for package, seconds in list(report["by_package"].items())[:top]:
+        print(f"  {package:30s} {seconds:8.3f} s")
+    print("Slowest direct imports (cumulative):")
+    for name, seconds in report["direct_imports"][:top]:
+        print(f"  {name:30s} {seconds:8.3f} s")
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["app"])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", help="Also write the reports to this path")
+    args = parser.parse_args()
+
+    reports = [profile_module(module) for module in args.modules]
+    for report in reports:
+        print_report(report, args.top)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
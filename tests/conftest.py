@@ -0,0 +1,56 @@
+import pytest
+import tiktoken
+
+import utils.anthropic_utils
+import utils.openai_utils
+from utils.mock_llm import MockLLM, serve
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """Starts the mock LLM API on a free port and points the SDK clients at it
+
+    Returns a function that takes MockLLM options and returns the MockLLM.
+    """
+    servers = []
+
+    def start(**options):
+        llm = MockLLM(**{"latency_median": 0.001, **options})
+        server = serve(llm, port=0, in_thread=True)
+        servers.append(server)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        monkeypatch.setenv("OPENAI_BASE_URL", f"{url}/v1")
+        monkeypatch.setenv("OPENAI_API_KEY", "mock")
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", url)
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "mock")
+        # Clients are created on first use, so drop any made for another server
+        monkeypatch.setattr(utils.openai_utils, "openai_client_async", None)
+        monkeypatch.setattr(utils.anthropic_utils, "anthropic_client", None)
+        monkeypatch.setattr(utils.anthropic_utils, "anthropic_client_async", None)
+        return llm
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class WhitespaceEncoding:
+    """Stands in for tiktoken's encodings, which can't be downloaded in tests"""
+
+    def encode(self, text, **kwargs):
+        return text.split()
+
+    encode_ordinary = encode
+
+    def encode_ordinary_batch(self, texts, **kwargs):
+        return [text.split() for text in texts]
+
+
+@pytest.fixture
+def offline_encoding(monkeypatch):
+    """Counts tokens as whitespace-separated words"""
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: WhitespaceEncoding())
+    utils.openai_utils.get_encoding.cache_clear()
+    yield WhitespaceEncoding()
+    utils.openai_utils.get_encoding.cache_clear()
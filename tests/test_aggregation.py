@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import AGE_BINS, INCOME_BINS, LIKERT_LABELS, STATES
+from products.survey.aggregation import LikertAggregates
+from products.survey.demographics import DEMOGRAPHIC_LABELS
+
+
+def responses(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "age": rng.integers(18, 100, n),
+            "income": rng.lognormal(10.5, 1, n),
+            "state": rng.choice(list(STATES[:10]) + ["Atlantis"], n),  # some unknown
+            "backend": rng.choice(["primary", "secondary"], n),
+            "score": rng.integers(1, 6, n),
+        }
+    )
+
+
+def groupby_counts(df, *dimensions):
+    """Counts per level and score with pandas, as create_pivot_table did"""
+    levels = {
+        "age": pd.cut(df["age"], AGE_BINS, right=False, labels=DEMOGRAPHIC_LABELS["age"]),
+        "income": pd.cut(
+            df["income"], INCOME_BINS, right=False, labels=DEMOGRAPHIC_LABELS["income"]
+        ),
+        "state": df["state"].where(df["state"].isin(STATES)).astype(
+            pd.CategoricalDtype(STATES)
+        ),
+        "backend": df["backend"].astype("category"),
+    }
+    counts = df.groupby(
+        [levels[d] for d in dimensions] + [df["score"]], observed=False
+    ).size()
+    index = pd.MultiIndex.from_product(
+        [levels[d].cat.categories for d in dimensions] + [range(1, 6)]
+    )
+    shape = [len(levels[d].cat.categories) for d in dimensions] + [5]
+    return counts.reindex(index, fill_value=0).to_numpy().reshape(shape)
+
+
+@pytest.mark.parametrize(
+    "dimensions",
+    [("age",), ("income",), ("state",), ("backend",), ("age", "income"), ("income", "age")],
+)
+def test_counts_match_pandas_groupby(dimensions):
+    df = responses(5_000)
+    aggregates = LikertAggregates.from_responses(df)
+    np.testing.assert_array_equal(
+        aggregates.crosstab(*dimensions), groupby_counts(df, *dimensions)
+    )
+
+
+def test_overall_counts_include_unknown_levels():
+    df = responses(5_000)
+    aggregates = LikertAggregates.from_responses(df)
+    np.testing.assert_array_equal(
+        aggregates.overall(), df["score"].value_counts().reindex(range(1, 6)).to_numpy()
+    )
+    assert aggregates.total == len(df)
+    # Unknown states are left out of breakdowns only
+    assert aggregates.crosstab("age").sum() == len(df)
+    assert aggregates.crosstab("state").sum() == df["state"].isin(STATES).sum() < len(df)
+
+
+def test_labels_count_like_answer_numbers():
+    df = responses(1_000)
+    by_label = df.assign(score=np.asarray(LIKERT_LABELS)[df["score"] - 1])
+    np.testing.assert_array_equal(
+        LikertAggregates.from_responses(by_label).counts,
+        LikertAggregates.from_responses(df).counts,
+    )
+
+
+def test_pivot_shares_match_pandas_crosstab():
+    df = responses(5_000)
+    pivot = LikertAggregates.from_responses(df).pivot("income")
+    levels = pd.cut(
+        df["income"], INCOME_BINS, right=False, labels=DEMOGRAPHIC_LABELS["income"]
+    )
+    expected = pd.crosstab(levels, df["score"], normalize="index")
+    assert pivot["income"].tolist() == list(DEMOGRAPHIC_LABELS["income"])
+    np.testing.assert_allclose(pivot[LIKERT_LABELS].to_numpy(), expected.to_numpy())
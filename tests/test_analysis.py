@@ -0,0 +1,43 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from products.survey.analysis import weighted_likert_estimates
+
+
+def respondents(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "age": rng.integers(18, 90, n),
+            "income": rng.lognormal(10.5, 1, n),
+            "score": rng.integers(1, 6, n),
+            "weight": rng.lognormal(0, 0.5, n),
+        }
+    )
+
+
+def test_continuous_weights_match_the_analytic_standard_error():
+    df = respondents(20_000)
+    estimates = weighted_likert_estimates(df, weight_col="weight")
+
+    w, y = df["weight"].to_numpy(), df["score"].to_numpy()
+    mean = np.average(y, weights=w)
+    standard_error = np.sqrt(np.sum(w**2 * (y - mean) ** 2)) / w.sum()
+    assert np.isclose(estimates["mean"][0], mean)
+    bootstrap_error = (estimates["mean_upper"][0] - estimates["mean_lower"][0]) / 3.92
+    assert abs(bootstrap_error / standard_error - 1) < 0.1
+
+
+def test_levels_without_respondents_are_nan_without_warnings():
+    df = respondents(2_000)
+    population = respondents(5_000, seed=1).drop(columns="score")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        estimates = weighted_likert_estimates(df, by=["age"], population=population)
+
+    empty = estimates["n"] == 0
+    assert empty.any() and not empty.all()
+    assert estimates.loc[empty, ["mean", "mean_lower", "mean_upper"]].isna().all().all()
+    assert estimates.loc[~empty, ["mean_lower", "mean_upper"]].notna().all().all()
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+
+import utils.backend_utils as backend_utils
+from utils.backend_utils import Backend, BackendPool, get_backend_pool
+from utils.mock_llm import MockBackend, MockLLM
+
+
+def test_backend_must_implement_complete():
+    class Incomplete(Backend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete")
+
+
+def test_pools_are_built_once_per_model(monkeypatch):
+    monkeypatch.setattr(
+        backend_utils,
+        "SURVEY_BACKEND_POOLS",
+        {"GPT-4o-mini": [{"provider": "openai", "name": "pool-test", "model_type": "GPT-4o-mini", "api_key": "test"}]},
+    )
+    get_backend_pool.cache_clear()
+    try:
+        pool = get_backend_pool("GPT-4o-mini")
+        assert isinstance(pool, BackendPool)
+        assert get_backend_pool("GPT-4o-mini") is pool
+        assert get_backend_pool("GPT-4o") is None
+    finally:
+        get_backend_pool.cache_clear()
+
+
+class CountingBackend(MockBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight_seen = []
+
+    async def complete(self, prompt, temperature, max_tokens):
+        self.in_flight_seen.append(self.limiter.in_flight)
+        return await super().complete(prompt, temperature, max_tokens)
+
+
+def test_shared_pool_keeps_its_limits_across_threads():
+    backend = CountingBackend(
+        "pool-test-shared", MockLLM(latency_median=0.005), max_concurrency=3
+    )
+    pool = BackendPool([backend])
+
+    async def run():
+        return await asyncio.gather(
+            *(pool.complete(f"prompt {threading.get_ident()} {i}", 1.0, 1) for i in range(30))
+        )
+
+    threads = [threading.Thread(target=asyncio.run, args=(run(),)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(backend.in_flight_seen) == 120
+    assert max(backend.in_flight_seen) <= 3
+    assert backend.limiter.in_flight == 0
@@ -0,0 +1,60 @@
+import runpy
+import sys
+
+import pytest
+
+from utils.export_utils import read_export
+
+
+STATEMENT = "Cities should ban cars downtown."
+
+
+def run_cli(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["hivesight", *args])
+    runpy.run_module("hivesight", run_name="__main__", alter_sys=True)
+
+
+def test_estimate_only_prints_the_estimate_without_running(
+    monkeypatch, capsys, offline_encoding, mock_api
+):
+    llm = mock_api()
+    run_cli(
+        monkeypatch,
+        "survey",
+        "--statement", STATEMENT,
+        "--n", "20",
+        "--seed", "7",
+        "--estimate-only",
+    )
+
+    out = capsys.readouterr().out
+    assert "Personas:    20 (seed 7)" in out
+    assert "Estimate:    $" in out
+    assert "Responses:" not in out
+    assert not llm.attempts
+
+
+def test_survey_writes_responses_with_its_settings(
+    monkeypatch, capsys, offline_encoding, mock_api, tmp_path
+):
+    mock_api()
+    out_path = str(tmp_path / "results.parquet")
+    run_cli(
+        monkeypatch,
+        "survey",
+        "--statement", STATEMENT,
+        "--n", "20",
+        "--seed", "7",
+        "--workers", "1",
+        "--out", out_path,
+    )
+
+    assert "Responses:   20" in capsys.readouterr().out
+    responses, metadata = read_export(out_path)
+    assert len(responses) == 20 and responses["score"].between(1, 5).all()
+    assert metadata["statement"] == STATEMENT and metadata["sampling_seed"] == 7
+
+
+def test_unknown_attributes_are_rejected(monkeypatch, offline_encoding):
+    with pytest.raises(SystemExit, match="Unknown --attributes shoe_size"):
+        run_cli(monkeypatch, "survey", "--statement", STATEMENT, "--attributes", "shoe_size")
@@ -0,0 +1,37 @@
+import os
+
+from utils.code_utils import code_bundle_cache, gather_code
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_bundle_covers_subpackages_and_skips_caches(tmp_path):
+    write(tmp_path / "app.py", "APP = 1\n")
+    write(tmp_path / "utils" / "helpers.py", "HELPER = 2\n")
+    write(tmp_path / "utils" / "__pycache__" / "stale.py", "STALE = 3\n")
+    write(tmp_path / ".venv" / "site.py", "SITE = 4\n")
+    write(tmp_path / "notes.txt", "not code\n")
+
+    code = gather_code(str(tmp_path))
+    assert "# File: app.py\n\nAPP = 1" in code
+    assert f"# File: {os.path.join('utils', 'helpers.py')}\n\nHELPER = 2" in code
+    assert "STALE" not in code and "SITE" not in code and "not code" not in code
+
+
+def test_bundle_is_rebuilt_only_when_files_change(tmp_path):
+    root = str(tmp_path)
+    write(tmp_path / "app.py", "APP = 1\n")
+    code = gather_code(root)
+    assert gather_code(root) is code
+
+    stat = os.stat(tmp_path / "app.py")
+    write(tmp_path / "app.py", "APP = 2\n")
+    os.utime(tmp_path / "app.py", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert "APP = 2" in gather_code(root)
+
+    write(tmp_path / "new.py", "NEW = 3\n")
+    assert "NEW = 3" in gather_code(root)
+    code_bundle_cache.pop(root)
@@ -0,0 +1,35 @@
+from collections import Counter
+
+import pytest
+
+from config import DEFAULT_PERSONAS
+from products.council.bulk import BulkCouncilRun
+from products.council.costs import estimate_advisor_round_cost, estimate_summary_cost
+
+# Anthropic's Sonnet prices, per million tokens: advisors and the summarizer
+# both call ANTHROPIC_MODEL
+SONNET_INPUT, SONNET_OUTPUT = 3.0, 15.0
+
+
+def test_cost_report_prices_tokens_at_the_called_models_rates(offline_encoding, tmp_path):
+    advisors = {persona: DEFAULT_PERSONAS[persona] for persona in ["CEO", "CFO"]}
+    questions = ["Should we open an office in Lisbon?", "Should we hire a CTO?"]
+    run = BulkCouncilRun(questions, advisors, str(tmp_path / "checkpoint.jsonl"))
+    run.advisor_usage = Counter(input_tokens=10_000, output_tokens=2_000)
+    run.summary_usage = Counter(input_tokens=4_000, output_tokens=1_000)
+
+    report = run.cost_report()
+
+    assert report["advisor_cost"] == pytest.approx((10_000 * SONNET_INPUT + 2_000 * SONNET_OUTPUT) / 1e6)
+    assert report["summary_cost"] == pytest.approx((4_000 * SONNET_INPUT + 1_000 * SONNET_OUTPUT) / 1e6)
+    assert report["total_cost"] == pytest.approx(report["advisor_cost"] + report["summary_cost"])
+    assert report["advisor_tokens"] == {"input_tokens": 10_000, "output_tokens": 2_000}
+
+    # Each advisor may answer with up to max_tokens, at Sonnet's output rate
+    assert estimate_advisor_round_cost(questions[0], 2, 800) > 2 * 800 * SONNET_OUTPUT / 1e6
+    assert report["estimated_max_cost"] == pytest.approx(
+        sum(
+            estimate_advisor_round_cost(q, 2, 800) + estimate_summary_cost(q, 2)
+            for q in questions
+        )
+    )
@@ -0,0 +1,40 @@
+import pytest
+
+import products.council.logic as logic
+
+
+@pytest.fixture
+def debate(monkeypatch):
+    """process_debate_request with advisors whose consensus moves by the
+    given steps each round, and every round estimated at $1"""
+
+    def run(consensus_steps, max_rounds, budget):
+        rounds_run, scores = [], iter(consensus_steps)
+        monkeypatch.setattr(logic, "get_all_advisors", lambda: {"CEO": {}, "CFO": {}})
+        monkeypatch.setattr(logic, "estimate_advisor_round_cost", lambda *args: 1.0)
+        monkeypatch.setattr(
+            logic,
+            "run_advisor_round",
+            lambda *args: rounds_run.append(args[-1]) or {"CEO": {}, "CFO": {}},
+        )
+        monkeypatch.setattr(logic, "format_digests", lambda responses: "digests")
+        monkeypatch.setattr(logic, "estimate_input_tokens", lambda texts, model: 100)
+        monkeypatch.setattr(logic, "consensus_score", lambda responses: next(scores))
+        monkeypatch.setattr(logic, "display_consensus", lambda *args: None)
+        monkeypatch.setattr(logic, "summarize_advice", lambda *args: None)
+        spent = logic.process_debate_request("Q?", ["CEO", "CFO"], 800, max_rounds, budget, "key")
+        return spent, rounds_run
+
+    return run
+
+
+def test_a_debate_that_reaches_consensus_costs_only_its_rounds(debate):
+    spent, rounds_run = debate([0.2, 0.6, 0.61], max_rounds=5, budget=5.0)
+    assert rounds_run == [1, 2, 3]
+    assert spent == 3.0
+
+
+def test_a_debate_stops_before_a_round_over_budget(debate):
+    spent, rounds_run = debate([0.1, 0.5, 0.9, 0.2, 0.7], max_rounds=5, budget=2.5)
+    assert rounds_run == [1, 2]
+    assert spent == 2.0
@@ -0,0 +1,79 @@
+from streamlit.testing.v1 import AppTest
+
+import products.council.main
+from products.council.costs import estimate_summary_cost
+from utils.credit_utils import get_cost_in_credits
+
+
+def council_page():
+    from products.council.main import render
+
+    render()
+
+
+def open_council_page(monkeypatch, tmp_path, charges):
+    monkeypatch.chdir(tmp_path)  # for the SQLite council store
+    main = products.council.main
+    monkeypatch.setattr(main, "get_credits_available", lambda email: 10**6)
+    monkeypatch.setattr(
+        main, "update_credit_usage_history", lambda email, credits: charges.append(credits)
+    )
+    monkeypatch.setattr(main, "create_credit_purchase_sidebar", lambda: None)
+    monkeypatch.setattr(main, "create_free_credits_sidebar", lambda: None)
+
+    at = AppTest.from_function(council_page, default_timeout=60)
+    at.session_state["email"] = "test@example.com"
+    at.run()
+    return at
+
+
+def ask(at, text):
+    question = next(t for t in at.text_input if t.label.startswith("Enter your question"))
+    question.input(text).run()
+
+
+def required_credits(at):
+    (line,) = [m.value for m in at.markdown if "Credits Required" in m.value]
+    return int(line.rsplit(" ", 1)[1])
+
+
+def test_advice_is_charged_in_credits(mock_api, offline_encoding, monkeypatch, tmp_path):
+    mock_api()
+    charges = []
+    at = open_council_page(monkeypatch, tmp_path, charges)
+    ask(at, "Should we open an office in Lisbon?")
+    next(b for b in at.button if b.label == "Proceed to Cost Estimation").click().run()
+    assert not at.exception
+    assert at.session_state["step"] == 2
+
+    next(b for b in at.button if b.label == "Get Advice").click().run()
+    assert not at.exception
+    assert len(charges) == 1 and isinstance(charges[0], int) and charges[0] >= 1
+    assert charges == [required_credits(at)]
+
+
+def test_debates_are_charged_for_the_rounds_they_ran(
+    mock_api, offline_encoding, monkeypatch, tmp_path
+):
+    mock_api()
+    charges, debate_costs = [], []
+    at = open_council_page(monkeypatch, tmp_path, charges)
+    run_debate = products.council.main.process_debate_request
+
+    def record_debate(*args):
+        debate_costs.append(run_debate(*args))
+        return debate_costs[-1]
+
+    monkeypatch.setattr(products.council.main, "process_debate_request", record_debate)
+    question = "Should we move our headquarters to Porto?"
+    ask(at, question)
+    at.toggle[0].set_value(True).run()
+    next(s for s in at.slider if s.label == "Max debate rounds").set_value(5).run()
+    next(b for b in at.button if b.label == "Proceed to Cost Estimation").click().run()
+    next(b for b in at.button if b.label == "Get Advice").click().run()
+
+    assert not at.exception
+    assert charges == [
+        get_cost_in_credits(round(debate_costs[0] + estimate_summary_cost(question, 2), 4))
+    ]
+    assert charges[0] <= required_credits(at)
@@ -0,0 +1,100 @@
+import pytest
+
+from products.council.store import SQLiteCouncilStore, fts_query, request_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteCouncilStore(str(tmp_path / "council.db"))
+
+
+def search_index_rowids(store, text):
+    rows = store.execute(
+        "SELECT rowid FROM council_sessions_search WHERE council_sessions_search MATCH ?",
+        (text,),
+    )
+    return [row[0] for row in rows]
+
+
+def test_resaving_a_session_reindexes_it(store):
+    store.save_session("a@example.com", "key", "Should we sell apples?", ["CEO"], "Yes.", {"v": 1})
+    store.save_session("a@example.com", "key", "Should we sell pears?", ["CEO"], "No.", {"v": 2})
+
+    assert store.find_session("a@example.com", "key") == {"v": 2}
+    assert search_index_rowids(store, "apples") == []
+    sessions, total = store.history("a@example.com", "pears")
+    assert total == 1 and sessions[0]["question"] == "Should we sell pears?"
+    assert store.history("a@example.com", "apples") == ([], 0)
+
+
+def test_advisors_round_trip_per_user(store):
+    store.save_advisor("a@example.com", "CTO", "Runs engineering", {"Python": 8})
+    store.save_advisor("a@example.com", "CTO", "Runs all of tech", {"Python": 8, "Go": 7})
+    store.save_advisor("a@example.com", "Lawyer", "", {})
+    store.save_advisor("b@example.com", "CTO", "Someone else's", {})
+
+    assert store.list_advisors("a@example.com") == {
+        "CTO": {"description": "Runs all of tech", "expertise": {"Python": 8, "Go": 7}},
+        "Lawyer": {"description": "", "expertise": {}},
+    }
+    store.delete_advisor("a@example.com", "CTO")
+    assert list(store.list_advisors("a@example.com")) == ["Lawyer"]
+    assert list(store.list_advisors("b@example.com")) == ["CTO"]
+
+
+def test_sessions_round_trip_per_user(store):
+    result = {"responses": {"CEO": {"advice": "Go ahead", "confidence": 0.8}}, "rounds": 2}
+    store.save_session("a@example.com", "key", "Open in Lisbon?", ["CEO"], "Go ahead.", result)
+
+    assert store.find_session("a@example.com", "key") == result
+    assert store.find_session("a@example.com", "other") is None
+    assert store.find_session("b@example.com", "key") is None
+    (session,), total = store.history("a@example.com")
+    assert total == 1
+    assert session["question"] == "Open in Lisbon?" and session["advisors"] == ["CEO"]
+
+
+def test_request_key_ignores_whitespace_but_not_settings():
+    advisors = {"CEO": {"description": "Leads", "expertise": {}}}
+    key = request_key("Open in  Lisbon?", advisors, 800, 1)
+    assert key == request_key(" Open in Lisbon? ", advisors, 800, 1)
+    assert key != request_key("Open in Lisbon?", advisors, 800, 2)
+
+
+def test_fts_query_quotes_every_word():
+    assert fts_query('say "hi" NOT -x*') == '"say"* """hi"""* "NOT"* "-x*"*'
+    assert fts_query("   ") == ""
+
+
+@pytest.mark.parametrize(
+    "query", ['"', 'open "Lisbon', "NOT Lisbon", "Lisbon OR", "NEAR(a b)", "col:x", "a AND (b", "-", "*"]
+)
+def test_search_takes_fts_syntax_literally(store, query):
+    store.save_session("a@example.com", "key", "Open in Lisbon?", ["CEO"], "Yes.", {})
+    sessions, total = store.history("a@example.com", query)
+    assert total == len(sessions)
+
+
+def test_search_matches_word_prefixes_in_questions_and_summaries(store):
+    store.save_session("a@example.com", "1", "Open in Lisbon?", ["CEO"], "Rents are rising.", {})
+    store.save_session("a@example.com", "2", "Hire a CTO?", ["CFO"], "Not yet.", {})
+
+    assert store.history("a@example.com", "lisb")[1] == 1
+    assert store.history("a@example.com", "rent")[1] == 1
+    assert store.history("a@example.com", "NOT")[0][0]["question"] == "Hire a CTO?"
+    assert store.history("b@example.com", "lisbon") == ([], 0)
+
+
+def test_history_pages_newest_first_with_totals(store):
+    for i in range(7):
+        store.save_session("a@example.com", str(i), f"Question {i} about pricing", [], "", {})
+    store.save_session("a@example.com", "other", "Unrelated", [], "", {})
+    store.save_session("b@example.com", "0", "Question about pricing", [], "", {})
+
+    pages = [store.history("a@example.com", "pricing", page, page_size=3) for page in range(4)]
+
+    assert [total for _, total in pages] == [7, 7, 7, 7]
+    questions = [session["question"] for sessions, _ in pages for session in sessions]
+    assert questions == [f"Question {i} about pricing" for i in reversed(range(7))]
+    assert [len(sessions) for sessions, _ in pages] == [3, 3, 1, 0]
+    assert store.history("a@example.com", page=0, page_size=3)[1] == 8
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import products.council.logic as logic
+from products.council.summary import format_digests, get_summary
+
+
+RESPONSES = {
+    "CEO": {
+        "advice": "A long memo. " * 500,
+        "summary": "Expand into Europe next year.",
+        "key_takeaways": ["Hire locally", "Start in Germany"],
+        "confidence": 8,
+    },
+    "CFO": {
+        "advice": "Another long memo. " * 500,
+        "summary": "Wait until margins improve.",
+        "key_takeaways": ["Protect cash"],
+        "confidence": 6,
+    },
+}
+
+
+def test_digests_leave_out_the_full_advice():
+    digests = format_digests(RESPONSES)
+    assert "memo" not in digests
+    assert (
+        "CEO (confidence 8/10): Expand into Europe next year.\n"
+        "- Hire locally\n- Start in Germany"
+    ) in digests
+    assert "CFO (confidence 6/10): Wait until margins improve.\n- Protect cash" in digests
+    assert len(digests) < 300
+
+
+def test_summary_maps_sentiments_by_advisor(mock_api):
+    mock_api()
+    summary = get_summary("Should we expand?", format_digests(RESPONSES))
+    assert set(summary) == {"summary", "consensus_level", "sentiments", "key_takeaways"}
+    assert isinstance(summary["sentiments"], dict)
+    assert set(summary["sentiments"].values()) <= {"positive", "neutral", "negative"}
+
+
+def test_advisors_are_consulted_at_once(monkeypatch):
+    async def slow_advisor(question, persona, *args):
+        await asyncio.sleep(0.2 if persona != "CTO" else 0.05)
+        return None if persona == "COO" else {"persona": persona}
+
+    monkeypatch.setattr(logic, "get_advisor_response", slow_advisor)
+    personas = ["CEO", "CFO", "CTO", "COO", "CMO"]
+    arrived = []
+    start = time.monotonic()
+    asyncio.run(
+        logic.consult_advisors(
+            "Q?",
+            personas,
+            {persona: {} for persona in personas},
+            800,
+            lambda persona, response: arrived.append((persona, response)),
+        )
+    )
+
+    assert time.monotonic() - start < 0.5
+    assert arrived[0] == ("CTO", {"persona": "CTO"})  # in the order they answer
+    assert dict(arrived)["COO"] is None
+    assert sorted(dict(arrived)) == sorted(personas)
@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+from anthropic.types import Message, TextBlock, ToolUseBlock, Usage
+
+from config import COUNCIL_ADVISOR_TOOL, COUNCIL_SUMMARY_TOOL
+from products.council.utils import read_tool_input
+
+
+ADVICE = {
+    "advice": "Hire slowly.",
+    "summary": "Hire slowly.",
+    "key_takeaways": ["Hire slowly"],
+    "confidence": 7,
+}
+
+
+def message(*content, stop_reason="tool_use"):
+    return Message(
+        id="msg_test",
+        type="message",
+        role="assistant",
+        model="claude-test",
+        content=list(content),
+        stop_reason=stop_reason,
+        usage=Usage(input_tokens=10, output_tokens=10),
+    )
+
+
+def tool_use(input, name=COUNCIL_ADVISOR_TOOL["name"]):
+    return ToolUseBlock(id="toolu_test", type="tool_use", name=name, input=input)
+
+
+def test_valid_input_is_returned():
+    text = TextBlock(type="text", text="Here is my advice.")
+    assert read_tool_input(message(text, tool_use(ADVICE)), COUNCIL_ADVISOR_TOOL) == ADVICE
+
+
+@pytest.mark.parametrize(
+    "input",
+    [
+        {**ADVICE, "confidence": 11},
+        {**ADVICE, "confidence": "high"},
+        {**ADVICE, "key_takeaways": []},
+        {key: value for key, value in ADVICE.items() if key != "summary"},
+    ],
+)
+def test_input_not_matching_the_schema_is_rejected(input, caplog):
+    with caplog.at_level(logging.WARNING):
+        assert read_tool_input(message(tool_use(input)), COUNCIL_ADVISOR_TOOL) is None
+    assert "Invalid record_advice input" in caplog.text
+
+
+def test_input_cut_off_by_max_tokens_is_rejected():
+    truncated = message(tool_use({"advice": "Hire"}), stop_reason="max_tokens")
+    assert read_tool_input(truncated, COUNCIL_ADVISOR_TOOL) is None
+
+
+def test_calls_to_other_tools_are_ignored(caplog):
+    summary = {
+        "summary": "They agree.",
+        "consensus_level": 8,
+        "sentiments": [{"advisor": "CEO", "sentiment": "upbeat"}],
+        "key_takeaways": [],
+    }
+    other = message(tool_use(ADVICE), tool_use(summary, COUNCIL_SUMMARY_TOOL["name"]))
+    with caplog.at_level(logging.WARNING):
+        # The sentiment isn't one of the allowed values
+        assert read_tool_input(other, COUNCIL_SUMMARY_TOOL) is None
+        assert read_tool_input(message(tool_use(ADVICE)), COUNCIL_SUMMARY_TOOL) is None
+    assert "No record_summary call in the response (stop reason: tool_use)" in caplog.text
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from config import AGE_BINS, INCOME_BINS, STATES
+from products.survey.demographics import (
+    CODE_COLUMNS,
+    DEMOGRAPHIC_LABELS,
+    add_demographic_codes,
+    compute_demographic_codes,
+    demographic_codes,
+)
+
+
+PEOPLE = pd.DataFrame(
+    {
+        "age": [0, 17, 18, 24.5, 25, 64, 65, 104, -3, np.nan],
+        "income": [0, 29_999.5, 30_000, 59_999, 60_000, 119_999, 120_000, 5e6, -1, np.nan],
+        "state": ["AK", "WY", "DC", "CA", "TX", "NY", "OH", "PR", None, "ca"],
+    }
+)
+
+
+def test_codes_label_values_like_pandas_cut():
+    for dimension, bins in [("age", AGE_BINS), ("income", INCOME_BINS)]:
+        codes = compute_demographic_codes(PEOPLE, dimension)
+        labels = np.asarray(DEMOGRAPHIC_LABELS[dimension] + ("unknown",))[codes]
+        expected = pd.cut(
+            PEOPLE[dimension], bins, right=False, labels=DEMOGRAPHIC_LABELS[dimension]
+        )
+        assert labels.tolist() == expected.astype(object).fillna("unknown").tolist()
+
+
+def test_state_codes_round_trip():
+    codes = compute_demographic_codes(PEOPLE, "state")
+    known = PEOPLE["state"].isin(STATES).to_numpy()
+    assert [STATES[code] for code in codes[known]] == PEOPLE["state"][known].tolist()
+    assert (codes[~known] == -1).all()
+
+
+def test_labels_are_formatted_without_the_locale():
+    assert DEMOGRAPHIC_LABELS["age"][:2] == ("0-17", "18-24")
+    assert DEMOGRAPHIC_LABELS["age"][-1] == "65+"
+    assert DEMOGRAPHIC_LABELS["income"][1] == "30,000-59,999"
+    assert DEMOGRAPHIC_LABELS["income"][-1] == "120,000+"
+
+
+def test_precomputed_codes_are_small_and_reused():
+    df = add_demographic_codes(PEOPLE.copy())
+    for dimension, column in CODE_COLUMNS.items():
+        assert df[column].dtype == np.int8
+        np.testing.assert_array_equal(
+            df[column], compute_demographic_codes(PEOPLE, dimension)
+        )
+    # The stored column wins, e.g. once responses carry the codes of personas
+    df[CODE_COLUMNS["state"]] = np.int8(0)
+    assert (demographic_codes(df, "state") == 0).all()
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import STATES
+from hivesight.distributed import run_plan_distributed, share_rate_limits
+from hivesight.survey import plan_survey, run_plan
+from products.survey.aggregation import LikertAggregates
+
+
+def test_merged_shards_count_like_one_run():
+    rng = np.random.default_rng(0)
+    n = 3_000
+    df = pd.DataFrame(
+        {
+            "age": rng.integers(18, 100, n),
+            "income": rng.lognormal(10.5, 1, n),
+            "state": rng.choice(STATES, n),
+            "score": rng.integers(1, 6, n),
+        }
+    )
+    # Each shard only saw some of the backends
+    df["backend"] = np.where(
+        np.arange(n) < 1_000, "primary", rng.choice(["primary", "secondary"], n)
+    )
+    shards = [df.iloc[:1_000], df.iloc[1_000:2_500], df.iloc[2_500:]]
+
+    merged = LikertAggregates.merge([LikertAggregates.from_responses(s) for s in shards])
+    whole = LikertAggregates.from_responses(df)
+    assert merged.dimensions == whole.dimensions
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+
+
+def test_rate_limits_are_shared_between_workers():
+    specs = [{"provider": "openai", "name": "a", "rpm": 1000, "tpm": 3}, {"name": "b"}]
+    assert share_rate_limits(specs, 4) == [
+        {"provider": "openai", "name": "a", "rpm": 250, "tpm": 1},
+        {"name": "b"},
+    ]
+
+
+def test_sharded_run_matches_a_single_run(offline_encoding, mock_api):
+    mock_api()
+    plan = plan_survey("Cities should ban cars downtown.", 30, seed=3)
+    with ThreadPoolExecutor(2) as executor:
+        sharded = run_plan_distributed(plan, 2, shard_size=7, executor=executor)
+    single = run_plan(plan)
+
+    pd.testing.assert_frame_equal(sharded.responses, single.responses)
+    np.testing.assert_array_equal(
+        sharded.aggregates.counts, LikertAggregates.from_responses(single.responses).counts
+    )
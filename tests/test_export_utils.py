@@ -0,0 +1,54 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import utils.export_utils as export_utils
+from utils.export_utils import EXPORT_FORMATS, export_table, read_export
+
+
+METADATA = {
+    "model": "GPT-4o-mini",
+    "statement": 'Cities should "build more" housing.\nSay why.',
+    "seed": 1234,
+    "cost": 0.0421,
+    "choices": None,
+}
+
+
+def results(n=10):
+    return pd.DataFrame(
+        {
+            "age": np.arange(n) + 18,
+            "income": np.linspace(10_000.5, 90_000.25, n),
+            "state": ["CA", "NY, \"upstate\""] * (n // 2),
+            # All missing in the last chunks, which mustn't change its type
+            "theme": ["Cost"] * 4 + [None] * (n - 4),
+            "valid": [True, False] * (n // 2),
+        }
+    )
+
+
+@pytest.mark.parametrize("format", list(EXPORT_FORMATS))
+def test_chunked_exports_read_back_equal(format, monkeypatch, tmp_path):
+    monkeypatch.setattr(export_utils, "EXPORT_CHUNK_ROWS", 3)
+    df = results()
+    path = tmp_path / f"results.{EXPORT_FORMATS[format].extension}"
+    with export_table(df, format, METADATA) as file:
+        path.write_bytes(file.read())
+
+    read, metadata = read_export(str(path))
+    assert metadata == METADATA
+    pd.testing.assert_frame_equal(read, df, check_dtype=format == "Parquet")
+    if format == "Parquet":
+        assert pq.ParquetFile(path).metadata.num_row_groups == 4
+
+
+def test_csv_chunks_share_one_header(monkeypatch, tmp_path):
+    monkeypatch.setattr(export_utils, "EXPORT_CHUNK_ROWS", 3)
+    with export_table(results(), "CSV") as file:
+        text = gzip.decompress(file.read()).decode()
+    assert text.count("age,income,state,theme,valid") == 1
+    assert len(text.splitlines()) == 11
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from utils.hedge_utils import MIN_LATENCY_SAMPLES, HedgeBudget, LatencyTracker, hedged_call
+from utils.retry_utils import call_with_retries, get_circuit_breaker
+
+
+def warm_tracker(latency):
+    tracker = LatencyTracker(95)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        tracker.record(latency)
+    return tracker
+
+
+def running_clocks(tracker, elapsed, n):
+    clocks = [tracker.clock() for _ in range(n)]
+    for clock in clocks:
+        clock.start = time.monotonic() - elapsed
+    return clocks
+
+
+def run_hedged(model, latency):
+    async def request():
+        await asyncio.sleep(latency)
+        return "3"
+
+    async def main():
+        tracker, budget = warm_tracker(0.01), HedgeBudget(10, 1.0)
+        result = await hedged_call(
+            lambda: call_with_retries(request, model), tracker, budget
+        )
+        return result, budget.spent
+
+    return asyncio.run(main())
+
+
+def test_slow_attempt_is_hedged():
+    assert run_hedged("hedge-test-slow", 0.1) == ("3", 1)
+
+
+def test_waiting_for_a_paused_model_is_not_hedged():
+    breaker = get_circuit_breaker("hedge-test-paused")
+    breaker.resume_jitter = 0
+    breaker.pause(0.2)
+    # The call spends 0.2 s waiting on the breaker but only 5 ms in flight
+    assert run_hedged("hedge-test-paused", 0.005) == ("3", 0)
+
+
+def test_calls_in_flight_keep_the_percentile_unknown_early_in_a_batch():
+    # The first 20 of 100 calls to finish were fast; the other 80 have
+    # already run longer, so the 95th percentile isn't known yet
+    tracker = warm_tracker(0.01)
+    assert tracker.threshold() == 0.01
+    running_clocks(tracker, 0.5, 80)
+    assert tracker.threshold() is None
+
+
+def test_calls_in_flight_count_only_while_they_run():
+    tracker = warm_tracker(0.01)
+    for i in range(75):
+        tracker.record(0.02 + i / 1000)
+    clocks = running_clocks(tracker, 0.5, 5)
+    # 5 of 100 calls outlast every finished one: the percentile is the slowest
+    assert tracker.threshold() == 0.094
+
+    # Calls waiting for a retry or their turn, and finished calls, aren't counted
+    clocks[0].start = None
+    clocks[1].stop()
+    clocks[1].start = time.monotonic()
+    assert tracker.running == set(clocks[2:])
+
+
+def test_fast_first_finishers_dont_trigger_hedges():
+    async def main():
+        tracker, budget = warm_tracker(0.01), HedgeBudget(100, 1.0)
+        clocks = running_clocks(tracker, 0.05, 80)
+
+        async def request():
+            await asyncio.sleep(0.1)
+            return "3"
+
+        result = await hedged_call(
+            lambda: call_with_retries(request, "hedge-test-early"), tracker, budget
+        )
+        return result, budget.spent, tracker.running == set(clocks)
+
+    assert asyncio.run(main()) == ("3", 0, True)
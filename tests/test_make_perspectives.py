@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from products.survey.data_handling import LEGACY_PERSPECTIVES_PATH
+from scripts.make_perspectives import (
+    KEY_COLUMNS,
+    derive_columns,
+    merge_rows,
+    quantize,
+    validation_report,
+)
+
+
+def people(n=20_000, seed=0):
+    rng = np.random.default_rng(seed)
+    income = rng.lognormal(10.5, 1, n)
+    income[rng.random(n) < 0.3] = 0
+    return pd.DataFrame(
+        {
+            "age": rng.uniform(0, 90, n),
+            "state": rng.choice(["CA", "NY", "TX"], n),
+            "income": income,
+            "sex": rng.choice(["female", "male"], n),
+            "household_size": rng.integers(1, 10, n).astype(float),
+            "weight": rng.lognormal(6, 1, n),
+        }
+    )
+
+
+def test_merged_rows_keep_the_weights():
+    source = people()
+    output = merge_rows(quantize(source, 5000))
+
+    assert len(output) < len(source)
+    assert np.isclose(output["weight"].sum(), source["weight"].sum())
+    assert not output.duplicated(output.columns.drop("weight").tolist()).any()
+    assert output[KEY_COLUMNS].equals(output[KEY_COLUMNS].sort_values(KEY_COLUMNS))
+    assert output["household_size"].max() == 7
+    # Incomes of 0 stay 0 and the others move to the middle of their band
+    zero = source["weight"][source["income"] == 0].sum()
+    assert np.isclose(output["weight"][output["income"] == 0].sum(), zero)
+    assert (output["income"][output["income"] > 0] % 5000 == 2500).all()
+
+    # Bands are multiples of the step, as are the app's income bins
+    report = validation_report(source, output)
+    for attribute in ["income", "state", "sex"]:
+        differences = report.loc[report["attribute"] == attribute, "difference"]
+        assert np.allclose(differences, 0, atol=1e-12)
+
+
+def test_rebinning_the_shipped_table_keeps_its_weight():
+    source = pd.read_csv(LEGACY_PERSPECTIVES_PATH)
+    output = merge_rows(quantize(source, 5000))
+    assert len(output) < len(source)
+    assert np.isclose(output["weight"].sum(), source["weight"].sum())
+
+
+def test_attributes_are_derived_per_person():
+    calculated = pd.DataFrame(
+        {
+            "age": [30, 70],
+            "state_code": ["CA", "NY"],
+            "employment_income": [0.0, 10.0],
+            "self_employment_income": [500.0, 0.0],
+            "is_male": [True, False],
+            "race": ["WHITE", "BLACK"],
+        }
+    )
+    derived = derive_columns(calculated, ["sex", "race", "employment"])
+    assert derived["sex"].tolist() == ["male", "female"]
+    assert derived["race"].tolist() == ["white", "black"]
+    assert derived["employment"].tolist() == ["employed", "employed"]
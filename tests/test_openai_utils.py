@@ -0,0 +1,36 @@
+import asyncio
+
+import utils.openai_utils
+from utils.openai_utils import run_batch_query
+
+
+def test_null_content_is_an_error_answer(mock_api):
+    mock_api(null_content_rate=0.5)
+    prompts = [f"Prompt {i}" for i in range(40)]
+
+    responses = run_batch_query(prompts, "GPT-4o-mini", max_tokens=1)
+
+    assert len(responses) == len(prompts)
+    errors = [r for r in responses if r.startswith("Error")]
+    assert errors and all("No content" in r for r in errors)
+    assert all(r in "12345" for r in responses if not r.startswith("Error"))
+
+
+def test_batch_keeps_at_most_max_concurrency_in_flight(monkeypatch):
+    in_flight, most_in_flight = 0, 0
+
+    async def query(prompt, model_type, temperature, max_tokens):
+        nonlocal in_flight, most_in_flight
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return "3"
+
+    monkeypatch.setattr(utils.openai_utils, "query_openai_async", query)
+    prompts = [f"Prompt {i}" for i in range(50)]
+
+    responses = run_batch_query(prompts, "GPT-4o-mini", hedge_percentile=95, max_concurrency=4)
+
+    assert responses == ["3"] * len(prompts)
+    assert most_in_flight == 4
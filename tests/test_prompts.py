@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+import tiktoken
+
+from products.survey.prompts import compile_prompt, create_prompt
+
+
+ATTRIBUTES = ("employed", "household_size", "notes")
+
+# The pre-tokenizer pattern of o200k_base, whose vocabulary can't be
+# downloaded in tests
+O200K_PATTERN = "|".join(
+    [
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""\p{N}{1,3}""",
+        r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+        r"""\s*[\r\n]+""",
+        r"""\s+(?!\S)""",
+        r"""\s+""",
+    ]
+)
+
+
+def toy_encoding():
+    """Bytes as tokens, plus merges of punctuation with a newline, which
+    the pre-tokenizer keeps together"""
+    ranks = {bytes([i]): i for i in range(256)}
+    for merged in [b".\n", b")\n", b" \n", b"er", b"ed"]:
+        ranks[merged] = len(ranks)
+    return tiktoken.Encoding("toy", pat_str=O200K_PATTERN, mergeable_ranks=ranks, special_tokens={})
+
+
+def personas():
+    return pd.DataFrame(
+        {
+            "age": [34.4, 45.5, 70.0],
+            "state": ["CA", "NY", "TX"],
+            "income": [52500.0, 0.0, 12345.5],
+            "employed": [True, False, True],
+            "household_size": [2.0, np.nan, 4.0],
+            "notes": ["Retired.", "  Works   (part-time)  ", None],
+        }
+    )
+
+
+def test_render_matches_render_many():
+    df = personas()
+    template = compile_prompt("likert", "Cities should ban cars downtown.", None, ATTRIBUTES)
+
+    rendered = [
+        create_prompt(persona, "Cities should ban cars downtown.", "likert", attributes=ATTRIBUTES)
+        for persona in df.to_dict("records")
+    ]
+
+    assert rendered == template.render_many(df)
+    assert "46-year-old" in rendered[1] and "Household size: unknown" in rendered[1]
+    assert "Employed: yes" in rendered[0] and "Notes: Works (part-time)" in rendered[1]
+
+
+def test_count_tokens_matches_encoding_the_prompts():
+    df = pd.concat([personas()] * 2, ignore_index=True)
+    df["notes"] = ["Retired.", "Works (part-time)", None, "", "N/A", "Employed by a 3rd-party."]
+    template = compile_prompt("likert", "Cities should ban cars downtown.", None, ATTRIBUTES)
+    encoding = toy_encoding()
+
+    counts = template.count_tokens(df, encoding)
+
+    expected = [len(encoding.encode(prompt)) for prompt in template.render_many(df)]
+    assert counts.tolist() == expected
+
+
+@pytest.mark.parametrize(
+    "question_type, statement, choices",
+    [
+        ("likert", 'The {city} council should "ban" cars.', None),
+        ("multiple_choice", "Which pet is best?  ", ("Cats {indoor}", "Dogs", "Neither.")),
+        ("open_ended", "What would you change about\nyour town's 10-year plan?", None),
+    ],
+)
+def test_every_question_type_counts_the_tokens_it_renders(question_type, statement, choices):
+    df = personas()
+    template = compile_prompt(question_type, statement, choices)
+    encoding = toy_encoding()
+
+    rendered = template.render_many(df)
+    assert [template.render(persona) for persona in df.to_dict("records")] == rendered
+    assert template.count_tokens(df, encoding).tolist() == [
+        len(encoding.encode(prompt)) for prompt in rendered
+    ]
+    # Compiled once per question
+    assert compile_prompt(question_type, statement, choices) is template
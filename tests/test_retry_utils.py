@@ -0,0 +1,39 @@
+import anthropic
+import httpx
+import openai
+import pytest
+
+from utils.mock_llm import make_status_error
+from utils.retry_utils import FATAL, RATE_LIMITED, TRANSIENT, classify_error
+
+
+REQUEST = httpx.Request("POST", "http://mock-llm.local")
+
+
+@pytest.mark.parametrize("sdk", [openai, anthropic])
+def test_sdk_errors_are_classified_by_type(sdk):
+    # Connection errors have no status code to fall back on
+    assert classify_error(sdk.APIConnectionError(request=REQUEST)) == TRANSIENT
+    assert classify_error(sdk.APITimeoutError(request=REQUEST)) == TRANSIENT
+    assert classify_error(make_status_error(429, {}, "Slow down", sdk)) == RATE_LIMITED
+    assert classify_error(make_status_error(500, {}, "Server error", sdk)) == TRANSIENT
+
+
+def test_exhausted_quota_is_not_retried():
+    error = openai.RateLimitError(
+        "You exceeded your current quota",
+        response=httpx.Response(429, request=REQUEST),
+        body={"code": "insufficient_quota"},
+    )
+    assert classify_error(error) == FATAL
+
+
+def test_other_errors_fall_back_on_their_status():
+    class ClientError(Exception):
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    assert classify_error(ClientError(429)) == RATE_LIMITED
+    assert classify_error(ClientError(503)) == TRANSIENT
+    assert classify_error(ClientError(401)) == FATAL
+    assert classify_error(ValueError("No content")) == FATAL
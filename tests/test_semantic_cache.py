@@ -0,0 +1,58 @@
+import numpy as np
+
+from products.council.semantic_cache import SemanticCache, cache_scope
+
+
+def embedding(angle):
+    """A 2-d embedding whose similarity to embedding(0) is cos(angle)"""
+    return np.array([np.cos(angle), np.sin(angle)]) * 3  # not unit length
+
+
+def at_similarity(similarity):
+    return embedding(np.arccos(similarity))
+
+
+SCOPE = cache_scope("a@example.com", "CEO", {"description": "Runs the company"}, 800)
+
+
+def test_hits_only_at_or_above_the_threshold():
+    cache = SemanticCache(threshold=0.8)
+    cache.add(SCOPE, embedding(0), "Should we hire?", {"advice": "Yes"})
+
+    hit = cache.lookup(SCOPE, at_similarity(0.81))
+    assert hit.question == "Should we hire?" and hit.response == {"advice": "Yes"}
+    assert np.isclose(hit.similarity, 0.81, atol=1e-6)
+    assert cache.lookup(SCOPE, at_similarity(0.79)) is None
+
+
+def test_scopes_are_separate():
+    cache = SemanticCache(threshold=0.8)
+    cache.add(SCOPE, embedding(0), "Should we hire?", {"advice": "Yes"})
+    other_advisor = cache_scope("a@example.com", "CFO", {"description": "Runs the books"}, 800)
+    edited_advisor = cache_scope("a@example.com", "CEO", {"description": "Sells"}, 800)
+    assert cache.lookup(other_advisor, embedding(0)) is None
+    assert cache.lookup(edited_advisor, embedding(0)) is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = SemanticCache(threshold=0.99, max_entries=2)
+    cache.add(SCOPE, embedding(0), "first", {})
+    cache.add(SCOPE, embedding(1), "second", {})
+    assert cache.lookup(SCOPE, embedding(0)).question == "first"
+    cache.add(SCOPE, embedding(2), "third", {})
+
+    assert cache.lookup(SCOPE, embedding(0)).question == "first"
+    assert cache.lookup(SCOPE, embedding(1)) is None
+    assert cache.lookup(SCOPE, embedding(2)).question == "third"
+
+
+def test_least_recently_used_scopes_are_evicted():
+    cache = SemanticCache(threshold=0.99, max_scopes=2)
+    scopes = [cache_scope(f"{i}@example.com", "CEO", {}, 800) for i in range(3)]
+    cache.add(scopes[0], embedding(0), "first", {})
+    cache.add(scopes[1], embedding(0), "second", {})
+    assert cache.lookup(scopes[0], embedding(0)) is not None
+    cache.add(scopes[2], embedding(0), "third", {})
+
+    assert list(cache.scopes) == [scopes[0], scopes[2]]
+    assert cache.lookup(scopes[1], embedding(0)) is None
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+import products.survey.simulation as simulation
+from config import SURVEY_MAX_TOKENS
+from products.survey.simulation import (
+    batch_simulate_responses,
+    parse_choice_responses,
+    parse_numeric_responses,
+)
+
+
+CHOICES = ["Cats", "Dogs", "Neither"]
+LIKERT_RESPONSES = [
+    "3", " 5\n", "+2", "0", "6", "-1", "4.0", "Agree", "", "1 ", "Error: timed out", "02"
+]
+
+
+def parse_numeric_response(response, max_value):
+    """The per-row parser the vectorized one replaced"""
+    try:
+        score = int(response.strip())
+        if 1 <= score <= max_value:
+            return score
+    except ValueError:
+        pass
+    return None
+
+
+def test_numeric_parsing_matches_the_per_row_parser():
+    parsed = parse_numeric_responses(pd.Series(LIKERT_RESPONSES), 5)
+    expected = [parse_numeric_response(response, 5) for response in LIKERT_RESPONSES]
+    assert [None if np.isnan(value) else int(value) for value in parsed] == expected
+
+
+def test_results_match_the_per_row_loop(monkeypatch):
+    rng = np.random.default_rng(0)
+    n = len(LIKERT_RESPONSES)
+    personas = pd.DataFrame(
+        {
+            "age": rng.integers(18, 90, n),
+            "state": rng.choice(["Ohio", "Texas", "Utah"], n),
+            "income": rng.integers(10_000, 200_000, n),
+            "weight": rng.lognormal(0, 0.5, n),
+        }
+    )
+    monkeypatch.setattr(
+        simulation, "run_batch_query", lambda prompts, *args, **kwargs: LIKERT_RESPONSES
+    )
+    warnings = []
+    results = batch_simulate_responses(
+        "Statement",
+        None,
+        n,
+        "GPT-4o-mini",
+        personas,
+        ["prompt"] * n,
+        "likert",
+        warning_callback=warnings.append,
+    )
+
+    expected = []
+    for persona, response in zip(personas.to_dict("records"), LIKERT_RESPONSES):
+        if response.startswith("Error"):
+            continue
+        score = parse_numeric_response(response, 5)
+        if score is not None:
+            expected.append(
+                {
+                    "persona": f"{persona['age']}-year-old from {persona['state']} with annual income of ${persona['income']}",
+                    "age": persona["age"],
+                    "income": persona["income"],
+                    "state": persona["state"],
+                    "score": score,
+                    "backend": "GPT-4o-mini",
+                    "original_response": response,
+                    "weight": persona["weight"],
+                }
+            )
+    pd.testing.assert_frame_equal(results, pd.DataFrame(expected), check_dtype=False)
+    # One summary for the whole batch rather than a warning per answer
+    assert len(warnings) == 1
+    assert "1 API errors" in warnings[0] and "6 invalid Likert responses" in warnings[0]
+
+
+def test_choice_numbers_are_parsed():
+    responses = pd.Series(["2", " 3", "1.", "2) Dogs", "0", "4", "12", "1,000", "Dogs", ""])
+    parsed = parse_choice_responses(responses, CHOICES)
+    expected = [2, 3, 1, 2, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan]
+    np.testing.assert_array_equal(parsed.to_numpy(), expected)
+
+
+def test_choice_answers_fit_their_token_budget():
+    # A single token fits the number of a choice but not its text, so only
+    # the number is parsed
+    assert SURVEY_MAX_TOKENS["multiple_choice"] == 1
+    assert parse_choice_responses(pd.Series(["Neither"]), CHOICES).isna().all()
@@ -0,0 +1,83 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import products.survey.aggregation
+import products.survey.survey
+
+
+def survey_page():
+    from products.survey.survey import render
+
+    render()
+
+
+@pytest.fixture
+def page(mock_api, offline_encoding, monkeypatch):
+    mock_api()
+    survey = products.survey.survey
+    monkeypatch.setattr(survey, "get_credits_available", lambda email: 10**6)
+    monkeypatch.setattr(survey, "update_credit_usage_history", lambda email, credits: None)
+    monkeypatch.setattr(survey, "create_credit_purchase_sidebar", lambda: None)
+
+    at = AppTest.from_function(survey_page, default_timeout=60)
+    at.session_state["email"] = "test@example.com"
+    at.run()
+    at.text_area(key="widget").input("Cities should ban cars downtown.").run()
+    next(b for b in at.button if b.label.startswith("Run Simulation")).click().run()
+    assert not at.exception
+    return at
+
+
+def test_results_survive_reruns_from_cached_aggregates(page, monkeypatch):
+    run_id = page.session_state["run_id"]
+    assert run_id in products.survey.aggregation.aggregates_cache
+    assert page.header[0].value == "Simulation Results"
+
+    def recompute(*args, **kwargs):
+        raise AssertionError("aggregates were recomputed on rerun")
+
+    monkeypatch.setattr(
+        products.survey.aggregation.LikertAggregates, "from_responses", recompute
+    )
+    breakdown = next(s for s in page.selectbox if s.label == "Select breakdown type:")
+    breakdown.select("By State").run()
+
+    assert not page.exception
+    assert page.session_state["run_id"] == run_id
+    assert [h.value for h in page.subheader][:2] == [
+        "Overall Distribution",
+        "Demographic Breakdown",
+    ]
+
+
+def test_weighted_estimates_checkbox_shows_the_estimates(page):
+    assert not page.dataframe
+    page.checkbox[0].check().run()
+
+    assert not page.exception
+    overall, by_breakdown = page.dataframe
+    assert {"mean", "mean_lower", "mean_upper"} <= set(overall.value.columns)
+    assert len(overall.value) == 1
+    assert overall.value["n"].sum() == by_breakdown.value["n"].sum() > 0
+
+
+def test_weighted_estimates_are_bootstrapped_once_per_breakdown(page, monkeypatch):
+    calls = []
+    estimate = products.survey.survey.weighted_likert_estimates
+
+    def counted(df, by=(), **kwargs):
+        calls.append(tuple(by))
+        return estimate(df, by=by, **kwargs)
+
+    monkeypatch.setattr(products.survey.survey, "weighted_likert_estimates", counted)
+    page.checkbox[0].check().run()
+    assert calls == [(), ("age",)]
+
+    page.run()
+    breakdown = next(s for s in page.selectbox if s.label == "Select breakdown type:")
+    breakdown.select("By Income").run()
+    breakdown.select("By Age").run()
+
+    assert not page.exception
+    assert calls == [(), ("age",), ("income",)]
+    assert len(page.dataframe) == 2
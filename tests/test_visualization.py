@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from config import LIKERT_LABELS, STATES
+from products.survey.aggregation import LikertAggregates
+from products.survey.visualization import (
+    MAX_CACHED_FIGURES,
+    create_breakdown_figure,
+    create_overall_figure,
+    figure_cache,
+    get_cached_figure,
+)
+
+
+def responses(n, states=STATES[:5], seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "age": rng.integers(18, 100, n),
+            "income": rng.lognormal(10.5, 1, n),
+            "state": rng.choice(states, n),
+            "score": rng.integers(1, 6, n),
+        }
+    )
+
+
+def trace_json_size(fig):
+    """Size of the figure's traces in the JSON sent to the browser, without
+    the layout and template, which don't depend on the breakdown"""
+    return len(json.dumps(json.loads(fig.to_json())["data"]))
+
+
+def test_small_breakdowns_are_stacked_bars():
+    aggregates = LikertAggregates.from_responses(responses(2_000))
+    shares = aggregates.shares("income")
+    fig = create_breakdown_figure(shares, aggregates.dimensions["income"], "income")
+
+    assert [trace.type for trace in fig.data] == ["bar"] * len(LIKERT_LABELS)
+    for i, trace in enumerate(fig.data):
+        np.testing.assert_allclose(trace.x, shares[:, i], atol=1e-4)
+
+
+def test_many_categories_are_one_compact_heatmap():
+    aggregates = LikertAggregates.from_responses(responses(5_000, STATES))
+    shares, states = aggregates.shares("state"), aggregates.dimensions["state"]
+
+    compact = create_breakdown_figure(shares, states, "state")
+    bars = create_breakdown_figure(shares, states, "state", compact=False)
+    assert [trace.type for trace in compact.data] == ["heatmap"]
+    assert list(compact.data[0].y) == list(states)
+    # The states are sent once rather than once per label, without bar text
+    assert not compact.data[0].texttemplate
+    assert trace_json_size(compact) < 0.7 * trace_json_size(bars)
+
+
+def test_categories_without_responses_are_dropped():
+    shares = np.array([[0.5, 0.5, 0, 0, 0], [np.nan] * 5, [0, 0, 0, 0, 1]])
+    fig = create_breakdown_figure(shares, ["a", "b", "c"], "age")
+    assert list(fig.data[0].y) == ["a", "c"]
+
+
+def test_figures_are_built_once_per_key():
+    figure_cache.clear()
+    built = []
+
+    def build():
+        built.append(1)
+        return create_overall_figure(np.full(5, 0.2))
+
+    first = get_cached_figure(("run", "age"), build)
+    assert get_cached_figure(("run", "age"), build) is first
+    assert len(built) == 1
+
+    for i in range(MAX_CACHED_FIGURES):
+        get_cached_figure(("other run", i), lambda: go.Figure())
+    assert ("run", "age") not in figure_cache
+    assert len(figure_cache) == MAX_CACHED_FIGURES
@@ -0,0 +1,41 @@
+import os
+
+
+anthropic_client = None
+
+
+def get_anthropic_api_key():
+    # As for OpenAI, st.secrets is only read when the environment has no key
+    if os.getenv("ANTHROPIC_API_KEY"):
+        return os.getenv("ANTHROPIC_API_KEY")
+    import streamlit as st
+
+    return st.secrets["ANTHROPIC_API_KEY"]
+
+
+def get_anthropic_client():
+    """Creates the client on first use; ANTHROPIC_BASE_URL can point it at a mock"""
+    global anthropic_client
+    if anthropic_client is None:
+        import anthropic
+
+        anthropic_client = anthropic.Anthropic(api_key=get_anthropic_api_key())
+    return anthropic_client
+
+
+anthropic_client_async = None
+
+
+def get_anthropic_async_client():
+    """Like get_anthropic_client, for concurrent calls
+
+    Retries are handled by utils.retry_utils, so the SDK's own retries are off.
+    """
+    global anthropic_client_async
+    if anthropic_client_async is None:
+        import anthropic
+
+        anthropic_client_async = anthropic.AsyncAnthropic(
+            api_key=get_anthropic_api_key(), max_retries=0
+        )
+    return anthropic_client_async
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from config import ANTHROPIC_MODEL, MODEL_MAP, SURVEY_BACKEND_POOLS
+from utils.retry_utils import call_with_retries, get_circuit_breaker, set_attempt_start
+
+
+CHARS_PER_TOKEN = 4  # rough prompt size for token-per-minute accounting
+SCHEDULER_POLL_INTERVAL = 0.05  # in seconds, while every backend is saturated
+
+
+class RateLimiter:
+    """Requests- and tokens-per-minute token buckets for one backend"""
+
+    def __init__(self, rpm=None, tpm=None, max_concurrency=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.requests_available = rpm
+        self.tokens_available = tpm
+        self.in_flight = 0
+        self.last_refill = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self.last_refill) / 60
+        self.last_refill = now
+        if self.rpm:
+            self.requests_available = min(
+                self.rpm, self.requests_available + elapsed_minutes * self.rpm
+            )
+        if self.tpm:
+            self.tokens_available = min(
+                self.tpm, self.tokens_available + elapsed_minutes * self.tpm
+            )
+
+    def headroom(self, tokens):
+        """Fraction of the tightest limit still free after this request, or -1"""
+        self.refill()
+        fractions = [1.0]
+        if self.rpm:
+            fractions.append((self.requests_available - 1) / self.rpm)
+        if self.tpm:
+            fractions.append((self.tokens_available - tokens) / self.tpm)
+        if self.max_concurrency:
+            fractions.append(
+                (self.max_concurrency - self.in_flight - 1) / self.max_concurrency
+            )
+        headroom = min(fractions)
+        return headroom if headroom >= 0 else -1
+
+    def acquire(self, tokens):
+        if self.rpm:
+            self.requests_available -= 1
+        if self.tpm:
+            self.tokens_available -= tokens
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+
+    async def wait(self, tokens):
+        """Acquires capacity for a request once it fits within the limits"""
+        while self.headroom(tokens) < 0:
+            await asyncio.sleep(SCHEDULER_POLL_INTERVAL)
+        self.acquire(tokens)
+
+
+class Backend(ABC):
+    """A model on one account that survey prompts can be sent to"""
+
+    def __init__(self, name, weight=1.0, rpm=None, tpm=None, max_concurrency=None):
+        self.name = name
+        self.weight = weight
+        self.limiter = RateLimiter(rpm, tpm, max_concurrency)
+
+    @abstractmethod
+    async def complete(self, prompt, temperature, max_tokens):
+        """The model's answer to the prompt; errors are raised"""
+
+
+def completion_text(response):
+    """The text of a chat completion, which has no content when the model
+    refuses or the answer is cut off by a filter"""
+    choice = response.choices[0]
+    if choice.message.content is None:
+        raise ValueError(f"No content in the response (finish reason {choice.finish_reason})")
+    return choice.message.content.strip()
+
+
+class OpenAIBackend(Backend):
+    """A chat model on an OpenAI account
+
+    The SDK is imported when the backend is created, as it is slow to import
+    and a pool rarely needs both SDKs.
+    """
+
+    def __init__(self, name, model_type, api_key=None, base_url=None, **limits):
+        super().__init__(name, **limits)
+        self.model = MODEL_MAP[model_type]
+        from openai import AsyncOpenAI
+
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    async def complete(self, prompt, temperature, max_tokens):
+        response = await call_with_retries(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                temperature=temperature,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                n=1,
+            ),
+            self.name,
+        )
+        return completion_text(response)
+
+
+class AnthropicBackend(Backend):
+    """A Claude model on an Anthropic account
+
+    Like OpenAIBackend, the SDK is only imported when the backend is created.
+    """
+
+    def __init__(self, name, model=ANTHROPIC_MODEL, api_key=None, **limits):
+        super().__init__(name, **limits)
+        self.model = model
+        from anthropic import AsyncAnthropic
+
+        self.client = AsyncAnthropic(api_key=api_key, max_retries=0)
+
+    async def complete(self, prompt, temperature, max_tokens):
+        message = await call_with_retries(
+            lambda: self.client.messages.create(
+                model=self.model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}],
+            ),
+            self.name,
+        )
+        return message.content[0].text.strip()
+
+
+BACKEND_TYPES = {
+    "openai": OpenAIBackend,
+    "anthropic": AnthropicBackend,
+}
+
+
+def build_backend(spec):
+    """Creates a backend from a config dict such as those in SURVEY_BACKEND_POOLS
+
+    API keys are read from the environment variable named by "api_key_env"
+    so that keys never live in config.py.
+    """
+    spec = dict(spec)
+    provider = spec.pop("provider")
+    api_key_env = spec.pop("api_key_env", None)
+    if api_key_env:
+        spec["api_key"] = os.getenv(api_key_env)
+    return BACKEND_TYPES[provider](**spec)
+
+
+class BackendPool:
+    """Sends each request to the backend with the most weighted headroom
+
+    Backends that are rate limited, over their configured limits or paused by
+    their circuit breaker are skipped until they have room again. A pool can
+    be shared by runs in several threads, each with its own event loop, so
+    the limits are only checked and updated under a lock.
+    """
+
+    def __init__(self, backends):
+        if not backends:
+            raise ValueError("A backend pool needs at least one backend.")
+        self.backends = backends
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_specs(cls, specs):
+        return cls([build_backend(spec) for spec in specs])
+
+    def pick(self, tokens):
+        best, best_score = None, -1
+        for backend in self.backends:
+            if get_circuit_breaker(backend.name).is_open:
+                continue
+            headroom = backend.limiter.headroom(tokens)
+            if headroom < 0:
+                continue
+            # Dividing by the in-flight count shares load by weight even when
+            # no limits are configured; jitter breaks ties
+            score = (
+                backend.weight
+                * (headroom + 1e-3)
+                / (1 + backend.limiter.in_flight)
+                * random.uniform(0.9, 1.0)
+            )
+            if score > best_score:
+                best, best_score = backend, score
+        return best
+
+    def try_acquire(self, tokens):
+        with self.lock:
+            backend = self.pick(tokens)
+            if backend is not None:
+                backend.limiter.acquire(tokens)
+            return backend
+
+    async def acquire(self, tokens):
+        while (backend := self.try_acquire(tokens)) is None:
+            await asyncio.sleep(SCHEDULER_POLL_INTERVAL)
+        return backend
+
+    def release(self, backend):
+        with self.lock:
+            backend.limiter.release()
+
+    async def complete(self, prompt, temperature, max_tokens):
+        """Returns (response, backend name); errors come back as 'Error: ...'"""
+        if not prompt:
+            return "Error: Empty prompt", None
+        tokens = len(prompt) // CHARS_PER_TOKEN + max_tokens
+        set_attempt_start(None)  # waiting for headroom isn't latency
+        backend = await self.acquire(tokens)
+        try:
+            return await backend.complete(prompt, temperature, max_tokens), backend.name
+        except Exception as e:
+            print(f"Error during API call for backend {backend.name}:", e)
+            return f"Error: {str(e)}", backend.name
+        finally:
+            self.release(backend)
+
+
+@lru_cache(maxsize=None)
+def get_backend_pool(model_type):
+    """The pool configured for a model in SURVEY_BACKEND_POOLS, or None
+
+    Pools are built once per process so that every run, and every session of
+    the app, shares their rate limits rather than each assuming it has the
+    accounts to itself.
+    """
+    specs = SURVEY_BACKEND_POOLS.get(model_type)
+    return BackendPool.from_specs(specs) if specs else None
@@ -1,13 +1,50 @@
 import os
 
 
-def gather_code():
-    code = ""
-    for file in os.listdir():
-        if file.endswith(".py"):
-            print(f"Processing file: {file}")  # Debugging line
-            with open(file, "r") as f:
-                code += f"# File: {file}\n\n"
-                code += f.read()
-                code += "\n\n"
+SKIPPED_DIRECTORIES = {"__pycache__", "node_modules", "venv"}
+
+code_bundle_cache = {}  # root -> (fingerprint, code)
+
+
+def list_code_files(root="."):
+    """Python files under root, in subpackages too, in a stable order"""
+    files = []
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories[:] = sorted(
+            d
+            for d in subdirectories
+            if not d.startswith(".") and d not in SKIPPED_DIRECTORIES
+        )
+        files.extend(
+            os.path.join(directory, f) for f in sorted(filenames) if f.endswith(".py")
+        )
+    return files
+
+
+def get_code_fingerprint(files):
+    fingerprint = []
+    for file in files:
+        stat = os.stat(file)
+        fingerprint.append((file, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def gather_code(root="."):
+    """All Python source under root in one string
+
+    The bundle is rebuilt only when a file is added, removed or modified;
+    otherwise checking costs one stat per file.
+    """
+    files = list_code_files(root)
+    fingerprint = get_code_fingerprint(files)
+    cached = code_bundle_cache.get(root)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    parts = []
+    for file in files:
+        with open(file, "r") as f:
+            parts.append(f"# File: {os.path.relpath(file, root)}\n\n{f.read()}\n\n")
+    code = "".join(parts)
+    code_bundle_cache[root] = (fingerprint, code)
     return code
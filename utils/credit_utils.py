@@ -2,8 +2,6 @@ import re
 
 import pandas as pd
 import streamlit as st
-from supabase import create_client, Client
-import stripe
 
 from config import (
     NEW_USER_FREE_CREDITS,
@@ -13,38 +11,56 @@ from config import (
 )
 
 
-supabase = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_SERVICE_ROLE_SECRET"])
-stripe.api_key = st.secrets['stripe_api_key_test']  # TODO: Remove test mode as necessary
+supabase_client = None
+
+
+def get_supabase_client():
+    """Creates the client on first use, so that importing this module is cheap
+    and doesn't need secrets"""
+    global supabase_client
+    if supabase_client is None:
+        from supabase import create_client
+
+        supabase_client = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_SERVICE_ROLE_SECRET"])
+    return supabase_client
+
+
+def get_stripe():
+    import stripe
+
+    if stripe.api_key is None:
+        stripe.api_key = st.secrets['stripe_api_key_test']  # TODO: Remove test mode as necessary
+    return stripe
 
 
 def get_or_create_stripe_customer(email):
-    customers = stripe.Customer.list(email=email).data
+    customers = get_stripe().Customer.list(email=email).data
     if customers:
         return customers[0]
     else:
-        customer = stripe.Customer.create(email=email)
+        customer = get_stripe().Customer.create(email=email)
         add_extra_credits(email, NEW_USER_FREE_CREDITS)
         st.success("Welcome! You've earned 1000 free credits just by logging in!") 
         return customer
 
 
 def get_total_user_credits_spent(email):
-    response = supabase.table('credit_usage_history').select('*').eq('email', email).execute()
+    response = get_supabase_client().table('credit_usage_history').select('*').eq('email', email).execute()
     if response.data:
         return pd.DataFrame(response.data)
 
 
 def update_credit_usage_history(email, credits_used):
-    supabase.table('credit_usage_history').insert({'email': email, 'credits_used': credits_used}).execute()
+    get_supabase_client().table('credit_usage_history').insert({'email': email, 'credits_used': credits_used}).execute()
 
 
 def add_extra_credits(email, extra_credits):
-    supabase.table('extra_credits').insert({'email': email, 'credits': extra_credits}).execute()
+    get_supabase_client().table('extra_credits').insert({'email': email, 'credits': extra_credits}).execute()
     st.toast(f"Congrats! You just got {extra_credits} credits")
 
 
 def get_extra_credits(email):
-    response = supabase.table('extra_credits').select('*').eq('email', email).execute()
+    response = get_supabase_client().table('extra_credits').select('*').eq('email', email).execute()
     if response.data:
         return pd.DataFrame(response.data)
 
@@ -55,7 +71,7 @@ def extract_leading_integer(product_name):
 
 
 def get_credits_purchased_ever(customer):
-    session_list = stripe.checkout.Session.list(customer=customer)
+    session_list = get_stripe().checkout.Session.list(customer=customer)
     data = []
     
     for session in session_list.auto_paging_iter():
@@ -141,7 +157,7 @@ def get_stripe_checkout_url(customer, number_of_credits, total_cost_in_usd):
         total_cost_in_usd (float): the amount in USD that the user will pay for the 
           total credits package
     """
-    session = stripe.checkout.Session.create(
+    session = get_stripe().checkout.Session.create(
         payment_method_types=['card'],
         line_items=[{
             'price_data': {
@@ -8,6 +8,8 @@ import re
 import streamlit as st
 import pandas as pd
 
+from utils.export_utils import EXPORT_FORMATS, export_table
+
 
 def download_button(
     object_to_download, download_filename, button_text, pickle_it=False
@@ -91,6 +93,32 @@ def download_button(
     return dl_link
 
 
+def export_buttons(df, file_stem, button_text, metadata=None, key=None):
+    """
+    Shows one st.download_button per format in EXPORT_FORMATS.
+    Unlike download_button, nothing is encoded into the page: each file is
+    written chunk by chunk by export_table only when its button is clicked,
+    and clicking doesn't rerun the app. df can also be a function returning
+    the DataFrame, to defer building it as well.
+    Streamlit then reads the finished file into its in-memory media storage
+    to serve it, as download_button can't stream, so one copy of the
+    compressed file is held in memory per click. Survey sizes keep that to
+    tens of MB; larger exports should use python -m hivesight survey --out.
+    """
+    columns = st.columns(len(EXPORT_FORMATS))
+    for column, (format, export_format) in zip(columns, EXPORT_FORMATS.items()):
+        column.download_button(
+            f"{button_text} ({format})",
+            data=lambda format=format: export_table(
+                df() if callable(df) else df, format, metadata
+            ),
+            file_name=f"{file_stem}.{export_format.extension}",
+            mime=export_format.mime,
+            key=f"{key or file_stem}_{format}",
+            on_click="ignore",
+        )
+
+
 def file_selector(folder_path="."):
     filenames = os.listdir(folder_path)
     selected_filename = st.selectbox("Select a file", filenames)
@@ -0,0 +1,104 @@
+"""Export of result tables as gzip'd CSV or Parquet
+
+Files are only generated when a download is requested. Rows are written in
+chunks of EXPORT_CHUNK_ROWS into a spooled temporary file, so a large table
+is never converted to one big string, and run metadata (model, statement,
+sampling seed, cost) travels with the file:
+
+- CSV: "# key: value" lines (values JSON encoded) before the header
+- Parquet: a JSON document under the "hivesight" schema metadata key
+
+read_export reads either format back as (DataFrame, metadata).
+"""
+import gzip
+import json
+import tempfile
+from typing import Any, BinaryIO, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+EXPORT_CHUNK_ROWS = 100_000
+SPOOL_MAX_SIZE = 32 * 2**20  # bytes kept in memory before spilling to disk
+METADATA_KEY = b"hivesight"
+CSV_METADATA_PREFIX = "# "
+GZIP_LEVEL = 6  # most of the size reduction of 9, at a fraction of the time
+
+
+def iter_csv_chunks(
+    df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS
+) -> Iterator[bytes]:
+    """The CSV encoding of df, header first, chunk_rows rows at a time"""
+    yield df.iloc[:0].to_csv(index=False).encode()
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start : start + chunk_rows]
+        yield chunk.to_csv(index=False, header=False).encode()
+
+
+def write_csv_gz(
+    df: pd.DataFrame, file: BinaryIO, metadata: Optional[Dict[str, Any]] = None
+) -> None:
+    with gzip.GzipFile(fileobj=file, mode="wb", compresslevel=GZIP_LEVEL) as gz:
+        for key, value in (metadata or {}).items():
+            gz.write(f"{CSV_METADATA_PREFIX}{key}: {json.dumps(value, default=str)}\n".encode())
+        for chunk in iter_csv_chunks(df, EXPORT_CHUNK_ROWS):
+            gz.write(chunk)
+
+
+def write_parquet(
+    df: pd.DataFrame, file: BinaryIO, metadata: Optional[Dict[str, Any]] = None
+) -> None:
+    # The schema comes from the whole table, so that a chunk in which an
+    # object column is all missing doesn't change its type
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    schema = schema.with_metadata(
+        {**(schema.metadata or {}), METADATA_KEY: json.dumps(metadata or {}, default=str)}
+    )
+    with pq.ParquetWriter(file, schema) as writer:
+        for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+            chunk = df.iloc[start : start + EXPORT_CHUNK_ROWS]
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            )
+
+
+class ExportFormat(NamedTuple):
+    write: Callable[[pd.DataFrame, BinaryIO, Optional[Dict[str, Any]]], None]
+    extension: str
+    mime: str
+
+
+EXPORT_FORMATS = {
+    "CSV": ExportFormat(write_csv_gz, "csv.gz", "application/gzip"),
+    "Parquet": ExportFormat(write_parquet, "parquet", "application/vnd.apache.parquet"),
+}
+
+
+def export_table(
+    df: pd.DataFrame, format: str, metadata: Optional[Dict[str, Any]] = None
+) -> BinaryIO:
+    """df written in one of EXPORT_FORMATS, as a file rewound to the start"""
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    EXPORT_FORMATS[format].write(df, file, metadata)
+    file.seek(0)
+    return file
+
+
+def read_export(path: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Reads a file written by export_table back as (DataFrame, metadata)"""
+    if path.endswith(".parquet"):
+        table = pq.read_table(path)
+        metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b"{}"))
+        return table.to_pandas(), metadata
+
+    with gzip.open(path, "rt") as f:
+        metadata, lines = {}, 0
+        for line in f:
+            if not line.startswith(CSV_METADATA_PREFIX):
+                break
+            key, value = line[len(CSV_METADATA_PREFIX) :].split(": ", 1)
+            metadata[key] = json.loads(value)
+            lines += 1
+    return pd.read_csv(path, skiprows=lines), metadata
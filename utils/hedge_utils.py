@@ -0,0 +1,197 @@
+import asyncio
+import bisect
+import logging
+import math
+import time
+
+import numpy as np
+
+from utils.retry_utils import AttemptClock, current_attempt_clock
+
+
+logger = logging.getLogger(__name__)
+
+MIN_LATENCY_SAMPLES = 20  # completed calls needed before hedging starts
+HEDGE_POLL_INTERVAL = 0.05  # in seconds, while the latency estimate warms up
+
+
+class RunningClock(AttemptClock):
+    """An AttemptClock that is in its tracker's set of running attempts
+    while an attempt is in flight"""
+
+    def __init__(self, running):
+        self.running = running
+        super().__init__()
+
+    @property
+    def start(self):
+        return self._start
+
+    @start.setter
+    def start(self, start):
+        self._start = start
+        if self.running is None:
+            return
+        if start is None:
+            self.running.discard(self)
+        else:
+            self.running.add(self)
+
+    def stop(self):
+        """Leaves the running set for good, e.g. once the call is cancelled"""
+        self.start = None
+        self.running = None
+
+
+class LatencyTracker:
+    """Online latency percentile for the calls of the current batch
+
+    Attempts still in flight count as censored observations, lasting at
+    least as long as they have run so far, and the percentile is their
+    Kaplan-Meier estimate. Otherwise the calls that finish first, which are
+    the fastest, would set the threshold early in a batch or during a spike.
+    It is None until enough calls have finished for the percentile to be
+    known, and recomputed at most every HEDGE_POLL_INTERVAL while attempts
+    are in flight.
+    """
+
+    def __init__(self, percentile, min_samples=MIN_LATENCY_SAMPLES):
+        if not 0 < percentile < 100:
+            raise ValueError("percentile must be between 0 and 100")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies = []
+        self.running = set()
+        self.cached_threshold = None
+        self.cached_at = -math.inf
+
+    def clock(self):
+        """A clock for the attempts of one call, counted while they run"""
+        return RunningClock(self.running)
+
+    def record(self, latency):
+        bisect.insort(self.latencies, latency)
+
+    def finish(self, clock):
+        self.record(clock.elapsed())
+        clock.stop()
+
+    def threshold(self):
+        n = len(self.latencies)
+        if n < self.min_samples:
+            return None
+        if not self.running:
+            return self.latencies[min(n - 1, math.ceil(self.percentile / 100 * n) - 1)]
+        now = time.monotonic()
+        if now - self.cached_at >= HEDGE_POLL_INTERVAL:
+            self.cached_threshold = self.censored_threshold(now)
+            self.cached_at = now
+        return self.cached_threshold
+
+    def censored_threshold(self, now):
+        latencies = np.asarray(self.latencies)
+        elapsed = np.sort([now - clock.start for clock in self.running])
+        # Calls at risk at each completion: those that finished no sooner and
+        # those that have been in flight at least as long
+        at_risk = (len(latencies) - np.arange(len(latencies))) + (
+            len(elapsed) - np.searchsorted(elapsed, latencies)
+        )
+        survival = np.cumprod(1 - 1 / at_risk)
+        reached = np.flatnonzero(survival <= 1 - self.percentile / 100 + 1e-12)
+        return float(latencies[reached[0]]) if len(reached) else None
+
+
+class HedgeBudget:
+    """Caps duplicate requests at a fraction of the batch size"""
+
+    def __init__(self, batch_size, max_extra_fraction):
+        self.remaining = int(batch_size * max_extra_fraction)
+        self.spent = 0
+
+    def try_spend(self):
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        self.spent += 1
+        return True
+
+
+def is_error(result):
+    if isinstance(result, tuple):  # (response, backend name) from a pool
+        result = result[0]
+    return isinstance(result, str) and result.startswith("Error")
+
+
+async def cancel(task):
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+
+
+async def hedged_call(make_call, tracker, budget):
+    """Runs make_call(), sending one duplicate if it outlives the percentile
+
+    make_call is a zero-argument callable returning a fresh coroutine. The
+    first non-error result wins and the other request is cancelled.
+
+    Latency is that of the attempt in flight: call_with_retries stops the
+    clock while it backs off or waits out a paused model, so a rate-limited
+    backend doesn't trigger hedges that would only add to its load.
+    """
+    clock = tracker.clock()
+    # The primary's task gets its own copy of the context, holding this clock
+    token = current_attempt_clock.set(clock)
+    try:
+        primary = asyncio.ensure_future(make_call())
+    finally:
+        current_attempt_clock.reset(token)
+    try:
+        return await race(primary, make_call, clock, tracker, budget)
+    finally:
+        clock.stop()
+
+
+async def race(primary, make_call, clock, tracker, budget):
+    """hedged_call once the primary is running, which stops its clock
+    however this ends"""
+    while True:
+        threshold = tracker.threshold()
+        if threshold is None or clock.start is None:
+            timeout = HEDGE_POLL_INTERVAL
+        else:
+            timeout = max(0.0, threshold - clock.elapsed())
+        done, _ = await asyncio.wait({primary}, timeout=timeout)
+        if done:
+            tracker.finish(clock)
+            return primary.result()
+        threshold = tracker.threshold()
+        if threshold is not None and clock.start is not None and clock.elapsed() >= threshold:
+            break
+
+    if not budget.try_spend():
+        result = await primary
+        tracker.finish(clock)
+        return result
+
+    backup = asyncio.ensure_future(make_call())
+    pending = {primary, backup}
+    result = None
+    while pending:
+        done, pending = await asyncio.wait(
+            pending, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            result = task.result()
+            if not is_error(result):
+                break
+        if not is_error(result):
+            break
+
+    for task in pending:
+        await cancel(task)
+    # A lower bound when the primary was cancelled, which keeps the estimate
+    # from drifting down as hedges cut off the tail
+    tracker.finish(clock)
+    return result
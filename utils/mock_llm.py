@@ -0,0 +1,298 @@
+"""Deterministic stand-in for the OpenAI and Anthropic APIs
+
+MockLLM decides, from a seed and the prompt alone, how long each call takes
+and whether it succeeds, is rate limited (429 with Retry-After), fails with
+a transient 5xx or returns a malformed answer. It can be used in process
+through MockBackend, or over HTTP with serve() so that the unmodified SDK
+clients can be pointed at it with OPENAI_BASE_URL / ANTHROPIC_BASE_URL.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import numpy as np
+import openai
+
+from utils.backend_utils import Backend
+from utils.retry_utils import call_with_retries
+
+
+DEFAULT_PORT = 8765
+EMBEDDING_DIMENSIONS = 64
+
+MALFORMED_RESPONSES = ["", "I'd say 4", "Agree", "7", "N/A"]
+# Longer answers, so that open-ended themes have something to group
+MOCK_OPINIONS = [
+    "It would cost taxpayers too much for too little benefit.",
+    "Better public services help working families like mine.",
+    "The government should stay out of this and leave it to the market.",
+    "It matters for the environment and for our children.",
+    "I am not sure, it depends on how it is implemented.",
+    "Local communities know best what they need.",
+]
+
+
+class MockLLM:
+    def __init__(
+        self,
+        seed=0,
+        latency_median=0.3,  # in seconds
+        latency_sigma=0.5,  # of the lognormal latency distribution
+        rate_limit_rate=0.0,
+        retry_after=1.0,  # in seconds
+        server_error_rate=0.0,
+        malformed_rate=0.0,
+        null_content_rate=0.0,  # answers with no content, like a refusal
+    ):
+        self.seed = seed
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.server_error_rate = server_error_rate
+        self.malformed_rate = malformed_rate
+        self.null_content_rate = null_content_rate
+        self.attempts = {}  # per prompt, so that retries see a fresh outcome
+        self.lock = threading.Lock()
+
+    def next_rng(self, prompt):
+        with self.lock:
+            attempt = self.attempts.get(prompt, 0)
+            self.attempts[prompt] = attempt + 1
+        digest = hashlib.sha256(f"{self.seed}:{attempt}:{prompt}".encode()).digest()
+        return random.Random(digest)
+
+    def sample(self, prompt, max_tokens=1):
+        """Returns (status code, headers, text, latency) for one call"""
+        rng = self.next_rng(prompt)
+        latency = self.latency_median * rng.lognormvariate(0, self.latency_sigma)
+
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            return 429, {"retry-after": f"{self.retry_after:g}"}, "Rate limit exceeded", latency
+        roll -= self.rate_limit_rate
+        if roll < self.server_error_rate:
+            return rng.choice([500, 502, 503]), {}, "Server error", latency
+        roll -= self.server_error_rate
+        if roll < self.malformed_rate:
+            return 200, {}, rng.choice(MALFORMED_RESPONSES), latency
+        roll -= self.malformed_rate
+        if roll < self.null_content_rate:
+            return 200, {}, None, latency
+
+        # The answer depends only on the prompt, never on the attempt
+        answer_rng = random.Random(hashlib.sha256(f"{self.seed}:{prompt}".encode()).digest())
+        if max_tokens <= 5:
+            text = str(answer_rng.randint(1, 5))
+        else:
+            text = (
+                f"{answer_rng.choice(MOCK_OPINIONS)}\n"
+                f"Confidence: {answer_rng.randint(1, 10)}"
+            )
+        return 200, {}, text, latency
+
+    def embed(self, text, dimensions=EMBEDDING_DIMENSIONS):
+        """A unit vector summing a fixed random vector per word, so that texts
+        sharing words are close"""
+        vector = np.zeros(dimensions)
+        for word in re.findall(r"\w+", text.lower()):
+            seed = int.from_bytes(hashlib.sha256(f"{self.seed}:{word}".encode()).digest()[:8], "little")
+            vector += np.random.default_rng(seed).standard_normal(dimensions)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+
+def make_status_error(status, headers, message, error_module=openai):
+    request = httpx.Request("POST", "http://mock-llm.local")
+    response = httpx.Response(status, headers=headers, request=request)
+    if status == 429:
+        error_class = error_module.RateLimitError
+    else:
+        error_class = error_module.InternalServerError
+    return error_class(message, response=response, body=None)
+
+
+class MockBackend(Backend):
+    """In-process backend raising the same SDK errors the real clients raise"""
+
+    def __init__(self, name="mock", llm=None, **limits):
+        super().__init__(name, **limits)
+        self.llm = llm or MockLLM()
+
+    async def complete(self, prompt, temperature, max_tokens):
+        async def attempt():
+            status, headers, text, latency = self.llm.sample(prompt, max_tokens)
+            await asyncio.sleep(latency)
+            if status != 200:
+                raise make_status_error(status, headers, text)
+            if text is None:
+                raise ValueError("No content in the response (finish reason content_filter)")
+            return text
+
+        return (await call_with_retries(attempt, self.name)).strip()
+
+
+def openai_body(text, model):
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop" if text is not None else "content_filter",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 1, "total_tokens": 1},
+    }
+
+
+def mock_tool_input(schema, text, rng):
+    """An input for a tool that matches its JSON schema, with text in every string"""
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            name: mock_tool_input(property_schema, text, rng)
+            for name, property_schema in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        n_items = rng.randint(schema.get("minItems", 1), schema.get("maxItems", 3))
+        return [mock_tool_input(schema.get("items", {}), text, rng) for _ in range(n_items)]
+    if kind == "integer":
+        return rng.randint(schema.get("minimum", 0), schema.get("maximum", 10))
+    if kind == "number":
+        return rng.uniform(schema.get("minimum", 0), schema.get("maximum", 1))
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return text
+
+
+def anthropic_body(text, model, tool=None):
+    """A text answer, or with a forced tool a call to it built from the text"""
+    if tool is None:
+        content, stop_reason = [{"type": "text", "text": text}], "end_turn"
+    else:
+        rng = random.Random(hashlib.sha256(text.encode()).digest())
+        content = [
+            {
+                "type": "tool_use",
+                "id": "toolu_mock",
+                "name": tool["name"],
+                "input": mock_tool_input(tool.get("input_schema", {}), text, rng),
+            }
+        ]
+        stop_reason = "tool_use"
+    return {
+        "id": "msg_mock",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {"input_tokens": 0, "output_tokens": 1},
+    }
+
+
+def embeddings_body(llm, inputs, model):
+    return {
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": llm.embed(text)}
+            for i, text in enumerate(inputs)
+        ],
+        "model": model,
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+def make_handler(llm):
+    class MockLLMHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("content-length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/").endswith("/embeddings"):
+                inputs = request.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                status, headers, _, latency = llm.sample(json.dumps(inputs))
+                time.sleep(latency)
+                if status == 200:
+                    body = embeddings_body(llm, inputs, request.get("model"))
+                else:
+                    body = {"error": {"type": "mock_error", "message": "Mock error"}}
+                return self.send_json(status, headers, body)
+
+            messages = request.get("messages", [])
+            prompt = json.dumps(messages[-1]["content"]) if messages else ""
+            status, headers, text, latency = llm.sample(
+                prompt, request.get("max_tokens") or 1
+            )
+            time.sleep(latency)
+
+            if status != 200:
+                body = {"error": {"type": "mock_error", "message": text}}
+            elif self.path.rstrip("/").endswith("/chat/completions"):
+                body = openai_body(text, request.get("model"))
+            elif self.path.rstrip("/").endswith("/messages"):
+                tool_choice = request.get("tool_choice") or {}
+                tool = next(
+                    (
+                        tool
+                        for tool in request.get("tools", [])
+                        if tool_choice.get("type") == "tool"
+                        and tool["name"] == tool_choice.get("name")
+                    ),
+                    None,
+                )
+                # Messages have no null content; the nearest is an empty text
+                body = anthropic_body(text or "", request.get("model"), tool)
+            else:
+                status, body = 404, {"error": {"message": f"Unknown path {self.path}"}}
+
+            self.send_json(status, headers, body)
+
+        def send_json(self, status, headers, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(payload)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockLLMHandler
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # survey batches open hundreds of connections at once
+
+
+def serve(llm=None, host="127.0.0.1", port=DEFAULT_PORT, in_thread=False):
+    """Serves the chat completions and messages endpoints until interrupted
+
+    With in_thread=True the server runs in a daemon thread and is returned,
+    so callers can shut it down when they are finished.
+    """
+    server = MockLLMServer((host, port), make_handler(llm or MockLLM()))
+    if in_thread:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
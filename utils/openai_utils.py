@@ -1,33 +1,61 @@
 import os
-import random
 import asyncio
+import contextlib
+from functools import lru_cache
 
-from openai import AsyncOpenAI
-import streamlit as st
+import numpy as np
 import tiktoken
 
-from config import MODEL_MAP
+from config import EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL, MODEL_MAP
+from utils.backend_utils import completion_text
+from utils.hedge_utils import HedgeBudget, LatencyTracker, hedged_call
+from utils.retry_utils import call_with_retries, set_attempt_start
 
 
-openai_api_key = os.getenv("OPENAI_API_KEY", st.secrets["OPENAI_API_KEY"])
-openai_client_async = AsyncOpenAI()
+openai_client_async = None
 
-# Configuration for rate limiting and retries
-MAX_RETRIES = 5
-INITIAL_RETRY_DELAY = 1  # in seconds
-MAX_RETRY_DELAY = 60  # in seconds
+
+def get_openai_api_key():
+    # Only fall back on st.secrets when the environment has no key, so that
+    # scripts and the mock backend work outside of Streamlit, without
+    # importing it
+    if os.getenv("OPENAI_API_KEY"):
+        return os.getenv("OPENAI_API_KEY")
+    import streamlit as st
+
+    return st.secrets["OPENAI_API_KEY"]
+
+
+def get_openai_client():
+    """Creates the client on first use; OPENAI_BASE_URL can point it at a mock"""
+    global openai_client_async
+    if openai_client_async is None:
+        # Imported here so that pages which only estimate costs don't load the SDK
+        from openai import AsyncOpenAI
+
+        # Retries are handled by utils.retry_utils, so the SDK's own retries are off
+        openai_client_async = AsyncOpenAI(api_key=get_openai_api_key(), max_retries=0)
+    return openai_client_async
+
+
+TOKENS_PER_MESSAGE = 3  # tokens used by the {role}\n{content}\n structure
+REPLY_PRIMING_TOKENS = 3  # every reply is primed with <|start|>assistant<|message|>
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_type):
+    # NOTE: loading this encoding results in a brief delay, once per model.
+    return tiktoken.encoding_for_model(MODEL_MAP[model_type])
+
+
+def message_overhead_tokens(n_messages):
+    return TOKENS_PER_MESSAGE * n_messages + REPLY_PRIMING_TOKENS
 
 
 def estimate_input_tokens(messages, model_type):
-    # NOTE: loading this encoding results in a brief delay.
-    encoding = tiktoken.encoding_for_model(MODEL_MAP[model_type])
-    tokens_per_message = 3
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message  # tokens used by the {role}\n{content}\n structure.
-        num_tokens += len(encoding.encode(message))
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+    encoding = get_encoding(model_type)
+    content_tokens = sum(len(t) for t in encoding.encode_ordinary_batch(list(messages)))
+    return content_tokens + message_overhead_tokens(len(messages))
 
 
 async def query_openai_async(
@@ -40,37 +68,23 @@ async def query_openai_async(
         print("Error: Empty prompt provided")
         return "Error: Empty prompt"
 
-    retries = 0
-    while retries < MAX_RETRIES:
-        try:
-            messages = [{"role": "user", "content": prompt}]
-            response = await openai_client_async.chat.completions.create(
+    messages = [{"role": "user", "content": prompt}]
+    client = get_openai_client()
+    try:
+        response = await call_with_retries(
+            lambda: client.chat.completions.create(
                 model=MODEL_MAP[model_type],
                 temperature=temperature,
                 messages=messages,
                 max_tokens=max_tokens or 500,
                 n=1,
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            retries += 1
-            if retries == MAX_RETRIES:
-                print(f"Error during API call for model {model_type}:", e)
-                return f"Error: {str(e)}"
-
-            if "rate_limit_exceeded" in str(e):
-                retry_delay = min(
-                    INITIAL_RETRY_DELAY * (2 ** (retries - 1))
-                    + random.uniform(0, 1),
-                    MAX_RETRY_DELAY,
-                )
-                print(
-                    f"Rate limit exceeded. Retrying in {retry_delay:.2f} seconds..."
-                )
-                await asyncio.sleep(retry_delay)
-            else:
-                print(f"Unexpected error. Retrying in 1 second...")
-                await asyncio.sleep(1)
+            ),
+            model_type,
+        )
+        return completion_text(response)
+    except Exception as e:
+        print(f"Error during API call for model {model_type}:", e)
+        return f"Error: {str(e)}"
 
 
 async def query_openai_batch(
@@ -78,20 +92,135 @@ async def query_openai_batch(
     model_type,
     temperature=1.0,
     max_tokens=None,
+    hedge_percentile=None,
+    max_hedge_fraction=0.05,
+    max_concurrency=None,
 ):
+    """Queries every prompt concurrently, at most max_concurrency at a time
+
+    With hedge_percentile set, a call still running past that latency
+    percentile of the batch so far gets one duplicate request, up to
+    max_hedge_fraction * len(prompts) duplicates in total.
+    """
+    limit = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+
+    async def query(prompt):
+        set_attempt_start(None)  # a call waiting for its turn isn't hedged
+        async with limit:
+            return await query_openai_async(prompt, model_type, temperature, max_tokens)
+
+    if hedge_percentile is None:
+        return await asyncio.gather(*[query(prompt) for prompt in prompts])
+
+    tracker = LatencyTracker(hedge_percentile)
+    budget = HedgeBudget(len(prompts), max_hedge_fraction)
     tasks = [
-        query_openai_async(
-            prompt,
+        hedged_call(lambda prompt=prompt: query(prompt), tracker, budget)
+        for prompt in prompts
+    ]
+    responses = await asyncio.gather(*tasks)
+    if budget.spent:
+        print(f"Sent {budget.spent} hedged requests for {len(prompts)} prompts")
+    return responses
+
+
+def run_batch_query(
+    prompts,
+    model_type,
+    temperature=1.0,
+    max_tokens=None,
+    hedge_percentile=None,
+    max_hedge_fraction=0.05,
+    max_concurrency=None,
+):
+    return asyncio.run(
+        query_openai_batch(
+            prompts,
             model_type,
             temperature,
             max_tokens,
+            hedge_percentile,
+            max_hedge_fraction,
+            max_concurrency,
         )
-        for prompt in prompts
-    ]
-    return await asyncio.gather(*tasks)
+    )
+
+
+async def query_backend_pool_batch(
+    prompts,
+    pool,
+    temperature=1.0,
+    max_tokens=None,
+    hedge_percentile=None,
+    max_hedge_fraction=0.05,
+):
+    """Like query_openai_batch, but spread over a BackendPool
+
+    Returns (responses, backend names) so each answer can be attributed to
+    the backend that produced it.
+    """
+    max_tokens = max_tokens or 500
+    if hedge_percentile is None:
+        tasks = [pool.complete(prompt, temperature, max_tokens) for prompt in prompts]
+    else:
+        tracker = LatencyTracker(hedge_percentile)
+        budget = HedgeBudget(len(prompts), max_hedge_fraction)
+        tasks = [
+            hedged_call(
+                lambda prompt=prompt: pool.complete(prompt, temperature, max_tokens),
+                tracker,
+                budget,
+            )
+            for prompt in prompts
+        ]
+    results = await asyncio.gather(*tasks)
+    responses = [response for response, _ in results]
+    backends = [backend for _, backend in results]
+    return responses, backends
 
 
-def run_batch_query(prompts, model_type, temperature=1.0, max_tokens=None):
+def run_pooled_batch_query(
+    prompts,
+    pool,
+    temperature=1.0,
+    max_tokens=None,
+    hedge_percentile=None,
+    max_hedge_fraction=0.05,
+):
     return asyncio.run(
-        query_openai_batch(prompts, model_type, temperature, max_tokens)
+        query_backend_pool_batch(
+            prompts,
+            pool,
+            temperature,
+            max_tokens,
+            hedge_percentile,
+            max_hedge_fraction,
+        )
     )
+
+
+async def embed_texts_async(texts, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE):
+    """Embeddings of texts as a (len(texts), dimensions) array
+
+    Texts are sent batch_size per request, with the requests made
+    concurrently; an error in any batch is raised.
+    """
+    client = get_openai_client()
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+    responses = await asyncio.gather(
+        *(
+            call_with_retries(
+                lambda batch=batch: client.embeddings.create(model=model, input=batch),
+                model,
+            )
+            for batch in batches
+        )
+    )
+    return np.array(
+        [item.embedding for response in responses for item in response.data],
+        dtype=np.float32,
+    )
+
+
+def run_embedding_query(texts, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE):
+    return asyncio.run(embed_texts_async(list(texts), model, batch_size))
@@ -0,0 +1,342 @@
+import asyncio
+import contextvars
+import importlib
+import logging
+import random
+import re
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 5
+INITIAL_RETRY_DELAY = 1  # in seconds
+MAX_RETRY_DELAY = 60  # in seconds
+BREAKER_FAILURE_THRESHOLD = 5  # consecutive retryable failures before pausing
+BREAKER_COOLDOWN = 10  # in seconds
+BREAKER_RESUME_JITTER = 1  # spread out waiters when a paused model resumes
+MAX_STORED_METRICS = 100_000
+
+# Error classes
+RATE_LIMITED = "rate_limited"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+# Exception classes by name, looked up in each SDK in SDK_MODULES that is
+# installed. The SDKs are slow to import, so they are only imported when the
+# first error is classified.
+SDK_MODULES = ("openai", "anthropic")
+RATE_LIMIT_ERRORS = ("RateLimitError",)
+TRANSIENT_ERRORS = (
+    "APIConnectionError",  # includes APITimeoutError
+    "InternalServerError",
+    "ConflictError",
+)
+FATAL_ERRORS = (
+    "AuthenticationError",
+    "PermissionDeniedError",
+    "BadRequestError",  # includes context length errors
+    "NotFoundError",
+    "UnprocessableEntityError",
+)
+NON_RETRYABLE_RATE_LIMIT_CODES = {"insufficient_quota"}
+
+RATE_LIMIT_RESET_HEADERS = [
+    "x-ratelimit-reset-requests",
+    "x-ratelimit-reset-tokens",
+    "anthropic-ratelimit-requests-reset",
+    "anthropic-ratelimit-tokens-reset",
+]
+
+AttemptMetric = namedtuple(
+    "AttemptMetric",
+    [
+        "model",
+        "attempt",
+        "outcome",  # "success" or one of the error classes
+        "error_type",
+        "latency",
+        "retry_delay",
+        "timestamp",
+    ],
+)
+attempt_metrics = deque(maxlen=MAX_STORED_METRICS)
+
+
+@lru_cache(maxsize=None)
+def sdk_error_types(names):
+    types = []
+    for sdk in SDK_MODULES:
+        try:
+            module = importlib.import_module(sdk)
+        except ImportError:
+            continue
+        types.extend(getattr(module, name) for name in names)
+    return tuple(types)
+
+
+def classify_error(error):
+    if isinstance(error, sdk_error_types(RATE_LIMIT_ERRORS)):
+        if getattr(error, "code", None) in NON_RETRYABLE_RATE_LIMIT_CODES:
+            return FATAL
+        return RATE_LIMITED
+    if isinstance(error, (asyncio.TimeoutError,) + sdk_error_types(TRANSIENT_ERRORS)):
+        return TRANSIENT
+    if isinstance(error, sdk_error_types(FATAL_ERRORS)):
+        return FATAL
+
+    # Fall back on the HTTP status for errors from other clients (or new SDK classes)
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return RATE_LIMITED
+    if status_code is not None and (status_code in (408, 409) or status_code >= 500):
+        return TRANSIENT
+    return FATAL
+
+
+def parse_duration(value):
+    """Parses '20ms', '1.5s', '6m0s' or a bare number of seconds into seconds"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if not parts:
+        return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def parse_timestamp_delay(value):
+    """Seconds from now until an HTTP date or RFC 3339 timestamp"""
+    try:
+        reset_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return max(0.0, reset_at.timestamp() - time.time())
+
+
+def get_retry_after(error):
+    """Server-suggested wait in seconds (capped), or None if there is no hint"""
+    delay = _get_retry_after(error)
+    return None if delay is None else min(delay, MAX_RETRY_DELAY)
+
+
+def _get_retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        value = headers["retry-after"]
+        delay = parse_duration(value)
+        if delay is None:
+            delay = parse_timestamp_delay(value)
+        if delay is not None:
+            return delay
+
+    delays = []
+    for header in RATE_LIMIT_RESET_HEADERS:
+        value = headers.get(header)
+        if not value:
+            continue
+        delay = parse_duration(value)
+        if delay is None:
+            delay = parse_timestamp_delay(value)
+        if delay is not None:
+            delays.append(delay)
+    # The reset headers describe each limit separately; the soonest is the
+    # earliest point at which a retry can succeed
+    return min(delays) if delays else None
+
+
+def get_backoff_delay(attempt):
+    return min(
+        INITIAL_RETRY_DELAY * (2 ** (attempt - 1)) + random.uniform(0, 1),
+        MAX_RETRY_DELAY,
+    )
+
+
+class CircuitBreaker:
+    """Pauses every request to one model while it is rate limited or failing
+
+    A 429 with a Retry-After hint pauses the model for that long, and a run of
+    consecutive retryable failures pauses it for a cooldown. Waiting callers
+    all sleep on the same deadline instead of backing off independently.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        cooldown=BREAKER_COOLDOWN,
+        resume_jitter=BREAKER_RESUME_JITTER,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.resume_jitter = resume_jitter
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    @property
+    def is_open(self):
+        return time.monotonic() < self.open_until
+
+    def pause(self, seconds):
+        self.open_until = max(self.open_until, time.monotonic() + seconds)
+
+    def record_success(self):
+        self.consecutive_failures = 0
+
+    def record_failure(self, error_class, retry_after=None):
+        if error_class == FATAL:
+            return
+        if error_class == RATE_LIMITED and retry_after:
+            self.pause(retry_after)
+
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            logger.warning(
+                f"{self.consecutive_failures} consecutive failures, "
+                f"pausing for {self.cooldown} seconds"
+            )
+            self.pause(self.cooldown)
+            self.consecutive_failures = 0
+
+    async def wait(self):
+        waited = False
+        while (remaining := self.open_until - time.monotonic()) > 0:
+            waited = True
+            await asyncio.sleep(remaining)
+        if waited and self.resume_jitter:
+            await asyncio.sleep(random.uniform(0, self.resume_jitter))
+
+
+class AttemptClock:
+    """When the attempt in flight started, or None while the call is waiting
+    (for a retry, a paused model or rate-limit headroom) rather than running"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+
+    def elapsed(self):
+        return 0.0 if self.start is None else time.monotonic() - self.start
+
+
+# Set by callers that time attempts rather than whole calls, e.g. hedging
+current_attempt_clock = contextvars.ContextVar("current_attempt_clock", default=None)
+
+
+def set_attempt_start(start):
+    clock = current_attempt_clock.get()
+    if clock is not None:
+        clock.start = start
+
+
+circuit_breakers = {}
+
+
+def get_circuit_breaker(model):
+    if model not in circuit_breakers:
+        circuit_breakers[model] = CircuitBreaker()
+    return circuit_breakers[model]
+
+
+def record_attempt(model, attempt, outcome, error_type, latency, retry_delay):
+    metric = AttemptMetric(
+        model, attempt, outcome, error_type, latency, retry_delay, time.time()
+    )
+    attempt_metrics.append(metric)
+    return metric
+
+
+def get_attempt_metrics(model=None):
+    return [m for m in attempt_metrics if model is None or m.model == model]
+
+
+def reset_attempt_metrics():
+    attempt_metrics.clear()
+
+
+def summarize_attempt_metrics(metrics=None):
+    metrics = get_attempt_metrics() if metrics is None else metrics
+    summary = {
+        "attempts": len(metrics),
+        "outcomes": {},
+        "error_types": {},
+        "mean_latency": 0.0,
+        "total_retry_delay": 0.0,
+    }
+    if not metrics:
+        return summary
+    for metric in metrics:
+        summary["outcomes"][metric.outcome] = (
+            summary["outcomes"].get(metric.outcome, 0) + 1
+        )
+        if metric.error_type:
+            summary["error_types"][metric.error_type] = (
+                summary["error_types"].get(metric.error_type, 0) + 1
+            )
+        summary["total_retry_delay"] += metric.retry_delay or 0.0
+    summary["mean_latency"] = sum(m.latency for m in metrics) / len(metrics)
+    return summary
+
+
+async def call_with_retries(make_request, model, max_retries=MAX_RETRIES):
+    """Awaits make_request() until it succeeds, retrying only retryable errors
+
+    make_request is a zero-argument callable returning a fresh awaitable for
+    every attempt. The last error is re-raised once retries are exhausted or
+    as soon as a non-retryable error is seen.
+    """
+    breaker = get_circuit_breaker(model)
+    attempt = 0
+    while True:
+        attempt += 1
+        set_attempt_start(None)
+        await breaker.wait()
+        start = time.monotonic()
+        set_attempt_start(start)
+        try:
+            result = await make_request()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            latency = time.monotonic() - start
+            error_class = classify_error(e)
+            retry_after = get_retry_after(e) if error_class == RATE_LIMITED else None
+            breaker.record_failure(error_class, retry_after)
+
+            give_up = error_class == FATAL or attempt >= max_retries
+            retry_delay = 0.0 if give_up else (retry_after or get_backoff_delay(attempt))
+            record_attempt(
+                model, attempt, error_class, type(e).__name__, latency, retry_delay
+            )
+            if give_up:
+                raise
+
+            logger.info(
+                f"{type(e).__name__} for {model} ({error_class}), "
+                f"retrying in {retry_delay:.2f} seconds..."
+            )
+            set_attempt_start(None)
+            await asyncio.sleep(retry_delay)
+        else:
+            breaker.record_success()
+            record_attempt(
+                model, attempt, "success", None, time.monotonic() - start, 0.0
+            )
+            return result